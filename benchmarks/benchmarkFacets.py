@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import datetime
+import tempfile
+import subprocess
+
+from dataCiteStandIn import startStandIn
+
+relations = ['Collects', 'IsCollectedBy', 'IsCitedBy', 'Cites', 'IsSupplementTo', 'IsSupplementedBy', 'IsContinuedBy', 'Continues',
+             'IsNewVersionOf', 'IsPreviousVersionOf', 'IsPartOf', 'HasPart', 'IsPublishedIn', 'IsReferencedBy',
+             'References', 'IsDocumentedBy', 'Documents', 'IsCompiledBy', 'Compiles', 'IsVariantFormOf',
+             'IsOriginalFormOf', 'IsIdenticalTo', 'HasMetadata', 'IsMetadataFor', 'Reviews', 'IsReviewedBy',
+             'IsDerivedFrom', 'IsSourceOf', 'Describes', 'IsDescribedBy', 'HasVersion', 'IsVersionOf', 'Requires',
+             'IsRequiredBy', 'Obsoletes', 'IsObsoletedBy']
+
+#
+# Representative workloads: the command line arguments for retrieveDataCiteFacets. The combined
+# workload is 36 relations x 3 resource types x the years since 2015 (1,000+ URLs).
+#
+workloads = {
+    'resources': ['--resources'],
+    'years':     ['--years'],
+    'combined':  ['-il'] + relations + ['Dataset', 'Software', 'Text', '--years', '-minYear', '2015', '--combineQueries']
+}
+
+outputFlags = ['--csvout', '--dbout', '--htmlout']
+writers = ['CSV', 'SQLite', 'HTML', 'JSON', 'facetdata']    # run report stages of the output writers
+
+
+def runWorkload(name:str,                               # workload name
+                server,                                 # stand-in server (startStandIn)
+                workers:int,                            # --workers for the run
+                extraArguments:list                     # additional retrieveDataCiteFacets arguments
+                )-> dict:
+    '''
+        Run retrieveDataCiteFacets for one workload against the stand-in server and measure it.
+        Outputs, journals and the database are written to a temporary directory and the stage
+        times are read from the run report (--runReport).
+    '''
+    with tempfile.TemporaryDirectory() as workDirectory:
+        logFile = os.path.join(workDirectory, 'benchmark.log')
+        reportFile = os.path.join(workDirectory, 'runReport.json')
+        env = dict(os.environ, HOME=workDirectory,
+                   DATACITE_STATISTICS_DATABASE=os.path.join(workDirectory, 'benchmark.db'))
+        command = [sys.executable, script] + workloads[name] + outputFlags + \
+                  ['--apiURL', f'http://127.0.0.1:{server.server_port}/dois', '--workers', str(workers),
+                   '--rateLimit', '100000', '--no-cache', '--backoff', '0.01', '--logto', logFile,
+                   '--runReport', reportFile] + extraArguments
+
+        requestsBefore = server.requestCount
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workDirectory, env=env)
+        pid, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        requestCount = server.requestCount - requestsBefore
+
+        if process.returncode != 0:
+            with open(logFile, encoding='utf-8') as f:
+                lggr.warning(f'{name} failed with exit code {process.returncode}\n{f.read()[-2000:]}')
+            report = {}
+        else:
+            with open(reportFile, encoding='utf-8') as f:
+                report = json.load(f)
+
+    stages = report.get('stages', {})
+    return {'workload': name,
+            'URLs': report.get('URLs'),
+            'requests': requestCount,
+            'seconds': round(elapsed, 3),
+            'requestsPerSecond': round(requestCount / elapsed, 1),
+            'peakRSS_MB': round(rusage.ru_maxrss / 1024, 1),          # ru_maxrss is in KB on Linux
+            'httpLatencySeconds': report.get('httpLatencySeconds', {}),
+            'writerSeconds': {k: round(stages[k]['seconds'], 3) for k in writers if k in stages},
+            'stageSeconds': {k: round(v['seconds'], 3) for k, v in stages.items()},
+            'exitCode': process.returncode}
+
+
+lggr = logging.getLogger('benchmarkFacets')
+script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'retrieveDataCiteFacets.py')
+
+if __name__ == '__main__':
+    commandLine = argparse.ArgumentParser(prog='benchmarkFacets',
+                            description='''Time the retrieveDataCiteFacets pipeline for representative workloads against a
+                                        local DataCite stand-in serving recorded responses. Reports requests/sec,
+                                        end-to-end time, peak RSS and the time spent in each output writer.'''
+    )
+    commandLine.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'),
+                            help='Directory with recorded json responses (e.g. ~/data/DataCite/metadata from --jout)'
+    )
+    commandLine.add_argument('--workloads', nargs='*', choices=list(workloads), default=list(workloads),
+                            help='Workloads to run (default = all)'
+    )
+    commandLine.add_argument('--workers', type=int, default=8,
+                            help='Concurrent retrievals (--workers) for each run (default = 8)'
+    )
+    commandLine.add_argument('--latency', type=float, default=20,
+                            help='Stand-in latency in ms (default = 20)'
+    )
+    commandLine.add_argument('--jitter', type=float, default=10,
+                            help='Stand-in random additional latency in ms (default = 10)'
+    )
+    commandLine.add_argument('--errorRate', type=float, default=0,
+                            help='Fraction of stand-in responses that are 429/503 errors (default = 0)'
+    )
+    commandLine.add_argument('--repeat', type=int, default=1,
+                            help='Number of runs of each workload (default = 1)'
+    )
+    commandLine.add_argument('--output', metavar='FILE',
+                            help='Write the results to a json file (e.g. to compare with a later benchmark)'
+    )
+    commandLine.add_argument('extraArguments', nargs=argparse.REMAINDER,
+                            help='Additional retrieveDataCiteFacets arguments after --, e.g. -- -fl clients'
+    )
+    args = commandLine.parse_args()
+    extraArguments = [a for a in args.extraArguments if a != '--']
+
+    logging.basicConfig(
+        format='%(asctime)s:%(levelname)s:%(name)s: %(message)s',
+        level='INFO',
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+    server = startStandIn(args.fixtures, latency=args.latency, jitter=args.jitter, errorRate=args.errorRate)
+
+    results = []
+    for name in args.workloads:
+        for i in range(args.repeat):
+            result = runWorkload(name, server, args.workers, extraArguments)
+            lggr.info(json.dumps(result))
+            results.append(result)
+
+    server.shutdown()
+
+    print(f"\n{'workload':<12}{'URLs':>7}{'requests':>10}{'seconds':>10}{'req/s':>9}{'RSS MB':>9}  writers (s)")
+    for r in results:
+        writerTimes = ' '.join(f'{k}: {v:.3f}' for k, v in r['writerSeconds'].items())
+        print(f"{r['workload']:<12}{str(r['URLs']):>7}{r['requests']:>10}{r['seconds']:>10.2f}{r['requestsPerSecond']:>9.1f}{r['peakRSS_MB']:>9.1f}  {writerTimes}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'workers': args.workers, 'latency': args.latency, 'jitter': args.jitter,
+                       'errorRate': args.errorRate, 'results': results}, f, indent=2)
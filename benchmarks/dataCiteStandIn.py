@@ -0,0 +1,232 @@
+import json
+import os
+import gzip
+import sys
+import time
+import random
+import zlib
+import functools
+import argparse
+import logging
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+responseParameters = ['page[size]', 'facets', 'fields[dois]', 'disable-facets']     # parameters that select the parts of a response
+
+
+def fixtureKey(s:str)-> str:
+    '''
+        Normalize a fixture name or query so that the --jout file name for a parameter tuple
+        (e.g. Cites_Dataset_2020 or Aalto_University) matches the query (e.g. *Aalto*University*)
+    '''
+    return ''.join(c for c in s.lower() if c.isalnum())
+
+
+def queryKey(query:str)-> str:
+    '''
+        Create the fixture key for a /dois query string from the values of the query parameters
+        (resource-type-id=Dataset, registered=2020, query=relatedIdentifiers.relationType:Cites, ...)
+    '''
+    values = []
+    for name, value in urllib.parse.parse_qsl(query):
+        if name in responseParameters:
+            continue
+        values.append(value.split(':', 1)[-1] if name == 'query' else value)
+    return fixtureKey(''.join(values))
+
+
+@functools.lru_cache(maxsize=1024)
+def trimResponse(body:bytes,                            # recorded response
+                 pageSize:str,                          # page[size] of the query (None = recorded records)
+                 facets:str,                            # facets of the query (None = all facets)
+                 fields:str,                            # fields[dois] of the query (None = all attributes)
+                 disableFacets:bool = False             # disable-facets=true (no facets)
+                 )-> bytes:
+    '''
+        The part of a recorded response selected by page[size]=0, facets=..., fields[dois]=... and
+        disable-facets=true like the DataCite API, so trimmed requests are measured with their smaller responses
+    '''
+    if pageSize != '0' and facets is None and fields is None and not disableFacets:
+        return body
+    response = json.loads(body)
+    if pageSize == '0':
+        response['data'] = []
+    if fields is not None:
+        keep = fields.split(',')
+        for record in response.get('data', []):
+            record['attributes'] = {k: v for k, v in record.get('attributes', {}).items() if k in keep}
+    if facets is not None or disableFacets:
+        keep = ['total', 'totalPages', 'page'] + ([] if disableFacets or facets is None else facets.split(','))
+        response['meta'] = {k: v for k, v in response.get('meta', {}).items() if k in keep}
+    return json.dumps(response, ensure_ascii=False).encode('utf-8')
+
+
+def loadFixtures(fixtureDirectory:str)-> dict:
+    '''
+        Read recorded DataCite responses from a directory tree: json files named by their parameters
+        and the compressed run archives written by --jout (DataCite_RUNID.jsonl.gz).
+        Returns a dictionary of fixture key: response body
+    '''
+    fixtures = {}
+    for root, dirs, files in os.walk(fixtureDirectory):
+        for name in sorted(files):
+            if name.endswith('.json'):
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    body = json.dumps(json.load(f), ensure_ascii=False).encode('utf-8')
+                fixtures[fixtureKey(name[:-len('.json')])] = body
+            elif name.endswith('.jsonl.gz'):
+                with gzip.open(os.path.join(root, name), 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        body = json.dumps(entry['response'], ensure_ascii=False).encode('utf-8')
+                        fixtures[fixtureKey(''.join(entry['parameters']))] = body
+    return fixtures
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+        Serve recorded responses for /dois queries. Queries without a recorded response get a
+        fixture selected by a hash of the query values, so any number of distinct URLs can be served.
+        page[size]=0, facets=..., fields[dois]=... and disable-facets=true select parts of the response (trimResponse).
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requestCount += 1
+
+        if server.latency > 0 or server.jitter > 0:
+            time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+
+        if server.errorRate > 0 and random.random() < server.errorRate:
+            self.sendError(random.choice(server.errorCodes))
+            return
+
+        query = urllib.parse.urlsplit(self.path).query
+        key = queryKey(query)
+        body = server.fixtures.get(key)
+        if body is None:
+            with server.lock:
+                server.missCount += 1
+            body = server.fixtureList[zlib.crc32(key.encode('utf-8')) % len(server.fixtureList)]
+        selection = dict(urllib.parse.parse_qsl(query))
+        body = trimResponse(body, selection.get('page[size]'), selection.get('facets'), selection.get('fields[dois]'),
+                            selection.get('disable-facets') == 'true')
+
+        etag = f'"{zlib.crc32(body):08x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.api+json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.bytesSent += len(body)
+
+    def sendError(self, status:int):
+        with self.server.lock:
+            self.server.errorCount += 1
+        self.send_response(status)
+        if status == 429 or status >= 500:
+            self.send_header('Retry-After', str(self.server.retryAfter))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        lggr.debug(format % args)
+
+
+def startStandIn(fixtureDirectory:str,                  # recorded responses (--jout output)
+                 port:int = 0,                          # port (0 = any free port)
+                 latency:float = 0,                     # added latency in ms
+                 jitter:float = 0,                      # random additional latency in ms
+                 errorRate:float = 0,                   # fraction of requests answered with an error
+                 errorCodes:tuple = (429, 503),         # status codes for injected errors
+                 retryAfter:float = 0                   # Retry-After seconds for injected errors
+                 )-> ThreadingHTTPServer:
+    '''
+        Start the stand-in server in a background thread. The API URL is
+        http://127.0.0.1:{server.server_port}/dois
+    '''
+    fixtures = loadFixtures(fixtureDirectory)
+    if len(fixtures) == 0:
+        raise ValueError(f'No json fixtures in {fixtureDirectory}')
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    server.daemon_threads = True
+    server.fixtures = fixtures
+    server.fixtureList = [fixtures[k] for k in sorted(fixtures)]
+    server.latency = latency
+    server.jitter = jitter
+    server.errorRate = errorRate
+    server.errorCodes = errorCodes
+    server.retryAfter = retryAfter
+    server.requestCount = 0
+    server.errorCount = 0
+    server.missCount = 0                                # queries without a recorded response
+    server.bytesSent = 0
+    server.lock = threading.Lock()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    lggr.info(f'DataCite stand-in with {len(fixtures)} fixtures at http://127.0.0.1:{server.server_port}/dois')
+    return server
+
+
+lggr = logging.getLogger('dataCiteStandIn')
+
+if __name__ == '__main__':
+    commandLine = argparse.ArgumentParser(prog='dataCiteStandIn',
+                            description='''Local stand-in for the DataCite /dois API that serves recorded responses
+                                        (archives written by retrieveDataCiteFacets --jout) with adjustable latency
+                                        and error injection.'''
+    )
+    commandLine.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'),
+                            help='Directory with recorded json responses (e.g. ~/data/DataCite/metadata)'
+    )
+    commandLine.add_argument('--port', type=int, default=8000,
+                            help='Port (default = 8000)'
+    )
+    commandLine.add_argument('--latency', type=float, default=0,
+                            help='Latency added to every response in ms (default = 0)'
+    )
+    commandLine.add_argument('--jitter', type=float, default=0,
+                            help='Random additional latency in ms (default = 0)'
+    )
+    commandLine.add_argument('--errorRate', type=float, default=0,
+                            help='Fraction of requests answered with an error (default = 0)'
+    )
+    commandLine.add_argument('--errorCodes', type=int, nargs='*', default=[429, 503],
+                            help='Status codes used for injected errors (default = 429 503)'
+    )
+    commandLine.add_argument('--retryAfter', type=float, default=0,
+                            help='Retry-After seconds sent with injected 429/5xx errors (default = 0)'
+    )
+    commandLine.add_argument('--loglevel', default='info',
+                            choices=['debug', 'info', 'warning'],
+                            help='Logging level'
+    )
+    args = commandLine.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s:%(levelname)s:%(name)s: %(message)s',
+        level=args.loglevel.upper(),
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+    server = startStandIn(args.fixtures, args.port, args.latency, args.jitter,
+                          args.errorRate, args.errorCodes, args.retryAfter)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
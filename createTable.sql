@@ -1,130 +1,74 @@
-CREATE TABLE "relationsAndResources" ( "parameter" TEXT,
-"DateTime" TEXT,
-"NumberOfRecords" INTEGER,
-"states_number" INTEGER,
-"states_max" INTEGER,
-"states_common" TEXT,
-"states_total" INTEGER,
-"states_HI" INTEGER,
-"states" TEXT,
-"resourceTypes_number" INTEGER,
-"resourceTypes_max" INTEGER,
-"resourceTypes_common" TEXT,
-"resourceTypes_total" INTEGER,
-"resourceTypes_HI" INTEGER,
-"resourceTypes" TEXT,
-"created_number" INTEGER,
-"created_max" INTEGER,
-"created_common" INTEGER,
-"created_total" INTEGER,
-"created_HI" REAL,
-"created" TEXT,
-"published_number" INTEGER,
-"published_max" INTEGER,
-"published_common" INTEGER,
-"published_total" INTEGER,
-"published_HI" REAL,
-"published" TEXT,
-"registered_number" INTEGER,
-"registered_max" INTEGER,
-"registered_common" INTEGER,
-"registered_total" INTEGER,
-"registered_HI" REAL,
-"registered" TEXT,
-"providers_number" INTEGER,
-"providers_max" INTEGER,
-"providers_common" TEXT,
-"providers_total" INTEGER,
-"providers_HI" REAL,
-"providers" TEXT,
-"clients_number" INTEGER,
-"clients_max" INTEGER,
-"clients_common" TEXT,
-"clients_total" INTEGER,
-"clients_HI" REAL,
-"clients" TEXT,
-"affiliations_number" TEXT,
-"affiliations_max" TEXT,
-"affiliations_common" TEXT,
-"affiliations_total" TEXT,
-"affiliations_HI" TEXT,
-"affiliations" TEXT,
-"prefixes_number" INTEGER,
-"prefixes_max" INTEGER,
-"prefixes_common" REAL,
-"prefixes_total" INTEGER,
-"prefixes_HI" REAL,
-"prefixes" TEXT,
-"certificates_number" TEXT,
-"certificates_max" TEXT,
-"certificates_common" TEXT,
-"certificates_total" TEXT,
-"certificates_HI" TEXT,
-"certificates" TEXT,
-"licenses_number" INTEGER,
-"licenses_max" INTEGER,
-"licenses_common" TEXT,
-"licenses_total" INTEGER,
-"licenses_HI" REAL,
-"licenses" TEXT,
-"schemaVersions_number" INTEGER,
-"schemaVersions_max" INTEGER,
-"schemaVersions_common" INTEGER,
-"schemaVersions_total" INTEGER,
-"schemaVersions_HI" REAL,
-"schemaVersions" TEXT,
-"linkChecksStatus_number" TEXT,
-"linkChecksStatus_max" TEXT,
-"linkChecksStatus_common" TEXT,
-"linkChecksStatus_total" TEXT,
-"linkChecksStatus_HI" TEXT,
-"linkChecksStatus" TEXT,
-"subjects_number" INTEGER,
-"subjects_max" INTEGER,
-"subjects_common" TEXT,
-"subjects_total" INTEGER,
-"subjects_HI" REAL,
-"subjects" TEXT,
-"fieldsOfScience_number" TEXT,
-"fieldsOfScience_max" TEXT,
-"fieldsOfScience_common" TEXT,
-"fieldsOfScience_total" TEXT,
-"fieldsOfScience_HI" TEXT,
-"fieldsOfScience" TEXT,
-"citations_number" TEXT,
-"citations_max" TEXT,
-"citations_common" TEXT,
-"citations_total" TEXT,
-"citations_HI" TEXT,
-"citations" TEXT,
-"views_number" TEXT,
-"views_max" TEXT,
-"views_common" TEXT,
-"views_total" TEXT,
-"views_HI" TEXT,
-"views" TEXT,
-"downloads_number" TEXT,
-"downloads_max" TEXT,
-"downloads_common" TEXT,
-"downloads_total" TEXT,
-"downloads_HI" TEXT,
-"downloads" TEXT,
-"field112" TEXT ,
-states_coverage INTEGER,
-resourceTypes_coverage INTEGER,
-created_coverage INTEGER,
-published_coverage INTEGER,
-registered_coverage INTEGER,
-providers_coverage INTEGER,
-clients_coverage INTEGER,
-affiliations_coverage INTEGER,
-prefixes_coverage INTEGER,
-certificates_coverage INTEGER,
-licenses_coverage INTEGER,
-schemaVersions_coverage INTEGER,
-linkChecksStatus_coverage INTEGER,
-subjects_coverage INTEGER,
-fieldsOfScience_coverage INTEGER,
-citations_coverage INTEGER,
-views_coverage INTEGER,
-downloads_coverage INTEGER)
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    DateTime TEXT NOT NULL,
+    targets TEXT,
+    facets TEXT,
+    commandLine TEXT,
+    complete INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query_id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    parameters TEXT NOT NULL,
+    relations TEXT,
+    resources TEXT,
+    contributors TEXT,
+    affiliations TEXT,
+    years TEXT,
+    URL TEXT,
+    NumberOfRecords INTEGER NOT NULL,
+    carried_from INTEGER REFERENCES queries(query_id)
+);
+CREATE TABLE IF NOT EXISTS facet_values (
+    query_id INTEGER NOT NULL REFERENCES queries(query_id),
+    facet TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_runs (
+    run_id TEXT PRIMARY KEY,
+    DateTime TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_statistics (
+    run_id TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS trend_runs (
+    run_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS trend_series (
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    first REAL,
+    firstDate TEXT,
+    last REAL,
+    lastDate TEXT,
+    snapshots INTEGER,
+    changePoints INTEGER,
+    lastChangePoint TEXT,
+    recentDeltas TEXT,
+    PRIMARY KEY (parameters, statistic)
+);
+CREATE TABLE IF NOT EXISTS trend_deltas (
+    DateTime TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    value REAL,
+    delta REAL,
+    pctChange REAL,
+    changePoint INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS queries_run_parameters ON queries(run_id, parameters);
+CREATE INDEX IF NOT EXISTS queries_parameters ON queries(parameters);
+CREATE INDEX IF NOT EXISTS queries_resources ON queries(resources);
+CREATE INDEX IF NOT EXISTS queries_relations ON queries(relations);
+CREATE INDEX IF NOT EXISTS queries_contributors ON queries(contributors);
+CREATE INDEX IF NOT EXISTS queries_affiliations ON queries(affiliations);
+CREATE INDEX IF NOT EXISTS queries_years ON queries(years);
+CREATE INDEX IF NOT EXISTS facet_values_query_facet ON facet_values(query_id, facet);
+CREATE INDEX IF NOT EXISTS facet_values_facet_id ON facet_values(facet, id);
+CREATE INDEX IF NOT EXISTS snapshot_statistics_run ON snapshot_statistics(run_id);
+CREATE INDEX IF NOT EXISTS trend_deltas_DateTime ON trend_deltas(DateTime);
@@ -0,0 +1,15 @@
+'''
+    Retrieve and summarize DataCite facets.
+
+        from dataCiteFacets import FacetQuery, FacetRun
+
+        query = FacetQuery(['resources'], facetList=['clients', 'providers'])
+        df = FacetRun(query, workers=4).dataFrame()
+
+    requests, numpy and pandas are imported when a run retrieves its first query, so importing
+    the package (and the command line for --showtargets or --showURLs) is fast.
+'''
+from .targets import parameters, facets, facetStatisticNames
+from .run import FacetQuery, FacetRun
+
+__all__ = ['FacetQuery', 'FacetRun', 'parameters', 'facets', 'facetStatisticNames']
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import zlib
+import functools
+import threading
+import logging
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+decoder = json.JSONDecoder()
+metaPattern = re.compile(r'"meta"\s*:\s*\{')            # the meta block of a DataCite response
+selectiveFacets = 6                                     # facets decoded one at a time by decodeFacets
+
+
+def archiveIndexFile(archiveFile:str)-> str:
+    '''
+        The index of an archive: archive.jsonl.gz -> archive.index.jsonl
+    '''
+    return archiveFile[:-len('.jsonl.gz')] + '.index.jsonl' if archiveFile.endswith('.jsonl.gz') else archiveFile + '.index.jsonl'
+
+
+def archiveFiles(path:str                               # archive file or directory with archives
+                 )-> list:                              # archive files
+    '''
+        The archive files (DataCite_RUNID.jsonl.gz) in a directory, oldest run first, or the archive file itself
+    '''
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                        if name.startswith('DataCite_') and name.endswith('.jsonl.gz'))
+    return [path]
+
+
+def archiveRun(archiveFile:str                          # archive file (DataCite_RUNID.jsonl.gz)
+               )-> tuple:                               # (runId, dateStamp)
+    '''
+        The runId and dateStamp (YYYYMMDD_HH) of an archived run from the archive file name
+    '''
+    runId = os.path.basename(archiveFile)[len('DataCite_'):-len('.jsonl.gz')]
+    if re.fullmatch('[0-9]{8}_[0-9]{6}(_[0-9]+)?', runId) is None:         # job reports are RUNID_N
+        raise ValueError(f'{archiveFile} is not a run archive (DataCite_YYYYMMDD_HHMMSS.jsonl.gz)')
+    return (runId, runId[:11])
+
+
+def responseFacets(item_json:dict,                      # decoded DataCite response
+                   facetList:list                       # facets to summarize
+                   )-> tuple:                           # (numberOfRecords, None, facet values)
+    '''
+        The number of records and the facet values (id/title/count lists) for each facet in facetList from
+        a DataCite response. Responses with no records have no facet values.
+    '''
+    numberOfRecords = item_json.get('meta').get('total')
+    if numberOfRecords == 0:
+        return (numberOfRecords, None, None)
+    return (numberOfRecords, None, {f: item_json['meta'][f] for f in facetList if f in item_json['meta']})
+
+
+@functools.lru_cache(maxsize=None)
+def keyPattern(key:str)-> re.Pattern:
+    '''
+        Pattern of a quoted key and its colon, the value starts at the end of the match
+    '''
+    return re.compile('"' + re.escape(key) + r'"\s*:\s*')
+
+
+def findMeta(text:str                                  # DataCite response (or archive line)
+             )-> re.Match:                              # match of the meta key, None if there is no meta block
+    '''
+        The last "meta": { key of a response. The meta block follows the data, so it is found by searching
+        backwards; strings like "meta" (e.g. a facet title) are skipped because a string value is never
+        followed by a colon.
+    '''
+    metaStart = len(text)
+    while True:
+        metaStart = text.rfind('"meta"', 0, metaStart)
+        if metaStart < 0:
+            return None
+        m = metaPattern.match(text, metaStart)
+        if m is not None:
+            return m
+
+
+def decodeFacets(body:bytes,                            # body of a DataCite response (or an archive line)
+                 facetList:list                         # facets to summarize
+                 )-> tuple:                             # (numberOfRecords, None, facet values)
+    '''
+        responseFacets of a response body without decoding all of it: only the total and the facets in
+        facetList are decoded from the meta block (findMeta), the record and the other facets are skipped.
+        A quoted key followed by a colon can not occur inside a JSON string (quotes in strings are escaped),
+        so the keys are found by searching for them. For more than selectiveFacets facets the meta block is
+        decoded at once, and bodies without a meta block or total are decoded completely (the response of
+        an archive line).
+    '''
+    text = body.decode('utf-8')
+    meta = findMeta(text)
+    if meta is not None and len(facetList) > selectiveFacets:
+        return responseFacets({'meta': decoder.raw_decode(text, meta.end() - 1)[0]}, facetList)
+    total = keyPattern('total').search(text, meta.end()) if meta is not None else None
+    if total is None:
+        item_json = json.loads(text)
+        return responseFacets(item_json.get('response', item_json), facetList)
+
+    numberOfRecords = decoder.raw_decode(text, total.end())[0]
+    if numberOfRecords == 0:
+        return (numberOfRecords, None, None)
+    facetValues = {}
+    for f in facetList:
+        m = keyPattern(f).search(text, meta.start())
+        if m is not None:
+            facetValues[f] = decoder.raw_decode(text, m.end())[0]
+    return (numberOfRecords, None, facetValues)
+
+
+def archiveFacets(archiveFile:str,                      # archive file
+                  locations:list,                       # (offset, length) of the responses in the archive
+                  facetList:list                        # facets to summarize
+                  )-> list:                             # (numberOfRecords, None, facet values) for each location
+    '''
+        Read responses from an archive and return their facets (decodeFacets). Used by the worker
+        processes of --from-archive, so only the facet values are returned to the run.
+    '''
+    results = []
+    with open(archiveFile, 'rb') as f:
+        for offset, length in locations:
+            f.seek(offset)
+            results.append(decodeFacets(zlib.decompress(f.read(length), 31), facetList))
+    return results
+
+
+class ResponseArchive:
+    '''
+        Append the DataCite responses of a run to one gzip compressed JSONL file (--jout). Every line is
+        {"parameters": [...], "URL": ..., "response": {...}} and is written as a separate gzip member,
+        so the archive can be read as a whole (gzip.open) and every response can be read by itself from
+        its offset. The index (archiveIndexFile) has one line with the parameters, URL, offset and length
+        of each response. A resumed run appends to the archive of its runId.
+
+        write() can be called from concurrent retrievals.
+    '''
+    def __init__(self,
+                 archiveFile:str,                       # archive file (.jsonl.gz)
+                 compressLevel:int = 6):                # zlib compression level
+        self.archiveFile = archiveFile
+        self.compressLevel = compressLevel
+        self.f = open(archiveFile, 'ab')
+        self.index = open(archiveIndexFile(archiveFile), 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def write(self,
+              URL:str,                                  # DataCite API URL
+              p:tuple,                                  # query parameters for URL
+              item_json:dict):                          # decoded DataCite response
+        line = json.dumps({'parameters': list(p), 'URL': URL, 'response': item_json}, ensure_ascii=False) + '\n'
+        compressor = zlib.compressobj(self.compressLevel, zlib.DEFLATED, 31)      # 31 = gzip member
+        member = compressor.compress(line.encode('utf-8')) + compressor.flush()
+        with self.lock:
+            offset = self.f.tell()
+            self.f.write(member)
+            self.f.flush()                              # the response is in the archive before it is indexed
+            self.index.write(json.dumps({'parameters': list(p), 'URL': URL, 'offset': offset, 'length': len(member)},
+                                        ensure_ascii=False) + '\n')
+            self.index.flush()
+
+    def close(self):
+        self.f.close()
+        self.index.close()
+
+
+class ArchiveReader:
+    '''
+        Read the responses of an archive (ResponseArchive) by parameters with random access,
+        e.g. ArchiveReader(archiveFile).response(('Dataset', '2020'))
+    '''
+    def __init__(self,
+                 archiveFile:str):                      # archive file (.jsonl.gz)
+        self.archiveFile = archiveFile
+        self.index = {}                                 # {parameters: (offset, length, URL)}, the last response of a query
+        with open(archiveIndexFile(archiveFile), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:                      # partial last line of an interrupted run
+                    continue
+                self.index[tuple(entry['parameters'])] = (entry['offset'], entry['length'], entry['URL'])
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, p:tuple):
+        return tuple(p) in self.index
+
+    def parameters(self)-> list:
+        '''
+            The parameters of every query in the archive (in the order of the index)
+        '''
+        return list(self.index)
+
+    def entry(self,
+              p:tuple                                   # query parameters
+              )-> dict:                                 # {parameters, URL, response}
+        offset, length, URL = self.index[tuple(p)]
+        with open(self.archiveFile, 'rb') as f:
+            f.seek(offset)
+            member = f.read(length)
+        return json.loads(zlib.decompress(member, 31))
+
+    def response(self,
+                 p:tuple                                # query parameters
+                 )-> dict:                              # decoded DataCite response
+        return self.entry(p)['response']
+
+    def entries(self):
+        '''
+            Generate the indexed entries ({parameters, URL, response}) in archive order
+        '''
+        with open(self.archiveFile, 'rb') as f:
+            for offset, length, URL in sorted(self.index.values()):
+                f.seek(offset)
+                yield json.loads(zlib.decompress(f.read(length), 31))
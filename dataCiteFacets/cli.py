@@ -0,0 +1,814 @@
+import os
+import sys
+import json
+import re
+import html
+import shlex
+import logging
+import argparse
+import datetime
+import collections
+
+from .targets import facets, targetParameters, facetColumns, normalizeAffiliation
+from .metrics import RunMetrics, writePrometheusTextfile
+from .journal import readJournal
+from .archive import archiveFiles, archiveRun
+from .run import FacetQuery, FacetRun
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+
+def commandLineTargets(args:argparse.Namespace          # command line arguments
+                       )-> list:
+    '''
+        The targets selected by the command line arguments
+    '''
+    targets = []
+
+    if args.getRelations:                       # the target retrievals can be controlled by command line arguments:
+        targets.append('relations')             # --affiliations --contributors --relations --resources retrieve all
+    if args.getResources:                       # items in each list, i.e. all relationTypes...
+        targets.append('resources')
+    if args.getContributorTypes:
+        targets.append('contributors')
+    if args.affiliationList:                    # read affiliations from the command line
+        targets.append('affiliations')
+    if args.getYears:
+        targets.append('years')                 # create a list of years from args.minYear to present
+
+    return targets
+
+
+def readAffiliationFile(affiliationFile:str              # text file with one affiliation per line
+                        )-> list:                       # affiliations
+    '''
+        Read the affiliations of an affiliation file. Blank lines and lines starting with # are skipped and
+        the names are normalized (normalizeAffiliation).
+    '''
+    with open(affiliationFile, encoding='utf-8') as f:
+        return [normalizeAffiliation(line) for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def commandLineAffiliations(args:argparse.Namespace     # command line arguments
+                            )-> list:
+    '''
+        The affiliations of -al and --affiliationFile without duplicates: names with the same words
+        (ignoring case and punctuation) are retrieved once, with the first spelling
+    '''
+    affiliationList = list(args.affiliationList)
+    if args.affiliationFile:
+        affiliationList += readAffiliationFile(args.affiliationFile)
+    unique = {}
+    for name in affiliationList:
+        unique.setdefault(normalizeAffiliation(name).casefold(), name)
+    if len(unique) < len(affiliationList):
+        lggr.info(f'Affiliations: {len(affiliationList) - len(unique)} duplicates removed, {len(unique)} affiliations')
+    return list(unique.values())
+
+
+def htmlHeader(args:argparse.Namespace,                 # command line arguments
+               parameters:dict                          # target parameters of the query
+               )-> str:
+    '''
+        Write command line options to html header (the names given by the user are escaped)
+    '''
+    s = ''
+
+    if args.getRelations:                       # the target retrievals can be controlled by command line arguments:
+        s += f"<b>Relations:</b> {' '.join(parameters['relations']['data'])}<br>"             # --affiliations --contributors --relations --resources retrieve all
+
+    if args.getResources:                       # items in each list, i.e. all relationTypes...
+        s += f"<b>Resources:</b> {' '.join(parameters['resources']['data'])}<br>"
+
+    if args.getContributorTypes:
+        s += f"<b>Contributor Types:</b> {' '.join(parameters['contributors']['data'])}<br>"
+
+    if args.getYears:
+        s += f"<b>Years:</b> {' '.join(parameters['years']['data'])}<br>"
+
+    if args.affiliationList:
+        s += f"<b>Affiliations:</b> {html.escape(', '.join(parameters['affiliations']['data']))}<br>"   # names from the affiliation file
+
+    if args.itemList:
+        s += f"<b>Item list:</b> {html.escape(' '.join(args.itemList))}<br>"
+
+    if args.facetList:
+        s += f"<b>Facet list:</b> {' '.join(args.facetList)}<br>"
+    else:
+        s += f"<b>Facet list:</b> {facets}<br>"
+
+    return s
+
+
+def createCommandLine()-> argparse.ArgumentParser:
+    commandLine=argparse.ArgumentParser(prog='retrieveDataCiteFacets',
+                            description='''Use DataCite API to retrieve metadata records for given relationType, resourceType,
+                                        contributorType, and affiliations from DataCite. Save the retrieved metadata into
+                                        json files (--jout) and facet data into csv or html file or database (defined in environment).'''
+    )
+    commandLine.add_argument("-al", "--affiliationList", nargs="*", type=str,
+                            help='space separated list of affiliations to retrieve (affiliations with spaces in quotes)', default=[]
+    )
+    commandLine.add_argument('--affiliationFile', dest='affiliationFile', metavar='FILE',
+                            help='''Read affiliations to retrieve from a file (one per line, # comments). The names are normalized
+                                    and duplicates are removed'''
+    )
+    commandLine.add_argument('--affiliationBatch', dest='affiliationBatch', type=int,
+                            default=0,
+                            help='''Find the affiliations with records with queries for batches of this many affiliations (combined with OR)
+                                    and only retrieve the queries of those affiliations (default = 0, one query for each affiliation)'''
+    )
+    commandLine.add_argument("-il", "--itemList", nargs="*", type=str,
+                            help='space separated list of items to retrieve', default=[]
+    )
+    commandLine.add_argument("-fl", "--facetList", nargs="*", type=str, default=[],
+                            help='''Select space separated list of facets to retrieve from: states resourceTypes created published registered providers clients
+                                    affiliations prefixes certificates licenses schemaVersions linkChecksStatus
+                                    subjects fieldsOfScience citations views downloads. Default = all'''
+    )
+    commandLine.add_argument('--contributors', dest='getContributorTypes',
+                            default=False, action='store_true',
+                            help='''Retrieve facets for all contributorTypes: ContactPerson, DataCollector, DataCurator,
+                                    DataManager, Distributor, Editor, Funder, HostingInstitution, Other, Producer, ProjectLeader,
+                                    ProjectManager, ProjectMember, RegistrationAgency, RegistrationAuthority, RelatedPerson,
+                                    ResearchGroup, RightsHolder, Researcher, Sponsor, Supervisor, WorkPackageLeader'''
+    )
+    commandLine.add_argument('--relations', dest='getRelations',
+                            default=False, action='store_true',
+                            help='''Retrieve facets for all relations: IsCitedBy, Cites, IsSupplementTo, IsSupplementedBy, IsContinuedBy, Continues,
+                                    IsNewVersionOf, IsPreviousVersionOf, IsPartOf, HasPart, IsPublishedIn, IsReferencedBy, References, IsDocumentedBy,
+                                    Documents, IsCompiledBy, Compiles, IsVariantFormOf, IsOriginalFormOf, IsIdenticalTo, HasMetadata, IsMetadataFor,
+                                    Reviews, IsReviewedBy, IsDerivedFrom, IsSourceOf, Describes, IsDescribedBy, HasVersion, IsVersionOf, Requires,
+                                    IsRequiredBy, Obsoletes, IsObsoletedBy'''
+    )
+    commandLine.add_argument('--resources', dest='getResources',
+                            default=False, action='store_true',
+                            help='''Retrieve facets for all resource types: Audiovisual, Book, BookChapter, Collection, ComputationalNotebook,
+                                    ConferencePaper, ConferenceProceeding, DataPaper, Dataset, Dissertation, Event, Image,
+                                    InteractiveResource, Journal, JournalArticle, Model, OutputManagementPlan, PeerReview,
+                                    PhysicalObject, Preprint, Report, Service, Software, Sound, Standard, Text, Workflow, Other'''
+    )
+    commandLine.add_argument('--years', dest='getYears',
+                            default=False, action='store_true',
+                            help='''Retrieve facets for all years: 2004 to present'''
+    )
+    commandLine.add_argument('-minYear', dest='minYear', type=int,
+                            default=2004,
+                            help='''Minimum year for year queries'''
+    )
+    commandLine.add_argument('--showURLs', dest='showURLs',
+                            default=False, action='store_true',
+                            help='''Show URLs that will be retrieved but DO NOT retrieve metadata'''
+    )
+    commandLine.add_argument('--showtargets', dest='showTargetData',
+                            default=False, action='store_true',
+                            help='''Show target lists (e.g. all resourceTypes, relationTypes, contributorTypes)'''
+    )
+    commandLine.add_argument('--combineQueries', dest='combineQueries',
+                            default=False, action='store_true',
+                            help='Run all query parameter combinations'
+    )
+    commandLine.add_argument('--plan', dest='plan',
+                            default=False, action='store_true',
+                            help='''With --combineQueries, retrieve the single item queries first and skip combinations that their
+                                    resourceTypes and registered facets show are empty (also with --showURLs)'''
+    )
+    commandLine.add_argument('--derive', dest='derive',
+                            default=False, action='store_true',
+                            help='''Read queries that only need resourceTypes and registered facets (e.g. -fl registered for year
+                                    queries of resource types) from the facets of broader queries instead of retrieving them'''
+    )
+    commandLine.add_argument('--incremental', dest='incremental',
+                            default=False, action='store_true',
+                            help='''Retrieve only the number of records of each query and carry the facets of queries that did
+                                    not change forward from the last run in the database (use with --dbout)'''
+    )
+    commandLine.add_argument('--csvout', dest='csvout',
+                            default=False, action='store_true',
+                            help='Output results in CSV file'
+    )
+    commandLine.add_argument('--dbout', dest='dbout',
+                            default=False, action='store_true',
+                            help='Output results in database (requires sqlite3 package)'
+    )
+    commandLine.add_argument('--parquetout', dest='parquetout',
+                            default=False, action='store_true',
+                            help='''Output summary rows and facet values to Parquet datasets partitioned by dateStamp and target
+                                    (~/data/DataCite/parquet, requires pyarrow package https://pypi.org/project/pyarrow/)'''
+    )
+    commandLine.add_argument('--facetdata', dest='facetdata',
+                            default=False, action='store_true',
+                            help='Create dataframe from facet data'
+    )
+    commandLine.add_argument('--id', dest='useIDAsTitle',
+                            default=False, action='store_true',
+                            help='Use repository ID as column name instead of repository name'
+    )
+    commandLine.add_argument('--htmlout', dest='htmlout',
+                            default=False, action='store_true',
+                            help='Output results in HTML file'
+    )
+    commandLine.add_argument('--htmlPageRows', dest='htmlPageRows', type=int,
+                            default=0,
+                            help='Split HTML tables into pages with this number of rows (default = 0, one page)'
+    )
+    commandLine.add_argument('--jout', dest='jout',
+                            default=False, action='store_true',
+                            help='Output retrieved metadata in json files'
+    )
+    commandLine.add_argument('--from-archive', dest='fromArchive', metavar='PATH',
+                            help='''Read the responses from a --jout archive (or all archives in a directory) instead of retrieving
+                                    them and write the outputs of each archived run with its dateStamp (runId for runs of the same hour)
+                                    and _reprocessed, e.g. DataCite__combined__20240101_06_reprocessed.csv.
+                                    --workers sets the number of processes'''
+    )
+    commandLine.add_argument('--replace', dest='replace',
+                            default=False, action='store_true',
+                            help='Replace runs that are already in the database or the Parquet datasets with the runs reprocessed by --from-archive'
+    )
+    commandLine.add_argument('--harvest', dest='harvest',
+                            default=False, action='store_true',
+                            help='''Retrieve all records of each query with cursor pagination into compressed JSONL files
+                                    (~/data/DataCite/harvest/RUNID/) instead of the facets. Use --resume RUNID to continue'''
+    )
+    commandLine.add_argument('--pageSize', dest='pageSize', type=int,
+                            default=1000,
+                            help='Records per page for --harvest (default = 1000, the DataCite maximum)'
+    )
+    commandLine.add_argument('--pout', dest='pout',
+                            default=False, action='store_true',
+                            help='Output facet counts to terminal (requires tabulate package https://pypi.org/project/tabulate/)'
+    )
+    commandLine.add_argument('--apiURL', dest='apiURL',
+                            default='https://api.datacite.org/dois',
+                            help='DataCite API endpoint (default = https://api.datacite.org/dois), e.g. a local stand-in for benchmarks'
+    )
+    commandLine.add_argument('--trimResponses', dest='trimResponses',
+                            default=False, action='store_true',
+                            help='''Request the smallest responses: no records (page[size]=0), only the DOI of records (fields[dois]=doi)
+                                    and only the facets in the facetList (facets=...)'''
+    )
+    commandLine.add_argument('--workers', dest='workers', type=int,
+                            default=1,
+                            help='Number of queries to retrieve concurrently (default = 1, serial)'
+    )
+    commandLine.add_argument('--batchSize', dest='batchSize', type=int,
+                            default=100,
+                            help='Number of queries summarized together by the vectorized facet statistics (default = 100)'
+    )
+    commandLine.add_argument('--rateLimit', dest='rateLimit', type=float,
+                            default=10.0,
+                            help='Maximum DataCite API requests per second (default = 10)'
+    )
+    commandLine.add_argument('--retries', dest='retries', type=int,
+                            default=5,
+                            help='Number of retries for connection errors, timeouts, 429 and 5xx responses (default = 5)'
+    )
+    commandLine.add_argument('--backoff', dest='backoff', type=float,
+                            default=1.0,
+                            help='Base delay in seconds for exponential backoff between retries (default = 1)'
+    )
+    commandLine.add_argument('--backoffMax', dest='backoffMax', type=float,
+                            default=60.0,
+                            help='Maximum delay in seconds between retries, including Retry-After (default = 60)'
+    )
+    commandLine.add_argument('--connectTimeout', dest='connectTimeout', type=float,
+                            default=10.0,
+                            help='Connection timeout in seconds (default = 10)'
+    )
+    commandLine.add_argument('--readTimeout', dest='readTimeout', type=float,
+                            default=60.0,
+                            help='Read timeout in seconds (default = 60)'
+    )
+    commandLine.add_argument('--cache-dir', dest='cacheDir', metavar='DIR',
+                            default=os.path.expanduser('~') + '/data/DataCite/cache',
+                            help='Directory for cached DataCite responses (default = ~/data/DataCite/cache)'
+    )
+    commandLine.add_argument('--no-cache', dest='noCache',
+                            default=False, action='store_true',
+                            help='Do not read or write cached responses'
+    )
+    commandLine.add_argument('--refresh', dest='refresh',
+                            default=False, action='store_true',
+                            help='Revalidate or retrieve all responses even if the cached copy is fresh'
+    )
+    commandLine.add_argument('--cacheTTL', dest='cacheTTL', type=float,
+                            default=12.0,
+                            help='Hours cached responses are used without revalidation (default = 12). Closed registration years are used for 30 days'
+    )
+    commandLine.add_argument('--cacheSize', dest='cacheSize', type=float,
+                            default=1000.0,
+                            help='Maximum size of the response cache in MB (default = 1000)'
+    )
+    commandLine.add_argument('--trends', dest='trends',
+                            default=False, action='store_true',
+                            help='''Analyze the runs in the database (growth, deltas and change points of NumberOfRecords and the
+                                    facet HI and coverage of each query) and write csv and HTML trend reports. -fl selects the facets'''
+    )
+    commandLine.add_argument('--diff', dest='diff', nargs=2, metavar=('BEFORE', 'AFTER'),
+                            help='''Compare two snapshots (runIds in the database, --csvout files or --jout archives) and write csv and HTML
+                                    reports of the facet values that were added, removed or changed. -fl selects the facets'''
+    )
+    commandLine.add_argument('--serve', dest='serve', metavar='PORT', type=int,
+                            help='''Run a local HTTP/JSON facet service on PORT: GET /facets?targets=resources&facetList=clients returns
+                                    the facet rows. Responses are kept in memory for --cacheTTL hours'''
+    )
+    commandLine.add_argument('--serveCache', dest='serveCache', type=int,
+                            default=1000,
+                            help='Number of responses kept in memory by --serve (default = 1000)'
+    )
+    commandLine.add_argument('--job', dest='job', metavar='FILE',
+                            help='''Run the reports of a json or yaml job file (each with its own retrieveDataCiteFacets arguments)
+                                    and retrieve each URL once for all reports'''
+    )
+    commandLine.add_argument('--resume', dest='resume', metavar='RUNID',
+                            help='Resume an interrupted run from its journal (~/data/DataCite/runs/RUNID.jsonl)'
+    )
+    commandLine.add_argument('--runReport', dest='runReport', metavar='FILE',
+                            help='Write a json run report with stage times, HTTP latency percentiles and retrieval statistics'
+    )
+    commandLine.add_argument('--prometheus', dest='prometheus', metavar='FILE',
+                            help='Write the run metrics to a Prometheus textfile (node_exporter textfile collector)'
+    )
+    commandLine.add_argument('--loglevel', default='info',
+                            choices=['debug', 'info', 'warning'],
+                            help='Logging level for logging module (https://docs.python.org/3/howto/logging.html#useful-handlers)'
+    )
+    commandLine.add_argument('--logto', metavar='FILE',
+                        help='Log file (will append to file if exists)'
+    )
+    return commandLine
+
+
+def writeTrends(args:argparse.Namespace,                # command line arguments
+                dateStamp:str):                         # datestamp of the reports
+    '''
+        Add the trend statistics of new runs to the database and write the trend summary (csv and HTML)
+        and the deltas of every snapshot (csv)
+    '''
+    if 'DATACITE_STATISTICS_DATABASE' not in os.environ:
+        lggr.warning('--trends requires the database defined by DATACITE_STATISTICS_DATABASE')
+        return
+
+    from .sinks import connectToDataCiteDatabase
+    from .trends import importLegacySnapshots, updateSnapshotStatistics, updateTrends, trendSnapshots, trendSummary, writeTrendDeltas
+    from .htmlOutput import writeHTMLOutput
+
+    con, cur = connectToDataCiteDatabase()
+    legacySnapshots = importLegacySnapshots(con)
+    newRuns = updateSnapshotStatistics(con)
+    newSnapshots = updateTrends(con)
+    snapshots, firstDate, lastDate = trendSnapshots(con)
+    if snapshots == 0:
+        lggr.warning('Trends: no runs in the database')
+        con.close()
+        return
+    summary = trendSummary(con, args.facetList)
+    lggr.info(f'Trends: {snapshots} snapshots ({newRuns} new runs, {legacySnapshots} legacy snapshots, '
+              f'{newSnapshots} snapshots added), {len(summary)} series')
+
+    outputFile = 'DataCite_trends__' + dateStamp + '.csv'
+    lggr.info(f'trend summary output to {outputFile}')
+    summary.to_csv(outputFile, encoding='utf-8', sep=',', index=False)
+    outputFile = 'DataCite_trendDeltas__' + dateStamp + '.csv'
+    lggr.info(f'trend deltas output to {outputFile}')
+    writeTrendDeltas(con, outputFile, args.facetList)
+    con.close()
+
+    htmlOutputFile = 'DataCite_trends__' + dateStamp + '.html'
+    lggr.info(f'trend summary output to {htmlOutputFile}')
+    firstDate, lastDate = (datetime.datetime.strptime(d, '%Y%m%d_%H') for d in (firstDate, lastDate))
+    header = f"<b>Trends:</b> {snapshots} snapshots from {firstDate:%Y-%m-%d %H:00} to {lastDate:%Y-%m-%d %H:00}<br>"
+    writeHTMLOutput(htmlOutputFile, summary, False, header, dateStamp, args.htmlPageRows)
+
+
+def writeDiff(args:argparse.Namespace,                  # command line arguments
+              dateStamp:str):                           # datestamp of the reports
+    '''
+        Compare two snapshots (--diff BEFORE AFTER) and write the changes of their facet values (csv and HTML),
+        largest changes first
+    '''
+    import pandas as pd
+    from .diff import snapshotQueries, diffSnapshots, changeColumns
+    from .htmlOutput import writeHTMLOutput
+
+    before, after = args.diff
+    byTitle = before.endswith('.csv') or after.endswith('.csv')     # csv count strings only have labels
+    try:
+        changes, unchanged = diffSnapshots(snapshotQueries(before, args.facetList, byTitle),
+                                           snapshotQueries(after, args.facetList, byTitle))
+    except (ValueError, OSError, KeyError) as err:
+        lggr.warning(f'Diff: {err}')
+        return
+
+    df = pd.DataFrame(changes, columns=changeColumns)
+    counts = df['change'].value_counts()
+    summary = ', '.join(f'{counts.get(c, 0)} {c}' for c in ['added', 'removed', 'changed']) + f', {unchanged} unchanged'
+    lggr.info(f'Diff {before} to {after}: {summary}')
+
+    outputFile = 'DataCite_diff__' + dateStamp + '.csv'
+    lggr.info(f'diff output to {outputFile}')
+    df.to_csv(outputFile, encoding='utf-8', sep=',', index=False)
+
+    htmlOutputFile = 'DataCite_diff__' + dateStamp + '.html'
+    lggr.info(f'diff output to {htmlOutputFile}')
+    df['pctChange'] = [f'{v:+.1%}' if pd.notna(v) else '' for v in df['pctChange']]
+    header = f"<b>Changes from</b> {html.escape(before)} <b>to</b> {html.escape(after)}: {summary}<br>"
+    writeHTMLOutput(htmlOutputFile, df, False, header, dateStamp, args.htmlPageRows)
+
+
+def runQuery(args:argparse.Namespace,                   # command line arguments
+             query:FacetQuery,                          # queries of the run
+             runId:str,                                 # run identifier
+             dateStamp:str,                             # datestamp of the run
+             completed:dict,                            # completed queries of a resumed run (readJournal)
+             commandLine:str,                           # command line arguments of the run
+             metrics:RunMetrics,                        # run metrics
+             archiveFile:str = None,                    # read the responses from this archive (--from-archive)
+             outputStamp:str = None):                   # stamp of the output file names (default = dateStamp)
+    '''
+        Retrieve (or read from an archive) the queries of one run and write the requested outputs
+    '''
+    run = prepareRun(args, query, runId, dateStamp, completed, commandLine, metrics, archiveFile)
+    if run is not None:
+        writeRun(args, run, outputStamp=outputStamp)
+
+
+def prepareRun(args:argparse.Namespace,                 # command line arguments
+               query:FacetQuery,                        # queries of the run
+               runId:str,                               # run identifier
+               dateStamp:str,                           # datestamp of the run
+               completed:dict,                          # completed queries of a resumed run (readJournal)
+               commandLine:str,                         # command line arguments of the run
+               metrics:RunMetrics,                      # run metrics
+               archiveFile:str = None,                  # read the responses from this archive (--from-archive)
+               retriever = None                         # shared Retriever (--job)
+               )-> FacetRun:                            # None if the run can not be prepared
+    '''
+        Create the FacetRun of a query and remove or derive the queries that do not need to be retrieved
+        (--affiliationBatch, --plan, --derive, --incremental). The probes of these options are retrieved here.
+    '''
+    homeDir = os.path.expanduser('~')
+    reprocess = archiveFile is not None                 # no retrievals, journal or json output for archived runs
+    run = FacetRun(query, workers=args.workers, batchSize=args.batchSize, rateLimit=args.rateLimit,
+                   retries=args.retries, backoff=args.backoff, backoffMax=args.backoffMax,
+                   connectTimeout=args.connectTimeout, readTimeout=args.readTimeout,
+                   cacheDirectory=None if args.noCache else args.cacheDir, cacheTTL=args.cacheTTL,
+                   cacheSize=args.cacheSize, refresh=args.refresh, useID=args.useIDAsTitle,
+                   jsonDirectory=homeDir + '/data/DataCite/metadata' if args.jout and not reprocess else None,
+                   journalDirectory=None if reprocess else homeDir + '/data/DataCite/runs',
+                   runId=runId, dateStamp=dateStamp, completed=completed,
+                   commandLine=commandLine, metrics=metrics, archiveFile=archiveFile, retriever=retriever)
+
+    if args.affiliationBatch > 0 and not reprocess:     # remove affiliations without records before retrieval
+        run.resolveAffiliations(args.affiliationBatch)
+    if args.plan:                                       # prune empty combinations before retrieval
+        run.planQueries()
+    if args.derive:                                     # read queries from the facets of broader queries
+        run.deriveQueries()
+    if args.incremental and not args.showURLs:          # carry unchanged queries forward from the last snapshot
+        if 'DATACITE_STATISTICS_DATABASE' not in os.environ:
+            lggr.warning('--incremental requires the database defined by DATACITE_STATISTICS_DATABASE')
+            return None
+        from .sinks import readSnapshot
+        with metrics.stageTimer('SQLite'):
+            previous = readSnapshot(query.param_List, query.facetList, runId)
+        run.carryForward(previous)
+    return run
+
+
+def writeRun(args:argparse.Namespace,                   # command line arguments
+             run:FacetRun,                              # prepared run (prepareRun)
+             outputPrefix:str = '',                     # prefix of the output files (the directory of a --job report)
+             outputStamp:str = None):                   # stamp of the output file names (default = dateStamp)
+    '''
+        Retrieve the remaining queries of a prepared run and write the requested outputs
+    '''
+    homeDir = os.path.expanduser('~')
+    query, runId, dateStamp, metrics = run.query, run.runId, run.dateStamp, run.metrics
+    outputStamp = outputStamp or dateStamp
+
+    if args.showURLs:                                   # display URLs and parameters to be retrieved without retrieving data
+        for u,p in query.queries():                     # use this to test various command line arguments
+            if tuple(p) not in run.derived:
+                lggr.info(f'URL: {query.requestURL(u)} Parameters:{p}')
+        if args.plan or args.derive:
+            lggr.info(f'Planned URL List: {len(query.URL_List) - len(run.derived)} items '
+                      f'({query.pruned} requests pruned, {len(run.derived)} derived)')
+        return
+
+    if args.harvest:                                    # records instead of facets
+        run.harvest(homeDir + '/data/DataCite/harvest/' + runId, args.pageSize)
+        lggr.info('Stage times: ' + ' '.join(f'{k}: {v:.3f}s' for k,v in metrics.stageTimes.items()))
+        return
+
+    from .sinks import CSVRowSink, DatabaseRowSink, FacetValueSink, ParquetSink
+
+    parameterNames = query.parameterNames
+    columns = facetColumns(parameterNames, query.facetList)
+
+    sinks = []                                  # rows are written to the csv file and database as each query completes
+    if args.csvout:                             # output data to csv
+        outputFile = outputPrefix + 'DataCite_' + '_combined__' + outputStamp + '.csv'
+        lggr.info(f'facet count output to {outputFile}')
+        sinks.append(CSVRowSink(outputFile, columns))
+    if args.dbout:                              # add data to database
+        sinks.append(DatabaseRowSink(runId, dateStamp, query.targets, query.facetList, run.commandLine, run.carriedFrom))
+    if args.parquetout:                         # typed summary and facet values datasets
+        sinks.append(ParquetSink(homeDir + '/data/DataCite/parquet', runId, dateStamp, query.facetList))
+    if args.facetdata:                          # facet values for the facet data tables
+        facetValueSink = FacetValueSink(parameterNames)
+        sinks.append(facetValueSink)
+    keepRows = args.htmlout or args.pout        # only these outputs need the complete table
+
+    d_list = run.run(sinks, keepRows)
+
+    import pandas as pd
+    from .sinks import facetPivot
+    from .htmlOutput import writeHTMLOutput
+
+    with metrics.stageTimer('DataFrame'):
+        item_df = pd.DataFrame(d_list) # create dataframe
+
+    targetNames = '_'.join(set(query.targets))
+    if args.htmlout:
+        header = htmlHeader(args, query.parameters)
+
+    if args.facetdata:                               # create and output facet data
+        with metrics.stageTimer('DataFrame'):
+            facet_values_df = facetValueSink.frame()
+            allParameters = facetValueSink.queries()
+        for facet in args.facetList:
+            with metrics.stageTimer('DataFrame'):
+                facet_df = facetPivot(facet_values_df, facet, parameterNames, allParameters, args.useIDAsTitle)
+
+            outputFile = outputPrefix + 'DataCite_' + targetNames + '_' + facet + '__' + outputStamp + '.csv'
+            lggr.info(f'facet data output to {outputFile}')
+            with metrics.stageTimer('facetdata'):
+                facet_df.to_csv(outputFile,encoding='utf-8',sep=',',index=False)
+
+            if args.htmlout:                                 # output data to html
+                htmlOutputFile = outputPrefix + 'DataCite_' + targetNames + '_' + facet + '__' + outputStamp + '.html'
+                lggr.info(f'facet data output to {htmlOutputFile}')
+                with metrics.stageTimer('HTML'):
+                    writeHTMLOutput(htmlOutputFile,facet_df,True,header,dateStamp,args.htmlPageRows)
+
+    if args.htmlout:                                # output data to html
+        htmlOutputFile = outputPrefix + 'DataCite_' + targetNames + '__' + outputStamp + '.html'
+        lggr.info(f'facet count output to {htmlOutputFile}')
+        with metrics.stageTimer('HTML'):
+            writeHTMLOutput(htmlOutputFile,item_df,False,header,dateStamp,args.htmlPageRows)
+
+    if args.pout:                                   # print facet counts to screen
+                                                        # this produces VERY UGLY screen output that may work
+                                                        # for a quick look in some cases.
+        from tabulate import tabulate
+        with metrics.stageTimer('terminal'):
+            print(tabulate(item_df, headers='keys', tablefmt='github', showindex=False))
+
+    lggr.info('Stage times: ' + ' '.join(f'{k}: {v:.3f}s' for k,v in metrics.stageTimes.items()))
+
+    if args.runReport or args.prometheus:           # machine-readable run report
+        report = run.report()
+        if args.runReport:
+            lggr.info(f'run report output to {args.runReport}')
+            with open(args.runReport, 'w') as f:
+                json.dump(report, f, indent=2)
+        if args.prometheus:
+            lggr.info(f'run metrics output to {args.prometheus}')
+            writePrometheusTextfile(args.prometheus, report)
+
+
+def readJobFile(jobFile:str                             # job file (.json, .yml or .yaml)
+                )-> list:                               # (name, arguments) of each report
+    '''
+        Read the reports of a job file. The file has a list of reports, each with a name and the
+        retrieveDataCiteFacets arguments of the report as a string or a list, e.g.
+
+            reports:
+              - name: resources
+                arguments: --resources -fl clients --htmlout
+              - name: years
+                arguments: [--years, -minYear, '2015', --dbout]
+
+        yaml job files require the pyyaml package.
+    '''
+    with open(jobFile, encoding='utf-8') as f:
+        if jobFile.endswith(('.yml', '.yaml')):
+            import yaml
+            job = yaml.safe_load(f)
+        else:
+            job = json.load(f)
+
+    reports = []
+    for i, report in enumerate(job['reports']):
+        arguments = report['arguments']
+        if isinstance(arguments, str):
+            arguments = shlex.split(arguments)
+        reports.append((report.get('name', f'report {i+1}'), [str(a) for a in arguments]))
+    return reports
+
+
+def runJob(args:argparse.Namespace,                     # command line arguments (--job and the retrieval options)
+           runId:str,                                   # run identifier of the job
+           dateStamp:str):                              # datestamp of the job
+    '''
+        Run the reports of a job file. Every report is a separate run (runId_1, runId_2, ...) with the
+        arguments of the report that writes its output files to a directory named after the report; the
+        retrieval options (--workers, --rateLimit, --apiURL, --trimResponses, the cache) are those of the
+        job command line.
+
+        All reports are prepared first (prepareRun: --affiliationBatch, --plan, --derive and --incremental
+        of each report), so only the queries that remain are retrieved. The reports share a retriever with a
+        memory cache: a URL needed by several reports is retrieved once and its response is dropped after
+        the last report used it. The reports run one after the other, so the requests of each report
+        (including its probes) are counted in its own run metrics.
+    '''
+    from .retrieval import Retriever, ResponseCache, MemoryCache
+
+    reports = []
+    for name, arguments in readJobFile(args.job):
+        reportArgs = createCommandLine().parse_args(arguments + ['--apiURL', args.apiURL])
+        reportArgs.affiliationList = commandLineAffiliations(reportArgs)
+        reportArgs.showURLs = args.showURLs
+        reportArgs.workers = args.workers               # retrieval options of the job
+        try:
+            query = FacetQuery(commandLineTargets(reportArgs), reportArgs.itemList, reportArgs.affiliationList,
+                               reportArgs.minYear, reportArgs.combineQueries, reportArgs.facetList, args.apiURL)
+        except ValueError as err:
+            lggr.warning(f'Job report {name}: {err}')
+            continue
+        if len(query.targets) == 0:
+            lggr.warning(f'Job report {name}: no targets specified')
+            continue
+        reports.append((name, arguments, reportArgs, query))
+
+    if args.trimResponses:                              # one response of each URL with the facets of all reports
+        requestFacets = list(dict.fromkeys(f for name, arguments, reportArgs, query in reports for f in query.facetList))
+        for name, arguments, reportArgs, query in reports:
+            query.requestFacets = requestFacets
+
+    memoryCache = MemoryCache(sum(len(query) for name, arguments, reportArgs, query in reports), args.cacheTTL)
+    responseCache = None if args.noCache else ResponseCache(args.cacheDir, int(args.cacheSize * 1e6))
+    retriever = Retriever(RunMetrics(), workers=args.workers, rateLimit=args.rateLimit, retries=args.retries,
+                          backoff=args.backoff, backoffMax=args.backoffMax, connectTimeout=args.connectTimeout,
+                          readTimeout=args.readTimeout, responseCache=responseCache, cacheTTL=args.cacheTTL,
+                          refresh=args.refresh, memoryCache=memoryCache)
+
+    runs = []
+    for i, (name, arguments, reportArgs, query) in enumerate(reports):
+        metrics = RunMetrics()
+        retriever.metrics = metrics                     # the probes of the report are counted in its metrics
+        run = prepareRun(reportArgs, query, f'{runId}_{i+1}', dateStamp, {}, ' '.join(arguments), metrics,
+                         retriever=retriever)
+        if run is not None:
+            runs.append((name, arguments, reportArgs, run))
+
+    uses = collections.Counter(run.query.requestURL(u) for name, arguments, reportArgs, run in runs
+                                                       for u,p in run.pendingQueries())
+    lggr.info(f'Job {args.job}: {len(runs)} reports, {sum(len(r[3].query) for r in runs)} queries, '
+              f'{sum(uses.values())} to retrieve, {len(uses)} unique URLs')
+    if args.showURLs:
+        for u in uses:
+            lggr.info(f'URL: {u}')
+        return
+    memoryCache.expectUses(uses)
+
+    for name, arguments, reportArgs, run in runs:
+        reportDirectory = re.sub('[^A-Za-z0-9_.-]+', '_', name)
+        os.makedirs(reportDirectory, exist_ok=True)
+        lggr.info(f'Job report {name}: {" ".join(arguments)} (outputs in {reportDirectory})')
+        retriever.metrics = run.metrics
+        writeRun(reportArgs, run, outputPrefix=reportDirectory + '/')
+
+    statistics = collections.Counter()
+    for name, arguments, reportArgs, run in runs:
+        statistics.update(run.metrics.retrievalStatistics)
+    lggr.info(f'Job {args.job}: ' + ' '.join(f'{k}: {statistics[k]}' for k in ['requests','memoryHits','cacheHits','failures']))
+
+
+def main(argv:list = None):                             # command line arguments (default = sys.argv[1:])
+    '''
+        retrieveDataCiteFacets command line: build the FacetQuery and FacetRun for the
+        command line arguments and write the requested outputs
+    '''
+    args = createCommandLine().parse_args(argv) # parse the command line and define variables
+
+    if args.logto:
+        # Log to file
+        logging.basicConfig(
+            filename=args.logto, filemode='a',
+            format='%(asctime)s:%(levelname)s:%(name)s: %(message)s',
+            level=args.loglevel.upper(),
+            datefmt='%Y-%m-%d %H:%M:%S')
+    else:
+        # Log to stderr
+        logging.basicConfig(
+            format='%(asctime)s:%(levelname)s:%(name)s: %(message)s',
+            level=args.loglevel.upper(),
+            datefmt='%Y-%m-%d %H:%M:%S')
+
+    metrics = RunMetrics()
+    current_time = datetime.datetime.now()
+    dateStamp = f'{current_time.year}{current_time.month:02d}{current_time.day:02d}_{current_time.hour:02d}'
+    runId = f'{dateStamp}{current_time.minute:02d}{current_time.second:02d}'
+
+    homeDir = os.path.expanduser('~')
+
+    journalDirectory = homeDir + '/data/DataCite/runs'
+    completed = {}
+    if args.resume:                                 # continue an interrupted run with its runId and dateStamp
+        runId = args.resume
+        journalHeader, completed = readJournal(journalDirectory + '/' + runId + '.jsonl')
+        dateStamp = journalHeader['dateStamp']
+
+    lggr.info(f'*********************************** retrieveRelationandResourceCounts {dateStamp}')
+
+    if args.trends:                                 # analyze the runs in the database
+        writeTrends(args, dateStamp)
+        return
+
+    if args.diff:                                   # compare two snapshots
+        writeDiff(args, dateStamp)
+        return
+
+    if args.serve:                                  # long-running facet service
+        from .retrieval import Retriever, MemoryCache
+        from .service import createService
+        retriever = Retriever(RunMetrics(latencySamples=10000), workers=args.workers, rateLimit=args.rateLimit,
+                              retries=args.retries, backoff=args.backoff, backoffMax=args.backoffMax,
+                              connectTimeout=args.connectTimeout, readTimeout=args.readTimeout,
+                              memoryCache=MemoryCache(args.serveCache, args.cacheTTL))
+        server = createService(args.serve, retriever, args.workers, args.batchSize, args.useIDAsTitle, args.apiURL)
+        lggr.info(f'Facet service at http://127.0.0.1:{server.server_port}/facets')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    if args.job:                                    # several reports with one retrieval of each URL
+        runJob(args, runId, dateStamp)
+        return
+
+    args.affiliationList = commandLineAffiliations(args)
+    targets = commandLineTargets(args)
+
+    if args.showTargetData:                 # list items for each target
+        years = range(args.minYear, current_time.year + 1) if args.getYears else []
+        parameters = targetParameters(args.affiliationList, years)
+        for t in list(parameters):
+            if len(parameters[t]['data']) > 0:
+                print(f"\nTarget {t} ({len(parameters[t]['data'])}) items:\n{parameters[t]['data']}")
+        print(f'\nFacets ({len(facets)}) items:\n{facets}')
+        return
+
+    try:
+        with metrics.stageTimer('URL generation'):
+            query = FacetQuery(targets, args.itemList, args.affiliationList, args.minYear,
+                               args.combineQueries, args.facetList, args.apiURL)
+    except ValueError as err:
+        lggr.warning(err)
+        return
+
+    if len(query.targets) == 0:
+        lggr.warning('No targets specified')
+        return
+    else:
+        lggr.info(f'Targets: {query.targets}')
+
+    if args.trimResponses:
+        query.requestFacets = query.facetList
+    lggr.info(f"URL List: {len(query.URL_List)} items. Parameter List: {len(query.param_List)}")
+
+    commandLine = ' '.join(sys.argv[1:] if argv is None else argv)
+    if args.fromArchive:                                # reprocess archived runs without retrieving
+        if args.plan or args.derive or args.incremental or args.harvest:
+            lggr.warning('--plan, --derive, --incremental and --harvest retrieve from DataCite and are not used with --from-archive')
+            args.plan = args.derive = args.incremental = args.harvest = False
+        archivedRuns = []
+        for archiveFile in archiveFiles(args.fromArchive):
+            try:
+                archivedRuns.append((archiveFile,) + archiveRun(archiveFile))
+            except ValueError as err:
+                lggr.warning(err)
+        dateStamps = collections.Counter(dateStamp for archiveFile, runId, dateStamp in archivedRuns)
+        for archiveFile, runId, dateStamp in archivedRuns:
+            outputStamp = runId if dateStamps[dateStamp] > 1 else dateStamp     # runs of the same hour get their own outputs
+            runArgs = args                              # the database and Parquet outputs of the original run are not replaced
+            if args.dbout and not args.replace and 'DATACITE_STATISTICS_DATABASE' in os.environ:
+                from .sinks import storedRun
+                if storedRun(runId):
+                    lggr.warning(f'Run {runId} is already in the database, use --replace to replace it with the reprocessed run')
+                    runArgs = argparse.Namespace(**dict(vars(runArgs), dbout=False))
+            if args.parquetout and not args.replace:
+                from .sinks import parquetRunFiles
+                if len(parquetRunFiles(homeDir + '/data/DataCite/parquet', runId, dateStamp)) > 0:
+                    lggr.warning(f'Run {runId} is already in the Parquet datasets, use --replace to replace it with the reprocessed run')
+                    runArgs = argparse.Namespace(**dict(vars(runArgs), parquetout=False))
+            lggr.info(f'Reprocessing run {runId} from {archiveFile}')
+            runQuery(runArgs, query, runId, dateStamp, {}, commandLine, RunMetrics(), archiveFile,
+                     outputStamp=outputStamp + '_reprocessed')
+        return
+
+    runQuery(args, query, runId, dateStamp, completed, commandLine, metrics)
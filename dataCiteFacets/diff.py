@@ -0,0 +1,171 @@
+import csv
+import sys
+import json
+import logging
+import itertools
+
+from .targets import facets
+from .archive import ArchiveReader
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+changeColumns = ['parameters', 'facet', 'id', 'title', 'change', 'before', 'after', 'delta', 'pctChange']
+
+
+def facetLabel(title:str)-> str:
+    '''
+        The label of a facet value in the count strings of the csv output (commas are replaced by semicolons)
+    '''
+    return str(title).replace(',', ';')
+
+
+def databaseQueries(runId:str,                          # run identifier
+                    facetList:list = None,              # facets to compare (None = all)
+                    byTitle:bool = False                # key the facet values by their labels instead of their ids
+                    ):
+    '''
+        Generate (parameters, {(facet, id): (title, count)}) for the queries of a run in the database. The
+        facet values are read in one ordered query, so only the values of one query are held in memory.
+    '''
+    from .sinks import connectToDataCiteDatabase, createDatabaseTables
+
+    con, cur = connectToDataCiteDatabase()
+    createDatabaseTables(cur)
+    run = cur.execute('SELECT complete FROM runs WHERE run_id = ?', (runId,)).fetchone()
+    if run is None:
+        con.close()
+        raise ValueError(f'Run {runId} is not in the database')
+    if not run[0]:
+        con.close()
+        raise ValueError(f'Run {runId} is incomplete (interrupted while it was written to the database)')
+    rows = cur.execute('SELECT q.parameters, q.NumberOfRecords, f.facet, f.id, f.title, f.count FROM queries q '
+                       'LEFT JOIN facet_values f ON f.query_id = COALESCE(q.carried_from, q.query_id) '
+                       'WHERE q.run_id = ? ORDER BY q.query_id, f.rowid', (runId,))
+    for parameters, group in itertools.groupby(rows, key=lambda r: r[0]):
+        values = {}
+        for parameters_, numberOfRecords, facet, id_, title, count in group:
+            values[('NumberOfRecords', '')] = ('', numberOfRecords)
+            if facet is None or (facetList and facet not in facetList):
+                continue
+            addValue(values, facet, facetLabel(title) if byTitle else id_, title, count)
+        yield (', '.join(json.loads(parameters)), values)
+    con.close()
+
+
+def archiveQueries(archiveFile:str,                     # run archive (--jout)
+                   facetList:list = None,               # facets to compare (None = all)
+                   byTitle:bool = False                 # key the facet values by their labels instead of their ids
+                   ):
+    '''
+        Generate (parameters, {(facet, id): (title, count)}) for the queries of a run archive
+    '''
+    for entry in ArchiveReader(archiveFile).entries():
+        meta = entry['response'].get('meta', {})
+        values = {('NumberOfRecords', ''): ('', meta.get('total'))}
+        for facet in facetList or facets:
+            for d in meta.get(facet) or []:
+                addValue(values, facet, facetLabel(d['title']) if byTitle else d['id'], d['title'], d['count'])
+        yield (', '.join(entry['parameters']), values)
+
+
+def csvQueries(csvFile:str,                             # combined csv output (--csvout)
+               facetList:list = None                    # facets to compare (None = all)
+               ):
+    '''
+        Generate (parameters, {(facet, label): (label, count)}) for the rows of a csv output. The facet values
+        are read from the count strings (label (count), ...), so they are keyed by their labels (the titles, or
+        the ids of a run with --id).
+    '''
+    csv.field_size_limit(sys.maxsize)                   # count strings of large facets
+    with open(csvFile, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        parameterColumns = header.index('DateTime')
+        recordsColumn = header.index('NumberOfRecords')
+        facetColumns = [(i, c) for i, c in enumerate(header) if c in facets and (not facetList or c in facetList)]
+        for row in reader:
+            values = {('NumberOfRecords', ''): ('', int(row[recordsColumn]))}
+            for i, facet in facetColumns:
+                for label, count in countStringValues(row[i]):
+                    addValue(values, facet, label, label, count)
+            yield (', '.join(row[:parameterColumns]), values)
+
+
+def countStringValues(countString:str                   # facet count string, e.g. Dryad (120), Zenodo (15)
+                      )-> list:                         # [(label, count)]
+    '''
+        The labels and counts of a count string (statistics.facetStatistics). Labels have no commas.
+    '''
+    values = []
+    for value in countString.split(', ') if countString else []:
+        label, _, count = value.rpartition(' (')
+        values.append((label, int(count.rstrip(')'))))
+    return values
+
+
+def addValue(values:dict,                               # {(facet, id): (title, count)} of a query
+             facet:str, id_:str, title:str, count:int):
+    '''
+        Add a facet value to the values of a query. Values with the same key (e.g. repositories with
+        the same title) are added together.
+    '''
+    previous = values.get((facet, id_))
+    values[(facet, id_)] = (title, count if previous is None else previous[1] + count)
+
+
+def snapshotQueries(snapshot:str,                       # runId in the database, csv output or run archive
+                    facetList:list = None,              # facets to compare (None = all)
+                    byTitle:bool = False                # key the facet values by their labels instead of their ids
+                    ):
+    '''
+        Generate (parameters, {(facet, id): (title, count)}) for every query of a snapshot: a csv output
+        (.csv), a run archive (.jsonl.gz) or the runId of a run in the database. The number of records
+        of a query is the value ('NumberOfRecords', '').
+    '''
+    if snapshot.endswith('.csv'):
+        return csvQueries(snapshot, facetList)
+    if snapshot.endswith('.jsonl.gz'):
+        return archiveQueries(snapshot, facetList, byTitle)
+    return databaseQueries(snapshot, facetList, byTitle)
+
+
+def diffSnapshots(before,                               # (parameters, values) of the earlier snapshot (snapshotQueries)
+                  after                                 # (parameters, values) of the later snapshot
+                  )-> tuple:                            # (changes, unchanged)
+    '''
+        The facet values (and numbers of records) that were added, removed or changed between two snapshots.
+
+        The later snapshot is indexed by parameters and (facet, id), the earlier snapshot is read one query
+        at a time and every value is matched by removing it from the index, so each value is visited once
+        and only one snapshot is held in memory. The values that remain in the index were added. Queries
+        without records are the same as missing queries.
+
+        Returns the changes (changeColumns, largest changes first) and the number of unchanged values.
+    '''
+    index = {}
+    for parameters, values in after:
+        index[sys.intern(parameters)] = values
+
+    changes = []
+    unchanged = 0
+    for parameters, values in before:
+        afterValues = index.pop(parameters, {})
+        for (facet, id_), (title, count) in values.items():
+            afterValue = afterValues.pop((facet, id_), None)
+            afterCount = afterValue[1] if afterValue is not None else 0
+            if count == afterCount:
+                unchanged += count != 0
+            elif count == 0:
+                changes.append((parameters, facet, id_, afterValue[0], 'added', 0, afterCount))
+            elif afterCount == 0:
+                changes.append((parameters, facet, id_, title, 'removed', count, 0))
+            else:
+                changes.append((parameters, facet, id_, afterValue[0], 'changed', count, afterCount))
+        changes.extend((parameters, facet, id_, title, 'added', 0, count)
+                        for (facet, id_), (title, count) in afterValues.items() if count != 0)
+    for parameters, afterValues in index.items():       # queries that are only in the later snapshot
+        changes.extend((parameters, facet, id_, title, 'added', 0, count)
+                        for (facet, id_), (title, count) in afterValues.items() if count != 0)
+
+    changes.sort(key=lambda c: (-abs(c[6] - c[5]), c[0], c[1], c[2]))
+    return ([c + (c[6] - c[5], (c[6] - c[5]) / c[5] if c[5] else None) for c in changes], unchanged)
@@ -0,0 +1,123 @@
+import os
+import json
+import gzip
+import logging
+import urllib.parse
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+
+def harvestURL(URL:str,                                 # DataCite API URL of a query (page[size]=1)
+               pageSize:int = 1000,                     # records per page (DataCite maximum = 1000)
+               cursor:str = '1'                         # page cursor (1 = first page)
+               )-> str:                                 # URL of the cursor page of the records
+    '''
+        A cursor page of the records of a query: page[cursor] and page[size] replace the page
+        parameters of the query URL and disable-facets=true skips the facet aggregations of every page
+    '''
+    base, urlParameters = URL.split('?', 1)
+    urlParameters = [x for x in urlParameters.split('&') if x and not x.startswith('page[')]
+    return base + '?' + '&'.join([f'page[cursor]={urllib.parse.quote(cursor, safe="")}', f'page[size]={pageSize}']
+                                 + urlParameters + ['disable-facets=true'])
+
+
+def nextPageURL(URL:str,                                # DataCite API URL of the query
+                nextLink:str,                           # links.next of a page (None on the last page)
+                pageSize:int = 1000                     # records per page
+                )-> str:                                # URL of the next page (None on the last page)
+    '''
+        The next cursor page of a query. Only the cursor is taken from links.next, the page is requested
+        with the parameters of the query (harvestURL), so every page keeps page[size] and disable-facets
+        whatever links.next includes.
+    '''
+    if not nextLink:
+        return None
+    cursor = urllib.parse.parse_qs(urllib.parse.urlsplit(nextLink).query).get('page[cursor]')
+    if not cursor:                                  # not a cursor page, the harvest cannot continue
+        raise ValueError(f'No page[cursor] in links.next: {nextLink}')
+    return harvestURL(URL, pageSize, cursor[0])
+
+
+def readHarvestState(stateFile:str                      # harvest state of a query (json)
+                     )-> dict:                          # {parameters, next, offset, records, total} or None
+    '''
+        Read the state of an earlier harvest of a query. next is the URL of the next page (None when the
+        harvest is complete) and offset is the size of the output file after the last complete page.
+    '''
+    if not os.path.exists(stateFile):
+        return None
+    with open(stateFile, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def writeHarvestState(stateFile:str, state:dict):
+    '''
+        Replace the harvest state of a query (written to a temporary file first, so an interrupted
+        write leaves the previous state)
+    '''
+    with open(stateFile + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(stateFile + '.tmp', stateFile)
+
+
+def harvestQuery(retrieveMetadata,                      # function returning the DataCite response for a URL (or None)
+                 URL:str,                               # DataCite API URL of the query
+                 p:tuple,                               # query parameters for URL
+                 outputFile:str,                        # compressed JSONL output (one record per line)
+                 metrics,                               # run metrics (RunMetrics)
+                 pageSize:int = 1000                    # records per page
+                 )-> dict:                              # harvest state {parameters, next, offset, records, total}
+    '''
+        Retrieve all records of a query with cursor pagination and append them to a gzip compressed JSONL file.
+
+        Each page is written as a separate gzip member and only one page is held in memory. The state file
+        (outputFile + '.state') is updated after every page with the next page URL and the size of the file,
+        so an interrupted harvest continues with the next page: the file is truncated to the last complete
+        page and the harvest continues from its cursor. A complete harvest is not retrieved again.
+    '''
+    stateFile = outputFile + '.state'
+    state = readHarvestState(stateFile)
+    if state is None:
+        state = {'parameters': list(p), 'next': harvestURL(URL, pageSize), 'offset': 0, 'records': 0, 'total': None}
+    elif state['next'] is None:
+        lggr.info(f'Harvest complete: {p} {state["records"]} records in {outputFile}')
+        return state
+    else:
+        lggr.info(f'Resuming harvest: {p} {state["records"]} of {state["total"]} records in {outputFile}')
+
+    with open(outputFile, 'ab') as f:
+        f.truncate(state['offset'])                 # remove a partial page of an interrupted harvest
+        while state['next'] is not None:
+            res = retrieveMetadata(state['next'])
+            if res is None:                         # retrieval failed (logged in retrieveMetadata), resume later
+                lggr.warning(f'Harvest interrupted: {p} {state["records"]} records, resume from {state["next"]}')
+                return state
+            with metrics.stageTimer('JSON decode'):
+                page = res.json()
+
+            records = page.get('data', [])
+            with metrics.stageTimer('harvest'):
+                if len(records) > 0:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                        for record in records:
+                            gz.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                state['offset'] = f.tell()
+                state['records'] += len(records)
+                state['total'] = page.get('meta', {}).get('total', state['total'])
+                state['next'] = nextPageURL(URL, page.get('links', {}).get('next'), pageSize) if len(records) > 0 else None
+                writeHarvestState(stateFile, state)
+            lggr.debug(f'Harvest: {p} {state["records"]} of {state["total"]} records')
+
+    lggr.info(f'Harvested: {p} {state["records"]} records to {outputFile}')
+    return state
+
+
+def readHarvest(harvestFile:str):
+    '''
+        Generate the records of a harvest file (harvestQuery) one at a time
+    '''
+    with gzip.open(harvestFile, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
@@ -0,0 +1,156 @@
+import html
+
+import numpy as np
+import pandas as pd
+
+#
+# Column types of the facet statistics (createFacetsDictionary)
+#
+floatSuffixes = ('_HI','_coverage','_gini','_entropy','_top3','_herfindahl')
+intSuffixes = ('NumberOfRecords','_number','_max','_total')
+
+#
+# Table styles: the cell colors and alignment are CSS classes instead of inline styles for each cell
+#
+tableStyle = '''<style>
+    table.facets { border: 1px solid black; width: 100% }
+    table.facets th, table.facets td { border: 1px solid black; border-collapse: collapse; padding: 5px; font-family: "Century Gothic" }
+    table.facets td.number { text-align: center }
+    table.facets td.text { text-align: left }
+    table.facets td.low { background-color: lightPink }
+    table.facets td.mid { background-color: yellow }
+    table.facets td.high { background-color: lightGreen }
+    </style>
+    '''
+
+
+def writeHTMLOutput(output:str,                         # output file name
+                    df:pd.core.frame.DataFrame,         # dataframe
+                    simple:bool,                        # flag for simple html
+                    header:str,                         # html description of the run (command line options)
+                    dateStamp:str,                      # datestamp of the run
+                    pageRows:int = 0,                   # rows per page (0 = one page)
+                    chunkRows:int = 1000                # rows rendered and written together
+                 ):
+    '''
+        Write a dataframe to an HTML file. The table is rendered in chunks of rows that are written
+        as they are created. With pageRows, large tables are split into pages (output, output_2.html, ...)
+        with links to the other pages; the highlights are the same as for a single page.
+    '''
+    #
+    # Define html header and footer
+    #
+    startHTML = '''<!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8" />
+        <title>DataCite Facet Summary</title>
+    </head>
+    <style>body { font-family: "Calibri" }</style>
+    ''' + tableStyle + '''<body>
+    <h1>DataCite Facet Summary</h1>
+    '''
+
+    endHTML = f'<hr><i>Report created {dateStamp} by <a href="https://github.com/Metadata-Game-Changers/DataCiteFacets">retrieveDataCiteFacets</a> from <a href="https://metadatagamechangers.com">Metadata Game Changers</a></i></body></html>'
+
+    cells = htmlCells(df, simple)
+    pages = [(0, len(df))]
+    if pageRows > 0 and len(df) > pageRows:
+        pages = [(start, min(start + pageRows, len(df))) for start in range(0, len(df), pageRows)]
+    pageFiles = [output] + [output[:-len('.html')] + f'_{i+1}.html' if output.endswith('.html') else output + f'_{i+1}'
+                            for i in range(1, len(pages))]
+
+    for i, (start, end) in enumerate(pages):
+        with open(pageFiles[i], 'w') as f:
+            f.write(startHTML)
+            f.write(header)
+            if len(pages) > 1:
+                f.write(pageLinks(pageFiles, i, start, end, len(df)))
+            for chunk in tableChunks(df.columns, cells, start, end, chunkRows):
+                f.write(chunk)
+            f.write(endHTML)
+
+
+def pageLinks(pageFiles:list,                           # file names of the pages
+              page:int,                                 # current page
+              start:int,                                # first row of the page
+              end:int,                                  # end of the rows of the page
+              rows:int                                  # rows of the table
+              )-> str:
+    '''
+        Links to the other pages of a paginated table
+    '''
+    links = [str(i+1) if i == page else f'<a href="{html.escape(pageFiles[i].rsplit("/", 1)[-1])}">{i+1}</a>'
+                for i in range(len(pageFiles))]
+    return f'<p><b>Rows {start+1} to {end} of {rows}.</b> Page: {" ".join(links)}</p>'
+
+
+def htmlCells(df:pd.core.frame.DataFrame,               # dataframe
+              simple:bool                               # flag for simple html (no highlights)
+              )-> list:
+    '''
+        The <td> cells of each column as a Series of strings. Statistic columns are formatted and classed by
+        column: integer counts (highlighted where they are the column maximum) and floating point statistics
+        (formatted as % and colored low, mid or high). The classes are computed for whole columns at once.
+    '''
+    cells = []
+    for c in df.columns:
+        s = df[c].fillna(0)                         # replace nan values with 0's
+        if simple:                                  # simple HTML (no highlights)
+            if s.dtype == float:
+                s = s.astype(int)
+            text, classes = cellText(s), None
+        elif c.endswith(intSuffixes):
+            s = s.astype(int)
+            text = s.astype(str)
+            classes = np.where(s == s.max(), 'number high', 'number')
+        elif c.endswith(floatSuffixes):
+            s = s.astype(float)
+            text = pd.Series([f'{v:,.0f}' if v > 1e3 else f'{v:.0%}' for v in s], index=s.index, dtype=object)
+            classes = np.select([s < 0.000005, s > 0.99999], ['number low', 'number high'], 'number mid')
+        else:
+            text, classes = cellText(s), 'text'
+
+        if classes is None:
+            cells.append('<td>' + text + '</td>')
+        else:
+            cells.append('<td class="' + pd.Series(classes, index=s.index) + '">' + text + '</td>')
+    return cells
+
+
+def cellText(s:pd.Series)-> pd.Series:
+    '''
+        Escaped text of the cells of a column without a statistic format (floats with 6 decimals)
+    '''
+    if s.dtype == float:
+        return pd.Series([f'{v:.6f}' for v in s], index=s.index, dtype=object)
+    return s.astype(str).map(lambda v: html.escape(v, quote=False))
+
+
+def tableChunks(columns:list,                           # column names
+                cells:list,                             # <td> cells of each column (htmlCells)
+                start:int,                              # first row
+                end:int,                                # end of the rows
+                chunkRows:int = 1000                    # rows per chunk
+                ):
+    '''
+        Generate the HTML of a table (rows start to end) in chunks of chunkRows rows
+    '''
+    yield ('<table class="facets">\n<thead>\n<tr>'
+           + ''.join(f'<th>{html.escape(str(c), quote=False)}</th>' for c in columns)
+           + '</tr>\n</thead>\n<tbody>\n')
+    for chunkStart in range(start, end, chunkRows):
+        chunkEnd = min(chunkStart + chunkRows, end)
+        rows = pd.Series('<tr>', index=range(chunkEnd - chunkStart))
+        for column in cells:
+            rows = rows + column.iloc[chunkStart:chunkEnd].values
+        yield '\n'.join(rows + '</tr>') + '\n'
+    yield '</tbody>\n</table>\n'
+
+
+def dataframeToHTML(df:pd.core.frame.DataFrame,
+                    simple:bool)-> str:
+    '''
+        The HTML table of a dataframe (the table written by writeHTMLOutput)
+    '''
+    return tableStyle + ''.join(tableChunks(df.columns, htmlCells(df, simple), 0, len(df)))
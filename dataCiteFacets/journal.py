@@ -0,0 +1,63 @@
+import os
+import json
+import logging
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+
+def readJournal(journalFile:str                        # run journal (jsonl)
+                )-> tuple:                              # (journal header, {parameters: (numberOfRecords, facet dictionary, facet values)})
+    '''
+        Read the checkpoint journal of an earlier run. The first line is a header with the runId and
+        dateStamp of the run, every following line is one completed query. A partial last line
+        (written when the run was interrupted) is ignored.
+    '''
+    completed = {}
+    with open(journalFile, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                lggr.warning(f'Ignoring incomplete journal line in {journalFile}')
+                continue
+            completed[tuple(entry['parameters'])] = (entry['numberOfRecords'], None, entry['facetValues'])
+
+    return (header, completed)
+
+
+def writeJournalEntry(journal,                          # open journal file
+                      p:tuple,                          # query parameters
+                      URL:str,                          # query URL
+                      result:tuple):                    # (numberOfRecords, facet dictionary, facet values)
+    '''
+        Append one completed query to the run journal and flush it to disk
+    '''
+    journal.write(json.dumps({'parameters': list(p), 'URL': URL,
+                              'numberOfRecords': result[0],
+                              'facetValues': result[2]}, ensure_ascii=False) + '\n')
+    journal.flush()
+
+
+def truncatePartialLine(journalFile:str                 # run journal (jsonl)
+                        )-> int:                        # bytes removed
+    '''
+        Remove the partial last line of a journal (a run interrupted while it wrote an entry), so the
+        entries appended by the resumed run start on a new line. A journal without a complete header
+        is emptied and gets a new header.
+    '''
+    with open(journalFile, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:                                  # find the last newline, reading backwards
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            lggr.warning(f'Removed incomplete last line ({size - end} bytes) of {journalFile}')
+    return size - end
@@ -0,0 +1,105 @@
+import os
+import time
+import threading
+import collections
+import contextlib
+
+
+class RunMetrics:
+    '''
+        Stage times, HTTP latencies and retrieval statistics (requests, retries, throttles, failures,
+        bytes, cache hits) of a run. All counters are shared by the retrieval threads.
+    '''
+    def __init__(self,
+                 latencySamples:int = None):            # HTTP latencies kept for the percentiles (None = all)
+        self.start = time.perf_counter()
+        self.retrievalStatistics = collections.Counter()
+        self.stageTimes = collections.Counter()
+        self.stageCounts = collections.Counter()
+        self.httpLatencies = collections.deque(maxlen=latencySamples)
+        self.lock = threading.Lock()
+
+    def countStatistic(self,
+                       name:str,
+                       n:int = 1):
+        '''
+            Increment a retrieval statistic (requests, retries, throttles, failures, bytes, ...)
+        '''
+        with self.lock:
+            self.retrievalStatistics[name] += n
+
+    @contextlib.contextmanager
+    def stageTimer(self, stage:str):
+        '''
+            Add the time spent in a block to stageTimes (e.g. the time spent in each output writer).
+            Times of the HTTP stage are also kept individually for the latency percentiles.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stageTimes[stage] += elapsed
+                self.stageCounts[stage] += 1
+                if stage == 'HTTP':
+                    self.httpLatencies.append(elapsed)
+
+    def report(self,
+               runId:str,                               # run identifier
+               dateStamp:str,                           # datestamp of the run
+               commandLine:str,                         # command line arguments of the run
+               URLs:int,                                # number of query URLs
+               rows:int                                 # number of queries with records
+               )-> dict:
+        '''
+            Create the machine-readable report of a run: stage times, HTTP latency percentiles,
+            bytes transferred and the retrieval statistics (requests, retries, throttles, failures, cache hits)
+        '''
+        with self.lock:
+            httpLatencies = list(self.httpLatencies)
+        if len(httpLatencies) > 0:
+            import numpy as np
+            p50, p95, p99 = np.percentile(httpLatencies, [50, 95, 99])
+            latency = {'p50': p50, 'p95': p95, 'p99': p99, 'mean': float(np.mean(httpLatencies)), 'max': max(httpLatencies)}
+        else:
+            latency = {}
+
+        return {'runId': runId,
+                'dateStamp': dateStamp,
+                'commandLine': commandLine,
+                'seconds': time.perf_counter() - self.start,
+                'URLs': URLs,
+                'rows': rows,
+                'stages': {k: {'seconds': self.stageTimes[k], 'count': self.stageCounts[k]} for k in self.stageTimes},
+                'httpLatencySeconds': {k: float(v) for k,v in latency.items()},
+                'retrieval': dict(self.retrievalStatistics)}
+
+
+def writePrometheusTextfile(outputFile:str,             # textfile for the node_exporter textfile collector
+                            report:dict):               # run report (RunMetrics.report())
+    '''
+        Write the run report as Prometheus metrics. The file is replaced atomically so the
+        textfile collector never reads a partial file.
+    '''
+    lines = ['# HELP datacite_facets_run_seconds Duration of the last run',
+             '# TYPE datacite_facets_run_seconds gauge',
+             f'datacite_facets_run_seconds {report["seconds"]:.6f}',
+             '# HELP datacite_facets_urls Number of query URLs in the last run',
+             '# TYPE datacite_facets_urls gauge',
+             f'datacite_facets_urls {report["URLs"]}',
+             '# HELP datacite_facets_stage_seconds Time spent in each stage of the last run',
+             '# TYPE datacite_facets_stage_seconds gauge']
+    lines += [f'datacite_facets_stage_seconds{{stage="{k}"}} {v["seconds"]:.6f}' for k,v in report['stages'].items()]
+    lines += ['# HELP datacite_facets_http_latency_seconds HTTP request latency quantiles of the last run',
+              '# TYPE datacite_facets_http_latency_seconds gauge']
+    lines += [f'datacite_facets_http_latency_seconds{{quantile="0.{k[1:]}"}} {v:.6f}'
+                for k,v in report['httpLatencySeconds'].items() if k.startswith('p')]
+    lines += ['# HELP datacite_facets_retrieval Retrieval statistics of the last run (requests, retries, bytes, ...)',
+              '# TYPE datacite_facets_retrieval gauge']
+    lines += [f'datacite_facets_retrieval{{statistic="{k}"}} {v}' for k,v in report['retrieval'].items()]
+
+    tmpFile = outputFile + '.tmp'
+    with open(tmpFile, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmpFile, outputFile)
@@ -0,0 +1,265 @@
+import re
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from .targets import urlParameter, affiliationsParameter, queryTargets
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+#
+# The facets of a single target query that count the records for each item of another target,
+# e.g. the resourceTypes facet of query=relatedIdentifiers.relationType:IsCitedBy counts the
+# IsCitedBy records of each resource type.
+#
+probeFacets = {'resources': 'resourceTypes', 'years': 'registered'}
+
+
+def facetKey(value:str)-> str:
+    '''
+        Normalized facet value so items match facet ids and titles (PhysicalObject = physical-object = Physical Object)
+    '''
+    return re.sub('[^0-9a-z]', '', str(value).lower())
+
+
+def probeCounts(item_json:dict,                         # DataCite response of a single target query
+                facet:str                               # facet with counts for the items of another target
+                )-> dict:                               # {facetKey: count} or None
+    '''
+        Counts of a facet by facetKey. The counts are only returned if the facet covers all records of
+        the query (the sum of the counts is the total), otherwise a missing value does not mean that
+        there are no records and None is returned.
+    '''
+    meta = item_json.get('meta', {})
+    values = meta.get(facet)
+    if not values or sum(d['count'] for d in values) < meta.get('total', 0):
+        return None
+
+    counts = {}
+    for d in values:
+        for k in {facetKey(d['id']), facetKey(d['title'])}:
+            counts[k] = counts.get(k, 0) + d['count']
+    return counts
+
+
+def retrieveResponses(URLs:list,                       # DataCite API URLs
+                      retrieveMetadata,                 # function returning the DataCite response for a URL (or None)
+                      workers:int = 1,                  # number of concurrent retrievals
+                      metrics = None                    # run metrics (RunMetrics)
+                      )-> list:                         # decoded json for each URL (None for failed retrievals)
+    '''
+        Retrieve and decode the responses for a list of URLs (the probe and broader queries)
+    '''
+    def retrieve(URL):
+        res = retrieveMetadata(URL)
+        if res is None:
+            return None
+        if metrics is not None:
+            with metrics.stageTimer('JSON decode'):
+                return res.json()
+        return res.json()
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(retrieve, URLs))
+    return list(map(retrieve, URLs))
+
+
+def planQueries(query,                                  # combined FacetQuery
+                retrieveMetadata,                       # function returning the DataCite response for a URL (or None)
+                workers:int = 1,                        # number of concurrent probe retrievals
+                metrics = None                          # run metrics (RunMetrics)
+                )-> tuple:                              # (keep, expected, probes)
+    '''
+        Plan the combined queries of a FacetQuery from the single target queries (probes).
+
+        The total of a probe is the number of records for its item and the resourceTypes and registered
+        facets give the number of records for the item with each resource type and year. A combination
+        is pruned if any of its items or pairs of items has no records. The smallest of these counts is
+        an upper bound for the size of the remaining combinations and is returned as their expected size.
+
+        Returns the indices of the queries to keep, their expected sizes and the number of probes.
+    '''
+    targets = query.combinedTargets
+    probes = [(t, item, query.apiURL + '?&page[size]=1&' + urlParameter(query.parameters, t, item))
+                for t in targets for item in query.parameters[t]['data']]
+
+    responses = retrieveResponses([URL for t, item, URL in probes], retrieveMetadata, workers, metrics)
+
+    totals = {}                                     # (target, item): number of records
+    pairs = {}                                      # frozenset of two (target, item): number of records
+    for (t, item, URL), item_json in zip(probes, responses):
+        if item_json is None:                       # unknown, nothing is pruned for this item
+            continue
+        totals[(t, item)] = item_json.get('meta', {}).get('total')
+        for t2, facet in probeFacets.items():
+            if t2 == t or t2 not in targets:
+                continue
+            counts = probeCounts(item_json, facet)
+            if counts is None:
+                continue
+            for item2 in query.parameters[t2]['data']:
+                pairs[frozenset([(t, item), (t2, item2)])] = counts.get(facetKey(item2), 0)
+
+    keep = []
+    expected = []
+    for i, p in enumerate(query.param_List):
+        items = list(zip(targets, p))
+        known = [totals[x] for x in items if totals.get(x) is not None]
+        known += [pairs[k] for k in map(frozenset, itertools.combinations(items, 2)) if k in pairs]
+        if len(known) > 0 and min(known) == 0:
+            continue
+        keep.append(i)
+        expected.append(min(known) if len(known) > 0 else None)
+
+    return (keep, expected, len(probes))
+
+
+def affiliationPattern(affiliation:str)-> re.Pattern:
+    '''
+        Pattern matching the affiliations facet titles of the wildcard query of an affiliation (*Aalto*University*)
+    '''
+    return re.compile('.*'.join(re.escape(x) for x in affiliation.split()), re.IGNORECASE)
+
+
+def resolveAffiliations(query,                          # FacetQuery with affiliations
+                        retrieveMetadata,               # function returning the DataCite response for a URL (or None)
+                        batchSize:int = 50,             # affiliations combined in one query
+                        workers:int = 1,                # number of concurrent probe retrievals
+                        metrics = None                  # run metrics (RunMetrics)
+                        )-> tuple:                      # ({affiliation: response or None}, probes)
+    '''
+        Find the affiliations that have records with queries for batches of affiliations combined with OR
+        (affiliationsParameter) instead of one query for each affiliation.
+
+        A batch without records shows that none of its affiliations have records. In a batch with records,
+        the affiliations that match a title of the affiliations facet of the response have records, and the
+        other affiliations are probed again as one batch. Batches without matching titles are split in half
+        until they are single affiliation queries. Affiliations are only dropped when a query shows that they
+        have no records, so failed or inconclusive probes keep them.
+
+        Returns the affiliations with records (in query order) with the response of their single affiliation
+        query (None if they were found by the facet or a probe failed) and the number of probes.
+    '''
+    affiliations = query.parameters['affiliations']['data']
+    pending = [affiliations[i:i+batchSize] for i in range(0, len(affiliations), batchSize)]
+    found = {}
+    probes = 0
+    while len(pending) > 0:
+        URLs = [query.apiURL + '?&page[size]=1&' + affiliationsParameter(query.parameters, batch) for batch in pending]
+        responses = retrieveResponses(URLs, retrieveMetadata, workers, metrics)
+        probes += len(URLs)
+
+        nextBatches = []
+        for batch, item_json in zip(pending, responses):
+            if item_json is None:                   # unknown, the affiliations are kept
+                found.update((x, None) for x in batch)
+                continue
+            meta = item_json.get('meta', {})
+            if meta.get('total') == 0:              # none of the affiliations have records
+                continue
+            if len(batch) == 1:
+                found[batch[0]] = item_json
+                continue
+
+            titles = [d['title'] for d in meta.get('affiliations') or [] if d.get('count', 0) > 0]
+            matched = {x for x in batch if any(affiliationPattern(x).search(t) for t in titles)}
+            found.update((x, None) for x in matched)
+            rest = [x for x in batch if x not in matched]
+            if len(matched) == 0:
+                nextBatches += [batch[:(len(batch) + 1) // 2], batch[(len(batch) + 1) // 2:]]
+            elif len(rest) > 0:
+                nextBatches.append(rest)
+        pending = nextBatches
+
+    return ({x: found[x] for x in affiliations if x in found}, probes)
+
+
+def facetEntry(values:list,                             # facet values [{id, title, count}]
+               item:str                                 # item, e.g. Dataset or 2020
+               )-> dict:
+    '''
+        The facet value for an item (matched by facetKey) or None
+    '''
+    for d in values or []:
+        if facetKey(item) in (facetKey(d['id']), facetKey(d['title'])):
+            return d
+    return None
+
+
+def deriveQueries(query,                                # FacetQuery
+                  retrieveMetadata,                     # function returning the DataCite response for a URL (or None)
+                  workers:int = 1,                      # number of concurrent retrievals
+                  metrics = None                        # run metrics (RunMetrics)
+                  )-> tuple:                            # ({parameters: (numberOfRecords, None, facet values)}, broader queries)
+    '''
+        Read queries from the facets of broader queries instead of retrieving them.
+
+        A query can be derived when every facet in the facetList is the facet of one of its resource
+        type or year parameters (resourceTypes, registered), e.g. the registered facet of Dataset in
+        the year queries of Dataset. These facets have a single value, the number of records of the
+        query, which is the count of the item in the facet of the broader query without that parameter
+        (resource-type-id=Dataset for resource-type-id=Dataset&registered=2020). Every query drops the
+        same target (the one with the most items) so the broader queries are shared, and counts are only
+        used when the facet of the broader query includes all of its records. Single target queries
+        (e.g. --years -fl registered) are not derived: their broader query would be all DOIs, whose
+        registered and resourceTypes facets do not include all of the items.
+
+        Queries that cannot be derived are not returned and are retrieved as usual.
+    '''
+    facetList = set(query.facetList)
+    dimensions = []                                 # (parameters, URL, {target: item}) of the derivable queries
+    for URL, p in query.queries():
+        t = queryTargets(URL, p)
+        if facetList <= {probeFacets[x] for x in t if x in probeFacets}:
+            dimensions.append((p, URL, t))
+    if len(dimensions) == 0:
+        return ({}, 0)
+
+    items = {x: set() for x in probeFacets}
+    for p, URL, t in dimensions:
+        for x in t:
+            if x in probeFacets:
+                items[x].add(t[x])
+    dropOrder = sorted(probeFacets, key=lambda x: len(items[x]), reverse=True)
+
+    cells = []                                      # (parameters, broader URL, dropped target, {target: item})
+    for p, URL, t in dimensions:
+        if len(t) < 2:                              # the broader query would be all DOIs, its facets are truncated
+            continue
+        dropped = [x for x in dropOrder if x in t][0]
+        drop = urlParameter(query.parameters, dropped, t[dropped])
+        base, urlParameters = URL.split('?', 1)
+        broader = base + '?' + '&'.join(x for x in urlParameters.split('&') if x != drop)
+        cells.append((p, broader, dropped, t))
+
+    broaderURLs = list(dict.fromkeys(c[1] for c in cells))
+    if len(cells) == 0 or len(broaderURLs) >= len(cells):          # nothing to save
+        return ({}, 0)
+
+    responses = dict(zip(broaderURLs, retrieveResponses(broaderURLs, retrieveMetadata, workers, metrics)))
+
+    derived = {}
+    for p, broader, dropped, t in cells:
+        item_json = responses[broader]
+        if item_json is None:
+            continue
+        counts = probeCounts(item_json, probeFacets[dropped])
+        if counts is None:                          # incomplete facet, the query is retrieved
+            continue
+        numberOfRecords = counts.get(facetKey(t[dropped]), 0)
+        if numberOfRecords == 0:
+            derived[tuple(p)] = (0, None, None)
+            continue
+
+        facetValues = {}
+        for x in t:
+            if x in probeFacets and probeFacets[x] in facetList:
+                d = facetEntry(item_json['meta'].get(probeFacets[x]), t[x])
+                if d is None:
+                    break
+                facetValues[probeFacets[x]] = [{'id': d['id'], 'title': d['title'], 'count': numberOfRecords}]
+        else:
+            derived[tuple(p)] = (numberOfRecords, None, {f: facetValues[f] for f in query.facetList})
+
+    return (derived, len(broaderURLs))
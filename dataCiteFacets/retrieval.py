@@ -0,0 +1,432 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import datetime
+import threading
+import collections
+import email.utils
+from concurrent.futures import Future
+
+import requests
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+closedYearTTL = 30 * 24.0                               # hours cached responses of closed registration years are used
+
+
+class TokenBucket:
+    '''
+        Thread-safe token bucket used to keep requests under the DataCite API quota.
+
+        Tokens are added at rate per second up to capacity. acquire() blocks until a token
+        is available. The rate is halved by throttle() when DataCite answers 429 and grows
+        back towards maxRate with each successful request (recover()).
+    '''
+    def __init__(self,
+                 rate:float,                            # requests per second
+                 capacity:int):                         # maximum burst size
+        self.maxRate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        with self.lock:
+            self.rate = max(self.maxRate / 16, self.rate / 2)
+            self.tokens = 0
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.maxRate, self.rate * 1.05)
+
+
+def createSession(poolSize:int                          # maximum number of pooled connections
+                  )-> requests.Session:
+    '''
+        Create the requests session shared by all retrievals so connections (and TLS handshakes)
+        are reused across queries.
+    '''
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept': 'application/vnd.api+json'})
+    return session
+
+
+def retryDelay(attempt:int,                             # retry attempt (0 based)
+               response:requests.models.Response,       # response with Retry-After header (or None)
+               backoff:float,                           # base delay in seconds
+               backoffMax:float                         # maximum delay in seconds
+               )-> float:
+    '''
+        Seconds to wait before the next attempt: the Retry-After header if DataCite sent one,
+        otherwise exponential backoff with full jitter. The delay is never longer than backoffMax.
+    '''
+    if response is not None and 'Retry-After' in response.headers:
+        retryAfter = response.headers['Retry-After']
+        try:
+            return min(max(0.0, float(retryAfter)), backoffMax)
+        except ValueError:
+            try:
+                retryDate = email.utils.parsedate_to_datetime(retryAfter)
+                return min(max(0.0, (retryDate - datetime.datetime.now(retryDate.tzinfo)).total_seconds()), backoffMax)
+            except (TypeError, ValueError):
+                pass
+
+    return random.uniform(0, min(backoffMax, backoff * 2 ** attempt))
+
+
+class ResponseCache:
+    '''
+        On-disk cache of DataCite responses keyed by the sha256 of the query URL.
+
+        Each entry is one json file (cacheDirectory/ab/abcd....json) holding the URL, the retrieval
+        time, the ETag and Last-Modified headers and the response body. Entries are fresh for the
+        TTL given by cacheTTL(), stale entries are revalidated with If-None-Match/If-Modified-Since
+        and the least recently used entries are evicted when a write takes the cache past maxBytes.
+
+        The size of the cache is measured once (at the first write) and then tracked as entries are
+        written, so the cache directory is only walked again when entries have to be evicted.
+    '''
+    evictTo = 0.9                                       # evict() removes entries until the cache is below evictTo * maxBytes
+
+    def __init__(self,
+                 cacheDirectory:str,                    # cache location
+                 maxBytes:int):                         # size cap
+        self.cacheDirectory = cacheDirectory
+        self.maxBytes = maxBytes
+        self.cacheBytes = None                          # size of the entries (None = not measured yet)
+        self.lock = threading.Lock()
+        os.makedirs(cacheDirectory, exist_ok=True)
+
+    def path(self, URL:str)-> str:
+        key = hashlib.sha256(URL.encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDirectory, key[:2], key + '.json')
+
+    def get(self, URL:str)-> dict:
+        '''
+            Return the cache entry for URL (or None) and mark it as recently used
+        '''
+        entryFile = self.path(URL)
+        try:
+            with open(entryFile, encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(entryFile)                         # mtime tracks last use for LRU eviction
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == URL else None
+
+    def put(self, URL:str, response:requests.models.Response):
+        entry = {'url': URL,
+                 'retrieved': time.time(),
+                 'etag': response.headers.get('ETag'),
+                 'lastModified': response.headers.get('Last-Modified'),
+                 'body': response.text}
+        self.write(URL, entry)
+
+    def revalidated(self, URL:str, entry:dict):
+        '''
+            Restart the TTL of an entry after a 304 Not Modified response
+        '''
+        entry['retrieved'] = time.time()
+        self.write(URL, entry)
+
+    def write(self, URL:str, entry:dict):
+        entryFile = self.path(URL)
+        os.makedirs(os.path.dirname(entryFile), exist_ok=True)
+        tmpFile = f'{entryFile}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmpFile, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = os.path.getsize(tmpFile)
+        with self.lock:
+            if self.cacheBytes is None:
+                self.cacheBytes = sum(e[1] for e in self.entries())
+            try:
+                self.cacheBytes -= os.path.getsize(entryFile)   # replaced entry
+            except OSError:
+                pass
+            os.replace(tmpFile, entryFile)              # atomic, so concurrent readers never see partial entries
+            self.cacheBytes += size
+            if self.cacheBytes > self.maxBytes:
+                self.evict()
+
+    def entries(self)-> list:
+        '''
+            (last use, size, file) of every entry in the cache directory
+        '''
+        entries = []
+        for root, dirs, files in os.walk(self.cacheDirectory):
+            for name in files:
+                if name.endswith('.json'):
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except OSError:                     # removed by another process
+                        continue
+                    entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        return entries
+
+    def evict(self):
+        '''
+            Remove least recently used entries until the cache is smaller than evictTo * maxBytes, so the
+            next writes do not evict again (called by write() with the lock held)
+        '''
+        entries = self.entries()
+        cacheBytes = sum(e[1] for e in entries)
+        evicted = 0
+        for mtime, size, entryFile in sorted(entries):
+            if cacheBytes <= self.evictTo * self.maxBytes:
+                break
+            try:
+                os.remove(entryFile)
+            except OSError:
+                pass
+            cacheBytes -= size
+            evicted += 1
+        self.cacheBytes = cacheBytes
+        lggr.info(f'Response cache: {len(entries) - evicted} entries {cacheBytes / 1e6:.1f} MB ({evicted} evicted)')
+
+
+def cacheTTL(URL:str,                                   # DataCite API URL
+             ttlHours:float,                            # cache time to live for open queries
+             year:int                                   # current year
+             )-> float:                                 # seconds
+    '''
+        Time to live for a cached response. Queries limited to a closed registration year
+        (registered=YYYY before the current year) rarely change (late updates of the metadata) and are
+        cached for closedYearTTL hours (at least ttlHours), all others for ttlHours.
+    '''
+    m = re.search(r'registered=([0-9]{4})(?:&|$)', URL)
+    if m and int(m.group(1)) < year:
+        return max(closedYearTTL, ttlHours) * 3600
+    return ttlHours * 3600
+
+
+def cachedResponse(URL:str,                             # DataCite API URL
+                   entry:dict                           # cache entry
+                   )-> requests.models.Response:
+    '''
+        Build a response object from a cache entry so callers can use it like a retrieved response
+    '''
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = URL
+    response.encoding = 'utf-8'
+    response._content = entry['body'].encode('utf-8')
+    return response
+
+
+class MemoryCache:
+    '''
+        In-memory LRU cache of responses for long-running processes (--serve) and jobs (--job). Responses
+        are kept for the cacheTTL of their URL. Identical concurrent retrievals are coalesced: the first
+        retrieval of a URL goes upstream and the others wait for its response.
+
+        When the uses of the URLs are known (expectUses), a response is dropped after its last use.
+    '''
+    def __init__(self,
+                 size:int = 1000,                       # maximum number of responses
+                 ttlHours:float = 12.0):                # hours responses are used (closedYearTTL for closed registration years)
+        self.size = size
+        self.ttlHours = ttlHours
+        self.entries = collections.OrderedDict()        # URL: (retrieved, response), least recently used first
+        self.inflight = {}                              # URL: Future of the upstream retrieval
+        self.uses = None                                # URL: remaining uses (None = uses are not counted)
+        self.lock = threading.Lock()
+
+    def expectUses(self,
+                   uses:dict):                          # {URL: number of times the URL will be retrieved}
+        '''
+            Count the uses of the URLs: responses are dropped after their last use, and responses of
+            other URLs are not kept
+        '''
+        with self.lock:
+            self.uses = collections.Counter(uses)
+            for URL in [URL for URL in self.entries if URL not in self.uses]:
+                del self.entries[URL]
+
+    def used(self, URL:str):
+        '''
+            One use of the response of URL, dropped after its last use (called with the lock held)
+        '''
+        if self.uses is None:
+            return
+        self.uses[URL] -= 1
+        if self.uses[URL] <= 0:
+            del self.uses[URL]
+            self.entries.pop(URL, None)
+
+    def get(self,
+            URL:str,                                    # DataCite API URL
+            retrieve,                                   # function retrieving the response for a URL
+            metrics                                     # run metrics (RunMetrics)
+            )-> requests.models.Response:
+        with self.lock:
+            entry = self.entries.get(URL)
+            if entry is not None:
+                ttl = cacheTTL(URL, self.ttlHours, datetime.datetime.now().year)
+                if time.time() - entry[0] < ttl:
+                    self.entries.move_to_end(URL)
+                    metrics.countStatistic('memoryHits')
+                    self.used(URL)
+                    return entry[1]
+                del self.entries[URL]
+            future = self.inflight.get(URL)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[URL] = future
+
+        if not leader:                                  # the same URL is being retrieved
+            metrics.countStatistic('coalesced')
+            response = future.result()
+            with self.lock:
+                self.used(URL)
+            return response
+
+        response = None
+        try:
+            response = retrieve(URL)
+        finally:
+            with self.lock:
+                del self.inflight[URL]
+                if response is not None:
+                    self.entries[URL] = (time.time(), response)
+                    self.used(URL)
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+            future.set_result(response)                 # failed retrievals (None or an exception) are not cached
+        return response
+
+
+class Retriever:
+    '''
+        Retrieve DataCite responses through a shared session, rate limiter and response cache.
+        The retrieval statistics and HTTP stage times are added to metrics (RunMetrics).
+    '''
+    def __init__(self,
+                 metrics,                               # run metrics (RunMetrics)
+                 workers:int = 1,                       # number of concurrent retrievals
+                 rateLimit:float = 10.0,                # maximum requests per second
+                 retries:int = 5,                       # retries for connection errors, timeouts, 429 and 5xx responses
+                 backoff:float = 1.0,                   # base delay for exponential backoff
+                 backoffMax:float = 60.0,               # maximum delay between retries
+                 connectTimeout:float = 10.0,           # connection timeout in seconds
+                 readTimeout:float = 60.0,              # read timeout in seconds
+                 responseCache:ResponseCache = None,    # response cache (None = no cache)
+                 cacheTTL:float = 12.0,                 # hours cached responses are used without revalidation
+                 refresh:bool = False,                  # revalidate fresh cache entries
+                 memoryCache:MemoryCache = None):       # in-memory LRU cache with coalescing (None = no memory cache)
+        self.metrics = metrics
+        self.session = createSession(max(10, workers))             # shared connection pool for all retrievals
+        self.rateLimiter = TokenBucket(rateLimit, max(1, workers))
+        self.retries = retries
+        self.backoff = backoff
+        self.backoffMax = backoffMax
+        self.timeout = (connectTimeout, readTimeout)
+        self.responseCache = responseCache
+        self.cacheTTL = cacheTTL
+        self.refresh = refresh
+        self.memoryCache = memoryCache
+        self.year = datetime.datetime.now().year
+
+    def retrieveMetadata(self,
+                         URL:str                        # DataCite API URL
+                         )-> requests.models.Response:  # query response
+        '''
+            retrieve and return DataCite metadata response from URL
+
+            Requests go through the shared session and rate limiter. Connection errors, timeouts, 429 and
+            5xx responses are retried (retries times) with backoff. Returns None if the retrieval fails.
+
+            Fresh responses in the response cache are returned without a request (unless refresh)
+            and stale entries are revalidated with their ETag or Last-Modified date. With a memoryCache,
+            responses are first looked up in memory and concurrent retrievals of a URL are coalesced.
+        '''
+        if self.memoryCache is not None:
+            return self.memoryCache.get(URL, self.retrieveUpstream, self.metrics)
+        return self.retrieveUpstream(URL)
+
+    def retrieveUpstream(self,
+                         URL:str                        # DataCite API URL
+                         )-> requests.models.Response:  # query response
+        '''
+            Retrieve a response from the response cache or DataCite (retrieveMetadata without the memory cache)
+        '''
+        lggr.debug(f"Retrieving Metadata: {URL}")
+        metrics = self.metrics
+
+        entry = None
+        headers = {}
+        if self.responseCache is not None:
+            entry = self.responseCache.get(URL)
+            if entry is not None:
+                ttl = cacheTTL(URL, self.cacheTTL, self.year)
+                if not self.refresh and time.time() - entry['retrieved'] < ttl:
+                    metrics.countStatistic('cacheHits')
+                    return cachedResponse(URL, entry)
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('lastModified'):
+                    headers['If-Modified-Since'] = entry['lastModified']
+
+        for attempt in range(self.retries + 1):
+            with metrics.stageTimer('rate limit wait'):
+                self.rateLimiter.acquire()
+            metrics.countStatistic('requests')
+            response = None
+            try:
+                with metrics.stageTimer('HTTP'):
+                    response = self.session.get(URL, headers=headers, timeout=self.timeout)
+                metrics.countStatistic('bytes', len(response.content))
+                if response.status_code == 429:
+                    metrics.countStatistic('throttles')
+                    self.rateLimiter.throttle()
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.exceptions.HTTPError(f'{response.status_code} response for {URL}', response=response)
+                response.raise_for_status()
+            except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                retryable = response is None or response.status_code == 429 or response.status_code >= 500
+                if retryable and attempt < self.retries:
+                    delay = retryDelay(attempt, response, self.backoff, self.backoffMax)
+                    metrics.countStatistic('retries')
+                    lggr.debug(f'Error: {err} retrying in {delay:.1f} seconds')
+                    with metrics.stageTimer('retry backoff'):
+                        time.sleep(delay)
+                    continue
+                lggr.warning(f'Error: {err}')
+                metrics.countStatistic('failures')
+                return None
+            except (requests.exceptions.TooManyRedirects, requests.exceptions.MissingSchema) as err:
+                lggr.warning(f'Error: {err}')
+                metrics.countStatistic('failures')
+                return None
+
+            self.rateLimiter.recover()
+            if response.status_code == 304 and entry is not None:     # cached response is still current
+                metrics.countStatistic('revalidated')
+                self.responseCache.revalidated(URL, entry)
+                return cachedResponse(URL, entry)
+
+            lggr.debug(f'Response length: {len(response.content)}')
+            if self.responseCache is not None:
+                self.responseCache.put(URL, response)
+            return response
@@ -0,0 +1,620 @@
+from __future__ import annotations
+
+import os
+import json
+import heapq
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING
+
+from .targets import facets, targetParameters, buildQueries, trimURL, countURL, urlParameter, queryTargets, apiURL
+from .metrics import RunMetrics
+from .journal import writeJournalEntry, truncatePartialLine
+from .archive import responseFacets, decodeFacets
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+
+class FacetQuery:
+    '''
+        The queries for a set of targets and items: the query URLs, the query parameters
+        for each URL and the facets to summarize. For example
+
+            FacetQuery(['resources'], itemList=['Dataset', 'Software'], facetList=['clients'])
+
+        Targets are relations, resources, contributors and years. Affiliations are added
+        as a target when affiliationList is given and items add the targets they belong to.
+    '''
+    def __init__(self,
+                 targets:list = (),                     # targets to retrieve (all items of each target)
+                 itemList:list = (),                    # items to retrieve
+                 affiliationList:list = (),             # affiliations to retrieve
+                 minYear:int = 2004,                    # minimum year for year queries
+                 combineQueries:bool = False,           # run all query parameter combinations
+                 facetList:list = None,                 # facets to summarize (default = all)
+                 apiURL:str = apiURL):                  # DataCite API endpoint
+        self.targets = list(targets)
+        if affiliationList and 'affiliations' not in self.targets:
+            self.targets.append('affiliations')
+        years = range(minYear, datetime.datetime.now().year + 1) if 'years' in self.targets else []
+        self.parameters = targetParameters(affiliationList, years)
+
+        for i in itemList:                          # targets can also be listed as items
+            for t in list(self.parameters):         # if only a small number of targets are needed. For example, Workflow
+                if i in self.parameters[t]['data']: # will retrieve data for just Workflow (a resource type)
+                    self.targets.append(t)
+
+        self.itemList = list(itemList)
+        self.affiliationList = list(affiliationList)
+        self.combineQueries = combineQueries
+        self.facetList = list(facetList) if facetList else facets
+        self.apiURL = apiURL
+
+        if len(self.targets) > 0:
+            self.URL_List, self.param_List = buildQueries(self.parameters, self.targets, self.itemList,
+                                                          combineQueries, apiURL)
+        else:
+            self.URL_List, self.param_List = [], []
+
+        self.combinedTargets = []                   # target of each parameter of the combined queries
+        if combineQueries:
+            self.combinedTargets = [t for t in ['relations', 'resources', 'contributors', 'affiliations', 'years']
+                                        if len(self.parameters[t]['data']) > 0]
+        self.expected = None                        # expected number of records of each query (planned queries)
+        self.pruned = 0                             # combinations pruned by the planner
+        self.requestFacets = None                   # facets requested from DataCite (trimURL, None = complete responses)
+
+    def __len__(self):
+        return len(self.URL_List)
+
+    def queries(self):
+        '''
+            (URL, parameters) for every query
+        '''
+        return zip(self.URL_List, self.param_List)
+
+    def requestURL(self,
+                   URL:str                          # query URL
+                   )-> str:                         # URL requested from DataCite
+        '''
+            The query URL, or the smallest response with the requestFacets (trimURL) when they are set
+        '''
+        if self.requestFacets is None:
+            return URL
+        return trimURL(URL, self.requestFacets)
+
+    def prune(self,
+              keep:list,                            # indices of the queries to keep
+              expected:list):                       # expected number of records of the kept queries
+        '''
+            Remove the queries the planner found to be empty
+        '''
+        self.pruned += len(self.URL_List) - len(keep)
+        self.URL_List = [self.URL_List[i] for i in keep]
+        self.param_List = [self.param_List[i] for i in keep]
+        self.expected = expected
+
+    @property
+    def parameterNames(self)-> list:
+        '''
+            Names of the parameter columns of the facet rows
+        '''
+        if len(self.param_List) > 0 and len(self.param_List[0]) > 1:
+            return ['parameter ' + str(i+1) for i in range(len(self.param_List[0]))]
+        return ['parameter']
+
+
+class FacetRun:
+    '''
+        Retrieve the facets for a FacetQuery and summarize them. rows() returns the facet
+        dictionaries (one per query with records) and dataFrame() the same rows as a DataFrame.
+        run() also writes the rows to sinks (CSVRowSink, DatabaseRowSink, FacetValueSink) as
+        the queries complete.
+
+        requests, numpy and pandas are imported when the first query is retrieved.
+    '''
+    def __init__(self,
+                 query:FacetQuery,                      # queries to retrieve
+                 workers:int = 1,                       # number of concurrent retrievals
+                 batchSize:int = 100,                   # queries summarized together by facetStatistics
+                 rateLimit:float = 10.0,                # maximum requests per second
+                 retries:int = 5,                       # retries for connection errors, timeouts, 429 and 5xx responses
+                 backoff:float = 1.0,                   # base delay for exponential backoff
+                 backoffMax:float = 60.0,               # maximum delay between retries
+                 connectTimeout:float = 10.0,           # connection timeout in seconds
+                 readTimeout:float = 60.0,              # read timeout in seconds
+                 cacheDirectory:str = None,             # response cache location (None = no cache)
+                 cacheTTL:float = 12.0,                 # hours cached responses are used without revalidation
+                 cacheSize:float = 1000.0,              # maximum size of the response cache in MB
+                 refresh:bool = False,                  # revalidate fresh cache entries
+                 useID:bool = False,                    # use id instead of title in count strings
+                 jsonDirectory:str = None,              # archive the retrieved json in this directory (None = no json)
+                 journalDirectory:str = None,           # write a run journal to this directory (None = no journal)
+                 runId:str = None,                      # run identifier (default = dateStamp + MMSS)
+                 dateStamp:str = None,                  # datestamp of the run (default = now, YYYYMMDD_HH)
+                 completed:dict = None,                 # results of an earlier run (readJournal) that are not retrieved again
+                 commandLine:str = '',                  # command line arguments for the run report and database
+                 metrics:RunMetrics = None,             # run metrics (default = new RunMetrics)
+                 archiveFile:str = None,                # read the responses from this archive instead of retrieving them
+                 retriever = None):                     # shared Retriever (default = created for the run)
+        current_time = datetime.datetime.now()
+        self.query = query
+        self.workers = workers
+        self.batchSize = batchSize
+        self.retrieverOptions = dict(workers=workers, rateLimit=rateLimit, retries=retries, backoff=backoff,
+                                     backoffMax=backoffMax, connectTimeout=connectTimeout, readTimeout=readTimeout,
+                                     cacheTTL=cacheTTL, refresh=refresh)
+        self.cacheDirectory = cacheDirectory
+        self.cacheSize = cacheSize
+        self.useID = useID
+        self.jsonDirectory = jsonDirectory
+        self.journalDirectory = journalDirectory
+        self.dateStamp = dateStamp or f'{current_time.year}{current_time.month:02d}{current_time.day:02d}_{current_time.hour:02d}'
+        self.runId = runId or f'{self.dateStamp}{current_time.minute:02d}{current_time.second:02d}'
+        self.completed = completed or {}
+        self.derived = {}                           # results read from the facets of broader queries (deriveQueries) or probes
+                                                    # or carried forward from the last snapshot (carryForward)
+        self.carriedFrom = {}                       # {parameters: query_id} of the carried forward queries
+        self.commandLine = commandLine
+        self.metrics = metrics or RunMetrics()
+        self.retriever = retriever
+        self.archive = None                         # ResponseArchive of the run (jsonDirectory)
+        self.archiveFile = archiveFile
+        self.rowCount = 0
+        self.d_list = None
+
+    def createRetriever(self):
+        from .retrieval import Retriever, ResponseCache
+
+        responseCache = None
+        if self.cacheDirectory is not None:
+            responseCache = ResponseCache(self.cacheDirectory, int(self.cacheSize * 1e6))
+        self.retriever = Retriever(self.metrics, responseCache=responseCache, **self.retrieverOptions)
+
+    def retrieveFacets(self,
+                       URL:str,                         # DataCite API URL
+                       p:tuple                          # query parameters for URL
+                       )-> tuple:                       # (numberOfRecords, facet dictionary, facet values)
+        '''
+            Retrieve the DataCite response for one query URL (query.requestURL) and add it to the run archive
+            (jsonDirectory). Without an archive only the total and the facets in facetList are decoded. The facet values
+            are the id/title/count lists from the response for each facet in facetList, the facet dictionary
+            is created later by writeBatch. Returns (numberOfRecords, None, None) for queries with no records
+            and (None, None, None) for failed retrievals.
+        '''
+        requestURL = self.query.requestURL(URL)
+        res = self.retriever.retrieveMetadata(requestURL)  # retrieve metadata from DataCite
+        if res is None:                             # retrieval failed (logged in retrieveMetadata)
+            return (None, None, None)
+        if self.archive is None:                    # only the total and the facets in facetList are decoded
+            with self.metrics.stageTimer('JSON decode'):
+                return decodeFacets(res.content, self.query.facetList)
+
+        with self.metrics.stageTimer('JSON decode'):
+            item_json = res.json()
+        with self.metrics.stageTimer('JSON'):       # add the response to the run archive (jsonDirectory)
+            self.archive.write(requestURL, p, item_json)
+
+        return responseFacets(item_json, self.query.facetList)
+
+    def planQueries(self)-> int:                    # number of pruned combinations
+        '''
+            Prune the combined queries that the single target queries show to be empty (planner.planQueries)
+            and keep the expected sizes of the others so the largest queries are retrieved first.
+        '''
+        from .planner import planQueries
+
+        n = len(self.query)
+        if len(self.query.combinedTargets) < 2:
+            lggr.info('Query plan: no combined queries to plan')
+            return 0
+        if sum(len(self.query.parameters[t]['data']) for t in self.query.combinedTargets) >= n:
+            lggr.info(f'Query plan: {n} combinations, planning would not save requests')
+            return 0
+
+        if self.retriever is None:
+            self.createRetriever()
+        with self.metrics.stageTimer('planning'):
+            keep, expected, probes = planQueries(self.query, self.retriever.retrieveMetadata, self.workers, self.metrics)
+        self.query.prune(keep, expected)
+        lggr.info(f'Query plan: {n} combinations, {probes} probe queries, {n - len(keep)} pruned, {len(keep)} remaining')
+        return n - len(keep)
+
+    def deriveQueries(self)-> int:                  # number of derived queries
+        '''
+            Read the queries that only need resourceTypes and registered counts from the facets of broader
+            queries (planner.deriveQueries). The derived queries are not retrieved.
+        '''
+        from .planner import deriveQueries
+
+        if self.retriever is None:
+            self.createRetriever()
+        with self.metrics.stageTimer('planning'):
+            derived, broader = deriveQueries(self.query, self.retriever.retrieveMetadata, self.workers, self.metrics)
+        self.derived.update(derived)
+        if len(derived) > 0:
+            lggr.info(f'Derived queries: {len(derived)} of {len(self.query)} queries read from the facets of {broader} broader queries')
+        else:
+            lggr.info('Derived queries: no queries can be read from the facets of broader queries')
+        return len(derived)
+
+    def resolveAffiliations(self,
+                            batchSize:int = 50      # affiliations combined in one query
+                            )-> int:                # number of affiliations without records
+        '''
+            Remove the queries of affiliations without records, found with queries for batches of
+            affiliations (planner.resolveAffiliations). The responses of single affiliation probes that
+            are also queries of the run are used as their results instead of retrieving them again.
+        '''
+        from .planner import resolveAffiliations
+
+        affiliations = self.query.parameters['affiliations']['data']
+        if len(affiliations) < 2:
+            return 0
+        if self.retriever is None:
+            self.createRetriever()
+        with self.metrics.stageTimer('planning'):
+            found, probes = resolveAffiliations(self.query, self.retriever.retrieveMetadata, batchSize,
+                                                self.workers, self.metrics)
+
+        keep = []
+        for i, (u,p) in enumerate(self.query.queries()):
+            t = queryTargets(u, p)
+            if 'affiliations' not in t or t['affiliations'] in found:
+                keep.append(i)
+        n = len(self.query)
+        self.query.prune(keep, None)
+        self.query.parameters['affiliations']['data'] = list(found)
+
+        probed = {self.query.apiURL + '?&page[size]=1&' + urlParameter(self.query.parameters, 'affiliations', x): item_json
+                    for x, item_json in found.items() if item_json is not None}
+        for u,p in self.query.queries():
+            if u in probed:                         # single affiliation query retrieved as a probe
+                self.derived[tuple(p)] = responseFacets(probed[u], self.query.facetList)
+
+        lggr.info(f'Affiliations: {len(found)} of {len(affiliations)} affiliations with records ({probes} batch queries), '
+                  f'{n - len(keep)} queries removed')
+        return len(affiliations) - len(found)
+
+    def carryForward(self,
+                     previous:dict                  # last stored results {parameters: (numberOfRecords, query_id, facet values)}
+                     )-> int:                       # number of carried forward queries
+        '''
+            Incremental run: retrieve only the total of each query (countURL: no records and no facet
+            aggregations) and compare it with the last snapshot (sinks.readSnapshot). Queries with the same total carry the
+            facet values of the snapshot forward, queries with no records are complete and only the changed
+            queries are retrieved with their facets.
+        '''
+        from .planner import retrieveResponses
+
+        if self.retriever is None:
+            self.createRetriever()
+        pending = self.pendingQueries()
+        with self.metrics.stageTimer('planning'):
+            responses = retrieveResponses([countURL(u) for u,p in pending],
+                                          self.retriever.retrieveMetadata, self.workers, self.metrics)
+
+        carried = empty = 0
+        for (u,p), item_json in zip(pending, responses):
+            if item_json is None:                   # retrieved with the facets
+                continue
+            total = item_json.get('meta', {}).get('total')
+            if total == 0:
+                self.derived[tuple(p)] = (0, None, None)
+                empty += 1
+            elif tuple(p) in previous and previous[tuple(p)][0] == total:
+                numberOfRecords, queryId, facetValues = previous[tuple(p)]
+                self.derived[tuple(p)] = (numberOfRecords, None, {f: facetValues[f] for f in self.query.facetList if f in facetValues})
+                self.carriedFrom[tuple(p)] = queryId
+                carried += 1
+
+        lggr.info(f'Incremental run: {carried} unchanged queries carried forward, {empty} without records, '
+                  f'{len(pending) - carried - empty} retrieved')
+        return carried
+
+    def pendingQueries(self)-> list:
+        '''
+            (URL, parameters) of the queries run() retrieves: the queries that are not completed or derived
+        '''
+        return [(u,p) for u,p in self.query.queries() if tuple(p) not in self.completed and tuple(p) not in self.derived]
+
+    def retrieveAllFacets(self,
+                          URL_List:list,                # DataCite API URLs
+                          param_List:list,              # query parameters for each URL
+                          expected:list = None          # expected number of records of each query (planned queries)
+                          ):
+        '''
+            Generate (URL, parameters, (numberOfRecords, facet dictionary, facet values)) for every query in URL_List.
+
+            With workers > 1 the queries are retrieved concurrently by a bounded thread pool. The results
+            are always generated in URL_List order, so the rows are the same as a serial run. Planned
+            queries are submitted largest first (retrievePlannedFacets) so the slowest queries do not finish the run.
+        '''
+        if self.archiveFile is not None:
+            yield from self.readArchiveFacets(URL_List, param_List)
+            return
+        if self.retriever is None:
+            self.createRetriever()
+        if self.workers > 1 and expected is not None:
+            yield from self.retrievePlannedFacets(URL_List, param_List, expected)
+        elif self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(self.retrieveFacets, URL_List, param_List)
+                yield from zip(URL_List, param_List, results)
+        else:
+            results = map(self.retrieveFacets, URL_List, param_List)
+            yield from zip(URL_List, param_List, results)
+
+    def retrievePlannedFacets(self,
+                              URL_List:list,            # DataCite API URLs
+                              param_List:list,          # query parameters for each URL
+                              expected:list             # expected number of records of each query
+                              ):
+        '''
+            Generate (URL, parameters, result) in URL_List order, retrieving the planned queries with workers
+            threads. Only the queries in a window of workers * 4 queries from the next row are retrieved or held,
+            the largest of them first, so memory does not grow with URL_List. When the generator is closed
+            (an interrupted run or a sink error) the retrievals in progress finish and no new ones are started.
+        '''
+        window = self.workers * 4
+        admitted = []                               # (-expected, index) of the queries in the window that are not submitted
+        futures = {}                                # index: Future of the submitted queries that are not generated
+        nextIndex = 0                               # first query that is not in the window
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for i in range(len(URL_List)):
+                while nextIndex < min(len(URL_List), i + window):
+                    size = float('inf') if expected[nextIndex] is None else expected[nextIndex]
+                    heapq.heappush(admitted, (-size, nextIndex))
+                    nextIndex += 1
+                while True:
+                    running = [f for f in futures.values() if not f.done()]
+                    while len(running) < self.workers and len(admitted) > 0:
+                        j = heapq.heappop(admitted)[1]
+                        futures[j] = executor.submit(self.retrieveFacets, URL_List[j], param_List[j])
+                        running.append(futures[j])
+                    if i in futures and futures[i].done():
+                        break
+                    wait(running, return_when=FIRST_COMPLETED)
+                yield (URL_List[i], param_List[i], futures.pop(i).result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def readArchiveFacets(self,
+                          URL_List:list,                # DataCite API URLs
+                          param_List:list               # query parameters for each URL
+                          ):
+        '''
+            Generate (URL, parameters, result) for every query from the responses in archiveFile (--jout of
+            an earlier run) instead of retrieving them. With workers > 1 the responses are decompressed and
+            parsed by a process pool. Queries that are not in the archive fail like failed retrievals.
+        '''
+        from .archive import ArchiveReader, archiveFacets
+
+        reader = ArchiveReader(self.archiveFile)
+        found = [p for p in param_List if tuple(p) in reader]
+        locations = [reader.index[tuple(p)][:2] for p in found]
+        with self.metrics.stageTimer('archive'):
+            if self.workers > 1 and len(locations) > 0:
+                chunkSize = len(locations) // (self.workers * 4) + 1
+                chunks = [locations[i:i+chunkSize] for i in range(0, len(locations), chunkSize)]
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    results = [result for chunk in executor.map(archiveFacets, [self.archiveFile] * len(chunks),
+                                                                chunks, [self.query.facetList] * len(chunks))
+                                      for result in chunk]
+            else:
+                results = archiveFacets(self.archiveFile, locations, self.query.facetList)
+        results = dict(zip(map(tuple, found), results))
+
+        for u,p in zip(URL_List, param_List):
+            if tuple(p) not in results:
+                lggr.warning(f'Not in archive {self.archiveFile}: {p}')
+            yield (u, p, results.get(tuple(p), (None, None, None)))
+
+    def resumeAllFacets(self):
+        '''
+            Generate the same (URL, parameters, result) sequence as retrieveAllFacets for all queries, taking
+            results for queries in completed from the journal (and derived queries from their broader queries)
+            and retrieving only the remaining queries.
+        '''
+        URL_List, param_List, expected = self.query.URL_List, self.query.param_List, self.query.expected
+        completed = dict(self.derived)
+        completed.update(self.completed)
+        if len(completed) == 0:
+            yield from self.retrieveAllFacets(URL_List, param_List, expected)
+            return
+
+        pending = [i for i,p in enumerate(param_List) if tuple(p) not in completed]
+        if len(self.completed) > 0:
+            lggr.info(f'Resuming run: {len(URL_List) - len(pending)} queries completed, {len(pending)} remaining')
+        retrieved = self.retrieveAllFacets([URL_List[i] for i in pending], [param_List[i] for i in pending],
+                                           None if expected is None else [expected[i] for i in pending])
+
+        for u,p in zip(URL_List, param_List):
+            if tuple(p) in completed:
+                yield (u, p, completed[tuple(p)])
+            else:
+                yield next(retrieved)
+
+    def writeBatch(self,
+                   batch:list,                          # completed queries: (URL, parameters, result)
+                   sinks:list                           # row sinks (csv, database, facet values)
+                   )-> list:
+        '''
+            Create the facet dictionaries for a batch of completed queries and write them to the sinks
+        '''
+        from .statistics import createFacetsDictionaries
+
+        with self.metrics.stageTimer('createFacetsDictionary'):
+            d_list = createFacetsDictionaries(self.query.facetList, [p for u,p,result in batch], self.dateStamp,
+                                              [result[0] for u,p,result in batch], [result[2] for u,p,result in batch],
+                                              self.useID)
+        for (u,p,result), d_dict in zip(batch, d_list):
+            for sink in sinks:
+                with self.metrics.stageTimer(sink.name):
+                    sink.write(u, p, (result[0], d_dict, result[2]))
+        return d_list
+
+    def openJournal(self):
+        '''
+            Open the run journal (journalDirectory/runId.jsonl) for appending and write its header if it is new.
+            The partial last line of an interrupted run is removed first (truncatePartialLine).
+            Returns None without a journalDirectory.
+        '''
+        if self.journalDirectory is None:
+            return None
+        os.makedirs(self.journalDirectory, exist_ok = True)
+        journalFile = self.journalDirectory + '/' + self.runId + '.jsonl'
+        lggr.info(f'Run {self.runId} journal: {journalFile}')
+        if os.path.exists(journalFile):
+            truncatePartialLine(journalFile)
+        journal = open(journalFile, 'a', encoding='utf-8')
+        if journal.tell() == 0:                     # new journal (a resumed run appends to its journal)
+            journal.write(json.dumps({'runId': self.runId, 'dateStamp': self.dateStamp, 'URLs': len(self.query)}) + '\n')
+        return journal
+
+    def harvest(self,
+                harvestDirectory:str,               # directory for the harvest files of the run
+                pageSize:int = 1000                 # records per page (DataCite maximum = 1000)
+                )-> dict:                           # {parameters: harvest state}
+        '''
+            Retrieve the records of every query with cursor pagination (harvest.harvestQuery) into one gzip
+            compressed JSONL file per query (harvestDirectory/parameters.jsonl.gz). With workers > 1 the
+            queries are harvested concurrently, sharing the rate limit; the pages of a query are sequential.
+            Pages are not cached. Interrupted harvests continue from their last cursor when the run is
+            repeated with the same runId (--resume).
+        '''
+        from .retrieval import Retriever
+        from .harvest import harvestQuery
+
+        retriever = Retriever(self.metrics, **self.retrieverOptions)
+        os.makedirs(harvestDirectory, exist_ok = True)
+        lggr.info(f'Run {self.runId} harvest: {harvestDirectory}')
+        journal = self.openJournal()                # header only, so the run can be resumed
+        if journal is not None:
+            journal.close()
+
+        def harvest(URL, p):
+            outputFile = harvestDirectory + '/' + '_'.join(p) + '.jsonl.gz'
+            return harvestQuery(retriever.retrieveMetadata, URL, p, outputFile, self.metrics, pageSize)
+
+        URL_List, param_List = self.query.URL_List, self.query.param_List
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                states = list(executor.map(harvest, URL_List, param_List))
+        else:
+            states = list(map(harvest, URL_List, param_List))
+
+        records = sum(state['records'] for state in states)
+        incomplete = sum(1 for state in states if state['next'] is not None)
+        lggr.info(f'Harvest: {len(states)} queries, {records} records, {incomplete} incomplete')
+        statistics = self.metrics.retrievalStatistics
+        lggr.info('Retrieval statistics: ' + ' '.join(f'{k}: {statistics[k]}' for k in ['requests','retries','throttles','failures']))
+        return {tuple(p): state for p, state in zip(param_List, states)}
+
+    def closeOutputs(self,
+                     journal,                           # run journal (or None)
+                     sinks:list,                        # row sinks of the run
+                     complete:bool):                    # False if the run was interrupted
+        '''
+            Close the journal, the response archive and the sinks of a run. Sinks of an interrupted run are
+            closed with abort() if they have one (DatabaseRowSink leaves the run incomplete), and errors are
+            logged so the error that interrupted the run is raised.
+        '''
+        if journal is not None:
+            journal.close()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        for sink in sinks:
+            with self.metrics.stageTimer(sink.name):
+                if complete:
+                    sink.close()
+                    continue
+                try:
+                    getattr(sink, 'abort', sink.close)()
+                except Exception:
+                    lggr.exception(f'{sink.name} output of the interrupted run {self.runId} was not closed')
+
+    def run(self,
+            sinks:list = (),                            # row sinks written as the queries complete
+            keepRows:bool = True                        # keep the rows (needed for rows() and dataFrame())
+            )-> list:                                   # facet dictionaries (empty if keepRows is False)
+        '''
+            Retrieve all queries, write the journal entries and the sinks and return the facet dictionaries.
+            Queries that fail or have no records are not included in the rows. The journal, the archive and
+            the sinks are closed when the run completes or is interrupted (closeOutputs).
+        '''
+        d_list = []
+        batch = []                                  # completed queries waiting for facet statistics
+        journal = None
+        complete = False
+        try:
+            journal = self.openJournal()
+            if self.jsonDirectory is not None:      # all responses of the run in one compressed archive
+                from .archive import ResponseArchive
+                os.makedirs(self.jsonDirectory, exist_ok = True)
+                archiveFile = self.jsonDirectory + '/DataCite_' + self.runId + '.jsonl.gz'
+                lggr.info(f'json output to {archiveFile}')
+                self.archive = ResponseArchive(archiveFile)
+
+            for u,p,result in self.resumeAllFacets():   # results arrive in URL_List order
+                numberOfRecords = result[0]
+                if numberOfRecords is None:
+                    lggr.warning(f'Failed URL: {u} Parameters: {p}')
+                    continue
+
+                if journal is not None and tuple(p) not in self.completed:      # checkpoint each completed query
+                    writeJournalEntry(journal, p, u, result)
+
+                if numberOfRecords == 0:
+                    lggr.info(f'Count: {self.rowCount} URL: {u} Parameters: {p} Number of records: {numberOfRecords}')
+                    continue
+
+                self.rowCount += 1
+                lggr.info(f'Count: {self.rowCount} URL: {u} Parameters: {p} Number of records: {numberOfRecords}')
+
+                batch.append((u, p, result))
+                if len(batch) >= self.batchSize:
+                    rows = self.writeBatch(batch, sinks)
+                    if keepRows:
+                        d_list.extend(rows)
+                    batch = []
+
+            rows = self.writeBatch(batch, sinks)
+            if keepRows:
+                d_list.extend(rows)
+            complete = True
+        finally:                                    # an interrupted run closes its outputs too
+            self.closeOutputs(journal, sinks, complete)
+
+        statistics = self.metrics.retrievalStatistics
+        lggr.info('Retrieval statistics: ' + ' '.join(f'{k}: {statistics[k]}' for k in ['requests','retries','throttles','failures','cacheHits','revalidated']))
+
+        self.d_list = d_list
+        return d_list
+
+    def rows(self)-> list:
+        '''
+            The facet dictionaries of the run (the queries are retrieved by the first call)
+        '''
+        if self.d_list is None:
+            self.run()
+        return self.d_list
+
+    def dataFrame(self)-> pd.DataFrame:
+        '''
+            The facet dictionaries of the run as a DataFrame
+        '''
+        import pandas as pd
+        return pd.DataFrame(self.rows())
+
+    def report(self)-> dict:
+        '''
+            The machine-readable report of the run (RunMetrics.report())
+        '''
+        return self.metrics.report(self.runId, self.dateStamp, self.commandLine, len(self.query), self.rowCount)
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .run import FacetQuery, FacetRun
+from .targets import apiURL, parameters, facets
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+listArguments = ['targets', 'itemList', 'affiliationList', 'facetList']
+
+
+def queryArguments(query:str                            # request query string
+                   )-> dict:                            # FacetQuery arguments
+    '''
+        FacetQuery arguments from a request query string, e.g.
+        targets=resources&facetList=clients,registered or itemList=Dataset&itemList=Software&combineQueries=true.
+        Lists are repeated or comma separated parameters (affiliations are only separated by repeating them).
+        Raises ValueError for unknown parameters, targets, items and facets.
+    '''
+    arguments = {}
+    for name, values in urllib.parse.parse_qs(query).items():
+        if name == 'affiliationList':
+            arguments[name] = values
+        elif name in listArguments:
+            arguments[name] = [x for v in values for x in v.split(',') if x]
+        elif name == 'minYear':
+            arguments[name] = int(values[-1])
+        elif name == 'combineQueries':
+            arguments[name] = values[-1].lower() in ('true', '1', 'yes')
+        else:
+            raise ValueError(f'Unknown parameter {name}')
+
+    unknown = [t for t in arguments.get('targets', []) if t not in parameters]
+    if unknown:
+        raise ValueError(f'Unknown targets {unknown}, use {list(parameters)}')
+    items = {x for t in ['relations', 'resources', 'contributors'] for x in parameters[t]['data']}
+    unknown = [x for x in arguments.get('itemList', []) if x not in items]
+    if unknown:
+        raise ValueError(f'Unknown items {unknown}, use relation, resource or contributor types')
+    unknown = [f for f in arguments.get('facetList', []) if f not in facets]
+    if unknown:
+        raise ValueError(f'Unknown facets {unknown}, use {facets}')
+    return arguments
+
+
+def jsonValue(value):
+    '''
+        json value of the numpy numbers in the facet rows
+    '''
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class FacetServiceHandler(BaseHTTPRequestHandler):
+    '''
+        GET /facets?targets=...&itemList=...&facetList=... returns the facet rows (createFacetsDictionary)
+        of the queries as json: {"targets": [...], "queries": n, "rows": [...]}.
+        GET /stats returns the retrieval statistics of the service. Invalid requests get a 400 and
+        unexpected errors a 500 response with {"error": ...}.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        with server.lock:
+            server.requestCount += 1
+
+        if url.path == '/stats':
+            self.sendJSON(200, {'requests': server.requestCount,
+                                'memoryCache': len(server.retriever.memoryCache.entries) if server.retriever.memoryCache else 0,
+                                'retrieval': dict(server.retriever.metrics.retrievalStatistics)})
+            return
+        if url.path != '/facets':
+            self.sendJSON(404, {'error': f'Unknown path {url.path}, use /facets or /stats'})
+            return
+
+        try:
+            self.sendFacets(url.query)
+        except Exception as err:                    # answer instead of closing the connection of the client
+            lggr.exception(f'Facet service error for {self.path}')
+            self.sendJSON(500, {'error': f'{type(err).__name__}: {err}'})
+
+    def sendFacets(self,
+                   queryString:str):                # request query string
+        '''
+            Run the queries of a /facets request and send their facet rows
+        '''
+        server = self.server
+        try:
+            arguments = queryArguments(queryString)
+            query = FacetQuery(apiURL=server.apiURL, **arguments)
+        except ValueError as err:
+            self.sendJSON(400, {'error': str(err)})
+            return
+        if len(query.targets) == 0:
+            self.sendJSON(400, {'error': 'No targets specified'})
+            return
+
+        run = FacetRun(query, workers=server.workers, batchSize=server.batchSize, useID=server.useID,
+                       retriever=server.retriever, metrics=server.retriever.metrics)
+        self.sendJSON(200, {'targets': query.targets, 'queries': len(query), 'rows': run.rows()})
+
+    def sendJSON(self, status:int, content:dict):
+        body = json.dumps(content, ensure_ascii=False, default=jsonValue).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        lggr.debug(format % args)
+
+
+def createService(port:int,                             # port (0 = any free port)
+                  retriever,                            # Retriever shared by all requests (with a MemoryCache)
+                  workers:int = 1,                      # concurrent retrievals for each request
+                  batchSize:int = 100,                  # queries summarized together by facetStatistics
+                  useID:bool = False,                   # use id instead of title in count strings
+                  apiURL:str = apiURL,                  # DataCite API endpoint
+                  host:str = '127.0.0.1'                # interface
+                  )-> ThreadingHTTPServer:
+    '''
+        Create the facet service. Every request is handled in its own thread and all requests share the
+        retriever: one connection pool and rate limit, and with a MemoryCache the recent responses and the
+        coalescing of identical concurrent queries. Start it with serve_forever().
+    '''
+    server = ThreadingHTTPServer((host, port), FacetServiceHandler)
+    server.daemon_threads = True
+    server.retriever = retriever
+    server.workers = workers
+    server.batchSize = batchSize
+    server.useID = useID
+    server.apiURL = apiURL
+    server.requestCount = 0
+    server.lock = threading.Lock()
+    return server
@@ -0,0 +1,464 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+
+from .targets import queryTargets, facetStatisticNames
+
+
+def connectToDataCiteDatabase():
+    '''
+       make connection to sqlite database, a file defined as an environment variable
+    '''
+    database = os.environ['DATACITE_STATISTICS_DATABASE']       # environment defines database location
+    con = sqlite3.connect(database)
+    cur = con.cursor()
+    return(con,cur)
+
+
+class CSVRowSink:
+    '''
+        Write facet rows to a csv file as they are created
+    '''
+    name = 'CSV'
+
+    def __init__(self,
+                 outputFile:str,                        # csv file name
+                 columns:list):                         # column schema (facetColumns)
+        self.f = open(outputFile, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.f, fieldnames=columns, restval='', extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, URL:str, p:tuple, result:tuple):
+        self.writer.writerow(result[1])
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class FacetValueSink:
+    '''
+        Collect the facet values of a run (parameters, facet, id, title, count) as a long table.
+        frame() returns it as a DataFrame with categorical parameters, facets and ids and int64 counts.
+    '''
+    name = 'facetdata'
+
+    def __init__(self,
+                 parameterNames:list):                  # names of the parameter columns
+        self.parameterNames = parameterNames
+        self.columns = {c: [] for c in parameterNames + ['facet', 'id', 'title', 'count']}
+        self.queryParameters = []
+
+    def write(self, URL:str, p:tuple, result:tuple):
+        self.queryParameters.append(list(p))
+        for f, l in (result[2] or {}).items():
+            for name, item in zip(self.parameterNames, p):
+                self.columns[name].extend([item] * len(l))
+            self.columns['facet'].extend([f] * len(l))
+            self.columns['id'].extend([d['id'] for d in l])
+            self.columns['title'].extend([d['title'] for d in l])
+            self.columns['count'].extend([d['count'] for d in l])
+
+    def close(self):
+        pass
+
+    def frame(self):
+        import pandas as pd
+        df = pd.DataFrame(self.columns)
+        for c in self.parameterNames + ['facet', 'id']:
+            df[c] = df[c].astype('category')
+        df['count'] = df['count'].astype('int64')
+        return df
+
+    def queries(self):
+        '''
+            The parameters of every query written to the sink (one row per query)
+        '''
+        import pandas as pd
+        return pd.DataFrame(self.queryParameters, columns=self.parameterNames, dtype=str)
+
+
+class ParquetSink:
+    '''
+        Store the summary rows and the facet values of a run as typed Parquet datasets (directory/summary and
+        directory/facet_values) partitioned by dateStamp and target, e.g.
+
+            summary/dateStamp=20240101_06/target=relations_resources/20240101_061530.parquet
+
+        The target partition is the combination of the targets of a query. Every run adds its own files, so
+        runs accumulate in the same datasets and can be read with partition filters by pandas or DuckDB:
+
+            pd.read_parquet(directory + '/summary', filters=[('target', '=', 'resources')])
+
+        Requires the pyarrow package.
+    '''
+    name = 'Parquet'
+    targetNames = ['relations', 'resources', 'contributors', 'affiliations', 'years']
+
+    def __init__(self,
+                 directory:str,                         # dataset directory
+                 runId:str,                             # run identifier
+                 dateStamp:str,                         # datestamp of the run
+                 facetList:list,                        # facets of the run
+                 batchSize:int = 100000):               # rows per row group
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.directory = directory
+        self.runId = runId
+        self.dateStamp = dateStamp
+        self.facetList = facetList
+        self.batchSize = batchSize
+
+        keys = [pa.field('runId', pa.string())] + [pa.field(t, pa.string()) for t in self.targetNames]
+        types = {'number': pa.int64(), 'max': pa.int64(), 'common': pa.string(), 'total': pa.int64()}
+        fields = keys + [pa.field('NumberOfRecords', pa.int64())]
+        for f in facetList:
+            fields += [pa.field(f + '_' + statistic, types.get(statistic, pa.float64())) for statistic in facetStatisticNames]
+            fields.append(pa.field(f, pa.string()))
+        self.schemas = {'summary': pa.schema(fields),
+                        'facet_values': pa.schema(keys + [pa.field('facet', pa.string()), pa.field('id', pa.string()),
+                                                          pa.field('title', pa.string()), pa.field('count', pa.int64())])}
+        self.buffers = {}                               # (dataset, target): {column: values}
+        self.writers = {}                               # (dataset, target): ParquetWriter
+
+        for runFile in parquetRunFiles(directory, runId, dateStamp):     # files of an earlier attempt of this run (--resume)
+            os.remove(runFile)
+
+    def append(self, dataset:str, target:str, row:dict):
+        key = (dataset, target)
+        buffer = self.buffers.setdefault(key, {name: [] for name in self.schemas[dataset].names})
+        for name, values in buffer.items():
+            values.append(row.get(name))
+        if len(buffer['runId']) >= self.batchSize:
+            self.flush(key)
+
+    def write(self, URL:str, p:tuple, result:tuple):
+        numberOfRecords, d_dict, facetValues = result
+        t = queryTargets(URL, p)
+        target = '_'.join(x for x in self.targetNames if x in t)
+        keys = dict(t, runId=self.runId)
+        self.append('summary', target, dict(d_dict, NumberOfRecords=numberOfRecords, **keys))
+        for f, l in (facetValues or {}).items():
+            for d in l:
+                self.append('facet_values', target, dict(keys, facet=f, id=d['id'], title=d['title'], count=d['count']))
+
+    def flush(self, key:tuple):
+        dataset, target = key
+        buffer = self.buffers.pop(key, None)
+        if buffer is None:
+            return
+        if key not in self.writers:
+            partition = os.path.join(self.directory, dataset, 'dateStamp=' + self.dateStamp, 'target=' + target)
+            os.makedirs(partition, exist_ok = True)
+            self.writers[key] = self.pq.ParquetWriter(os.path.join(partition, self.runId + '.parquet'), self.schemas[dataset])
+        self.writers[key].write_table(self.pa.Table.from_pydict(buffer, schema=self.schemas[dataset]))
+
+    def close(self):
+        for key in list(self.buffers):
+            self.flush(key)
+        for writer in self.writers.values():
+            writer.close()
+
+
+def parquetRunFiles(directory:str,                      # dataset directory (ParquetSink)
+                    runId:str,                          # run identifier
+                    dateStamp:str                       # datestamp of the run
+                    )-> list:                           # files of the run in the summary and facet_values datasets
+    '''
+        The Parquet files of a run
+    '''
+    runFiles = []
+    for dataset in ['summary', 'facet_values']:
+        partition = os.path.join(directory, dataset, 'dateStamp=' + dateStamp)
+        if os.path.isdir(partition):
+            for target in os.listdir(partition):
+                runFile = os.path.join(partition, target, runId + '.parquet')
+                if os.path.exists(runFile):
+                    runFiles.append(runFile)
+    return runFiles
+
+
+def facetPivot(facet_values_df,                         # long facet values (FacetValueSink.frame())
+               facet:str,                               # facet to pivot
+               parameterNames:list,                     # names of the parameter columns
+               allParameters,                           # parameters of every query (FacetValueSink.queries())
+               useID:bool                               # use id instead of title as column name
+               ):
+    '''
+        Pivot the values of one facet into a table with one row per query and one column per
+        facet value (title or id) containing the counts.
+    '''
+    df = facet_values_df[facet_values_df['facet'] == facet]
+    column = 'id' if useID else 'title'
+    pivot = df.pivot_table(index=parameterNames, columns=column, values='count',
+                           aggfunc='sum', observed=True, sort=False)
+    pivot.columns = pivot.columns.astype(str)
+    pivot.columns.name = None
+    pivot = pivot.astype('Int64')                               # integer counts with missing values
+    return allParameters.merge(pivot.reset_index().astype({c: str for c in parameterNames}),
+                               on=parameterNames, how='left')
+
+
+databaseSchema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    DateTime TEXT NOT NULL,
+    targets TEXT,
+    facets TEXT,
+    commandLine TEXT,
+    complete INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query_id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    parameters TEXT NOT NULL,
+    relations TEXT,
+    resources TEXT,
+    contributors TEXT,
+    affiliations TEXT,
+    years TEXT,
+    URL TEXT,
+    NumberOfRecords INTEGER NOT NULL,
+    carried_from INTEGER REFERENCES queries(query_id)
+);
+CREATE TABLE IF NOT EXISTS facet_values (
+    query_id INTEGER NOT NULL REFERENCES queries(query_id),
+    facet TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_runs (
+    run_id TEXT PRIMARY KEY,
+    DateTime TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_statistics (
+    run_id TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS trend_runs (
+    run_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS trend_series (
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    first REAL,
+    firstDate TEXT,
+    last REAL,
+    lastDate TEXT,
+    snapshots INTEGER,
+    changePoints INTEGER,
+    lastChangePoint TEXT,
+    recentDeltas TEXT,
+    PRIMARY KEY (parameters, statistic)
+);
+CREATE TABLE IF NOT EXISTS trend_deltas (
+    DateTime TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    value REAL,
+    delta REAL,
+    pctChange REAL,
+    changePoint INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS queries_run_parameters ON queries(run_id, parameters);
+CREATE INDEX IF NOT EXISTS queries_parameters ON queries(parameters);
+CREATE INDEX IF NOT EXISTS queries_resources ON queries(resources);
+CREATE INDEX IF NOT EXISTS queries_relations ON queries(relations);
+CREATE INDEX IF NOT EXISTS queries_contributors ON queries(contributors);
+CREATE INDEX IF NOT EXISTS queries_affiliations ON queries(affiliations);
+CREATE INDEX IF NOT EXISTS queries_years ON queries(years);
+CREATE INDEX IF NOT EXISTS facet_values_query_facet ON facet_values(query_id, facet);
+CREATE INDEX IF NOT EXISTS facet_values_facet_id ON facet_values(facet, id);
+CREATE INDEX IF NOT EXISTS snapshot_statistics_run ON snapshot_statistics(run_id);
+CREATE INDEX IF NOT EXISTS trend_deltas_DateTime ON trend_deltas(DateTime);
+'''
+
+
+def enableWAL(cur):
+    '''
+        Switch the database to WAL, so readers do not block the writer of a run. The switch needs an exclusive
+        lock that SQLite does not wait for (the busy timeout), so it is retried while other connections read a
+        new database; a database that cannot be switched stays in rollback journal mode.
+    '''
+    for attempt in range(50):
+        try:
+            if cur.execute('PRAGMA journal_mode=WAL').fetchone()[0] == 'wal':
+                return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+        time.sleep(0.1)
+
+
+def createDatabaseTables(cur):
+    '''
+        Create the database tables and add the columns of newer versions to existing tables in one write
+        transaction, so concurrent runs wait for each other (the busy timeout) instead of failing with
+        "database is locked" when both try to upgrade their read locks
+    '''
+    cur.executescript('BEGIN IMMEDIATE;\n' + databaseSchema)
+    columns = [c[1] for c in cur.execute('PRAGMA table_info(queries)')]
+    if 'carried_from' not in columns:               # databases created before incremental runs
+        cur.execute('ALTER TABLE queries ADD COLUMN carried_from INTEGER REFERENCES queries(query_id)')
+    columns = [c[1] for c in cur.execute('PRAGMA table_info(runs)')]
+    if 'complete' not in columns:                   # databases created before runs were committed in batches
+        cur.execute('ALTER TABLE runs ADD COLUMN complete INTEGER NOT NULL DEFAULT 1')
+    columns = [c[1] for c in cur.execute('PRAGMA table_info(snapshot_runs)')]
+    if 'DateTime' not in columns:                   # databases created before incremental trends
+        cur.execute('ALTER TABLE snapshot_runs ADD COLUMN DateTime TEXT')
+        cur.execute('UPDATE snapshot_runs SET DateTime = (SELECT DateTime FROM runs WHERE runs.run_id = snapshot_runs.run_id)')
+    cur.connection.commit()
+
+
+def readFacetValues(cur,
+                    queryIds:list                       # query_ids with facet values (COALESCE(carried_from, query_id))
+                    )-> dict:                           # {query_id: {facet: [{id, title, count}]}}
+    '''
+        Read the facet values of a list of queries in the order they were stored
+    '''
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS selected_queries (query_id INTEGER PRIMARY KEY)')
+    cur.execute('DELETE FROM selected_queries')
+    cur.executemany('INSERT OR IGNORE INTO selected_queries VALUES (?)', [(q,) for q in queryIds])
+    facetValues = {}
+    for queryId, facet, id_, title, count in cur.execute(
+            'SELECT query_id, facet, id, title, count FROM facet_values JOIN selected_queries USING (query_id) '
+            'ORDER BY facet_values.rowid'):
+        facetValues.setdefault(queryId, {}).setdefault(facet, []).append({'id': id_, 'title': title, 'count': count})
+    return facetValues
+
+
+def storedRun(runId:str                                 # run identifier
+              )-> bool:                                 # True if the run is in the database
+    '''
+        Check whether a run is already in the database (complete or not)
+    '''
+    con, cur = connectToDataCiteDatabase()
+    createDatabaseTables(cur)
+    stored = cur.execute('SELECT 1 FROM runs WHERE run_id = ?', (runId,)).fetchone() is not None
+    con.close()
+    return stored
+
+
+def readSnapshot(param_List:list,                       # query parameters of the run
+                 facetList:list,                        # facets of the run
+                 runId:str                              # run identifier (its own queries are ignored)
+                 )-> dict:                              # {parameters: (numberOfRecords, query_id, facet values)}
+    '''
+        Read the last stored result of each query from the database. Only queries of complete runs
+        that retrieved all of the facets in facetList are used. The last query_id of each query is
+        selected in SQL with the queries_parameters index (which includes the query_id), so only the
+        stored results of the queries in param_List are read. Carried forward queries return the
+        query_id and facet values of the query they were carried from.
+    '''
+    con, cur = connectToDataCiteDatabase()
+    createDatabaseTables(cur)
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS snapshot_parameters (parameters TEXT PRIMARY KEY)')
+    cur.execute('DELETE FROM snapshot_parameters')
+    cur.executemany('INSERT OR IGNORE INTO snapshot_parameters (parameters) VALUES (?)',
+                    ((json.dumps(list(p), ensure_ascii=False),) for p in param_List))
+
+    facetCondition = ''.join(" AND instr(' ' || r.facets || ' ', ?) > 0" for f in facetList)
+    # CROSS JOIN keeps the join order: each query of param_List is looked up in the queries_parameters index
+    latest = {parameters: (numberOfRecords, sourceId) for parameters, numberOfRecords, sourceId in cur.execute(
+        'SELECT parameters, NumberOfRecords, COALESCE(carried_from, query_id) FROM queries WHERE query_id IN '
+        '(SELECT MAX(q.query_id) FROM snapshot_parameters w CROSS JOIN queries q USING (parameters) JOIN runs r USING (run_id) '
+        f'WHERE q.run_id != ? AND r.complete = 1{facetCondition} GROUP BY w.parameters)',
+        [runId] + [' ' + f + ' ' for f in facetList])}
+
+    facetValues = readFacetValues(cur, [v[1] for v in latest.values()])
+    con.close()
+
+    return {tuple(json.loads(parameters)): (numberOfRecords, sourceId, facetValues.get(sourceId, {}))
+                for parameters, (numberOfRecords, sourceId) in latest.items()}
+
+
+class DatabaseRowSink:
+    '''
+        Store the queries and facet values of a run in the normalized database tables
+        (runs, queries, facet_values, see databaseSchema/createTable.sql).
+        Queries carried forward by an incremental run (carriedFrom) only get a queries row that
+        refers to the query with their facet values.
+
+        The run is added with complete = 0 and its rows are inserted and committed in batches
+        (executemany), so the write lock of the database is only held while a batch is written
+        and other processes can write between the batches. close() sets complete = 1. Readers
+        (--incremental, --trends, --diff) ignore incomplete runs, so an interrupted run is
+        never used (--resume writes the complete run again).
+    '''
+    name = 'SQLite'
+
+    def __init__(self,
+                 runId:str,                             # run identifier
+                 dateStamp:str,                         # datestamp of the run
+                 targets:list,                          # targets of the run
+                 facetList:list,                        # facets of the run
+                 commandLine:str = '',                  # command line arguments of the run
+                 carriedFrom:dict = None,               # {parameters: query_id} of carried forward queries
+                 batchSize:int = 1000):                 # facet values per executemany batch
+        self.con, self.cur = connectToDataCiteDatabase()
+        enableWAL(self.cur)
+        createDatabaseTables(self.cur)
+        self.con.commit()
+        self.cur.execute('BEGIN IMMEDIATE')                     # replace the run, it is incomplete until close()
+        self.cur.execute('DELETE FROM facet_values WHERE query_id IN (SELECT query_id FROM queries WHERE run_id = ?)', (runId,))
+        self.cur.execute('DELETE FROM queries WHERE run_id = ?', (runId,))
+        self.cur.execute('DELETE FROM snapshot_statistics WHERE run_id = ?', (runId,))     # trend statistics of the run are recomputed
+        self.cur.execute('DELETE FROM snapshot_runs WHERE run_id = ?', (runId,))
+        self.cur.execute('DELETE FROM trend_runs WHERE run_id = ?', (runId,))               # the trends are recomputed
+        self.cur.execute('INSERT OR REPLACE INTO runs (run_id, DateTime, targets, facets, commandLine, complete) VALUES (?,?,?,?,?,0)',
+                         (runId, dateStamp, ' '.join(sorted(set(targets))), ' '.join(facetList), commandLine))
+        self.con.commit()
+        self.runId = runId
+        self.carriedFrom = carriedFrom if carriedFrom is not None else {}
+        self.batchSize = batchSize
+        self.queryRows = []
+        self.facetRows = []
+
+    def write(self, URL:str, p:tuple, result:tuple):
+        numberOfRecords, d_dict, facetValues = result
+        t = queryTargets(URL, p)
+        carriedFrom = self.carriedFrom.get(tuple(p))
+        self.queryRows.append((self.runId, json.dumps(list(p), ensure_ascii=False),
+                               t.get('relations'), t.get('resources'), t.get('contributors'),
+                               t.get('affiliations'), t.get('years'), URL, numberOfRecords, carriedFrom))
+        if carriedFrom is None:                     # facet values of carried forward queries are stored with the original query
+            queryIndex = len(self.queryRows) - 1
+            for f, l in (facetValues or {}).items():
+                self.facetRows.extend((queryIndex, f, d['id'], d['title'], d['count']) for d in l)
+        if len(self.facetRows) >= self.batchSize or len(self.queryRows) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        '''
+            Insert and commit a batch. The query_ids are assigned in the transaction of the batch,
+            so runs written by other processes at the same time get different query_ids.
+        '''
+        if len(self.queryRows) == 0:
+            return
+        self.cur.execute('BEGIN IMMEDIATE')
+        queryId = self.cur.execute('SELECT COALESCE(MAX(query_id), 0) FROM queries').fetchone()[0] + 1
+        self.cur.executemany('INSERT INTO queries (query_id, run_id, parameters, relations, resources, contributors, affiliations, years, URL, NumberOfRecords, carried_from) '
+                             'VALUES (?,?,?,?,?,?,?,?,?,?,?)', ((queryId + i,) + row for i, row in enumerate(self.queryRows)))
+        self.cur.executemany('INSERT INTO facet_values (query_id, facet, id, title, count) VALUES (?,?,?,?,?)',
+                             ((queryId + row[0],) + row[1:] for row in self.facetRows))
+        self.con.commit()
+        self.queryRows = []
+        self.facetRows = []
+
+    def close(self):
+        self.flush()
+        self.cur.execute('UPDATE runs SET complete = 1 WHERE run_id = ?', (self.runId,))
+        self.con.commit()
+        self.con.close()
+
+    def abort(self):
+        '''
+            Close the database of an interrupted run: the committed batches are kept and the run stays incomplete
+        '''
+        self.con.close()
@@ -0,0 +1,135 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .targets import facetStatisticNames
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+
+def facetStatistics(facet_values_df:pd.DataFrame,       # facet values: query, facet, id, title, count
+                    numberOfRecords:np.ndarray,         # number of records for each query
+                    useID:bool                          # use id instead of title in count strings
+                    )-> pd.DataFrame:
+    '''
+        Compute the statistics for every (query, facet) in a batch with vectorized groupby operations.
+
+        For the facet f of a query the statistics are:
+            number: the number of facet values
+            max: the maximum facet value
+            common: the id of the facet value with the largest count
+            total: the total of all of the facet values
+            HI: the homogeneity index (max / number of records)
+            coverage: the % of all records covered by the facet values (total / number of records)
+            gini: the Gini coefficient of the counts (0 = uniform, 1 = concentrated)
+            entropy: the Shannon entropy of the counts normalized by log(number) (1 = uniform)
+            top3: the share of the total in the three largest values
+            herfindahl: the Herfindahl index (sum of squared shares)
+            countString: the facet titles (ids) and counts written as a title (count) string
+    '''
+    keys = ['query', 'facet']
+    df = facet_values_df
+    counts = df.groupby(keys, sort=False)['count']
+    stats = pd.DataFrame({'number': counts.size(), 'max': counts.max(), 'total': counts.sum()})
+
+    isMax = df['count'] == counts.transform('max')
+    stats['common'] = df[isMax].groupby(keys, sort=False)['id'].agg(', '.join)
+
+    records = numberOfRecords[stats.index.get_level_values('query')]
+    stats['HI'] = stats['max'] / records                              # max/number of records 20220708
+    stats['coverage'] = stats['total'] / records                      # %coverage of top 10 for facet
+
+    total = counts.transform('sum').replace(0, np.nan)
+    share = (df['count'] / total).fillna(0)
+    groups = [df['query'], df['facet']]
+    stats['herfindahl'] = (share ** 2).groupby(groups, sort=False).sum()
+
+    plogp = -share * np.log(share.where(share > 0, 1))
+    entropy = plogp.groupby(groups, sort=False).sum()
+    stats['entropy'] = (entropy / np.log(stats['number'].where(stats['number'] > 1))).fillna(0)
+
+    top = counts.rank(method='first', ascending=False) <= 3
+    stats['top3'] = share.where(top, 0).groupby(groups, sort=False).sum()
+
+    rank = counts.rank(method='first')                              # ascending rank within (query, facet)
+    n = stats['number']
+    weighted = (rank * df['count']).groupby(groups, sort=False).sum()
+    stats['gini'] = (2 * weighted / (n * stats['total'].replace(0, np.nan)) - (n + 1) / n).fillna(0)
+
+    if useID:                           # use repository id as column title
+        label = df['id']
+    else:                               # use repository name as column title (default)
+        label = df['title'].str.replace(',', ';', regex=False)
+    countString = label + ' (' + df['count'].astype(str) + ')'
+    stats['countString'] = countString.groupby(groups, sort=False).agg(', '.join)
+
+    return stats
+
+
+def createFacetsDictionaries(facetList:list,            # list of facets e.g. ['states','resourceTypes','created'] see full list below
+                             items:list,                # query parameters for each query
+                             dateStamp:str,             # datestamp (YYYYMMDD_HH)
+                             numberOfRecords:list,      # number of records in each query
+                             facetValues:list,          # {facet: [{id, title, count}]} for each query
+                             useID:bool = False         # use id instead of title in count strings
+                             )-> list:                  # list of facet dictionaries
+    '''
+        Create the summary dictionaries for a batch of queries. The statistics of all queries and
+        facets are computed together by facetStatistics.
+
+        For the facet f, the dictionary includes the query item, the datestamp, the numberOfRecords and
+        f_number, f_max, f_common, f_total, f_HI, f_coverage, f_gini, f_entropy, f_top3, f_herfindahl
+        and f: the facet names and values written as a name (value) string
+    '''
+    columns = {'query': [], 'facet': [], 'id': [], 'title': [], 'count': []}
+    for q, values in enumerate(facetValues):
+        for f in facetList:
+            l = (values or {}).get(f) or []
+            columns['query'].extend([q] * len(l))
+            columns['facet'].extend([f] * len(l))
+            columns['id'].extend([d['id'] for d in l])
+            columns['title'].extend([d['title'] for d in l])
+            columns['count'].extend([d['count'] for d in l])
+
+    facet_values_df = pd.DataFrame(columns).astype({'id': str, 'title': str, 'count': 'int64'})
+    stats = facetStatistics(facet_values_df, np.array(numberOfRecords, dtype=float), useID)
+    stats = stats.to_dict('index')
+
+    d_list = []
+    for q, item in enumerate(items):
+        d_dict = {}
+        if len(item) == 1:
+            d_dict.update({'parameter':item[0]})
+        else:
+            for i in range(len(item)):
+                d_dict.update({'parameter ' + str(i+1): item[i]})
+
+        d_dict.update({'DateTime': dateStamp, 'NumberOfRecords': numberOfRecords[q]})
+
+        for f in facetList:
+            if (q, f) not in stats:
+                lggr.debug(f'No {f}')
+                continue
+            st = stats[(q, f)]
+            for statistic in facetStatisticNames:
+                d_dict[f + '_' + statistic] = st[statistic]
+            d_dict[f] = st['countString']       # add count string to dictionary
+
+        d_list.append(d_dict)
+
+    return d_list
+
+
+def  createFacetsDictionary(facetList: list,                # list of facets e.g. ['states','resourceTypes','created'] see full list below
+                            item:str,                       # item (resource, relation, contributorType) being retrieved,
+                            dateStamp: str,                 # datestamp (YYYYMMDD_HH)
+                            numberOfRecords:int,            # number of records in query
+                            item_json:dict,                 # json retrieved for item
+                            useID:bool = False)-> dict:     # use id instead of title in count strings
+    '''
+        Read DataCite json response and create a summary dictionary for facets in a list
+        (see createFacetsDictionaries).
+    '''
+    facetValues = {f: item_json['meta'][f] for f in facetList if f in item_json['meta']}
+    return createFacetsDictionaries(facetList, [item], dateStamp, [numberOfRecords], [facetValues], useID)[0]
@@ -0,0 +1,239 @@
+import re
+import copy
+import itertools
+
+parameters = {
+    "relations": {
+        "data": ['Collects', 'IsCollectedBy', 'IsCitedBy', 'Cites', 'IsSupplementTo', 'IsSupplementedBy', 'IsContinuedBy', 'Continues',\
+             'IsNewVersionOf', 'IsPreviousVersionOf', 'IsPartOf', 'HasPart', 'IsPublishedIn', 'IsReferencedBy',\
+             'References', 'IsDocumentedBy', 'Documents', 'IsCompiledBy', 'Compiles', 'IsVariantFormOf', \
+             'IsOriginalFormOf', 'IsIdenticalTo', 'HasMetadata', 'IsMetadataFor', 'Reviews', 'IsReviewedBy', \
+             'IsDerivedFrom', 'IsSourceOf', 'Describes', 'IsDescribedBy', 'HasVersion', 'IsVersionOf', 'Requires', \
+             'IsRequiredBy', 'Obsoletes', 'IsObsoletedBy'],
+        "queryString": 'query=relatedIdentifiers.relationType:',
+        "url":  'https://api.datacite.org/dois?&page[size]=1&query=relatedIdentifiers.relationType:'
+    },
+    "resources": {
+        "data": ['Audiovisual','Award','Book','BookChapter','Collection','ComputationalNotebook','ConferencePaper',\
+                 'ConferenceProceeding','DataPaper','Dataset','Dissertation','Event','Image','Instrument','InteractiveResource',\
+                 'Journal','JournalArticle','Model','OutputManagementPlan','PeerReview','PhysicalObject','Preprint','Project',\
+                 'Report','Service','Software','Sound','Standard','StudyRegistration','Text','Workflow','Other'],
+        "queryString": 'resource-type-id=',
+        "url":  'https://api.datacite.org/dois?&page[size]=1&resource-type-id='
+    },
+    "contributors": {
+        "data": ['ContactPerson','DataCollector','DataCurator','DataManager','Distributor','Editor', 'Funder',
+                    'HostingInstitution','Other','Producer','ProjectLeader','ProjectManager','ProjectMember',
+                    'RegistrationAgency','RegistrationAuthority','RelatedPerson','ResearchGroup','RightsHolder',
+                    'Researcher','Sponsor','Supervisor','Translator','WorkPackageLeader'],
+        "queryString": 'query=contributors.contributorType:',
+        "url": 'https://api.datacite.org/dois?query=contributors.contributorType:'
+    },
+    "affiliations": {
+        "data": [],
+        "queryString": 'query=creators.affiliation.name:*',
+        "url": 'https://api.datacite.org/dois?query=creators.affiliation.name:*'
+    },
+    "years": {
+        "data": [],
+        "queryString": 'registered=',
+        "url": 'https://api.datacite.org/dois?registered='
+    }
+}
+
+facets = ['states','resourceTypes','created','published','registered','providers','clients',
+              'affiliations','prefixes','certificates','licenses','schemaVersions','linkChecksStatus',
+              'subjects','fieldsOfScience','citations','views','downloads']
+
+facetStatisticNames = ['number','max','common','total','HI','coverage','gini','entropy','top3','herfindahl']
+
+apiURL = 'https://api.datacite.org/dois'
+
+
+def targetParameters(affiliationList:list = (),         # affiliations to retrieve
+                     years:list = ()                    # registration years to retrieve
+                     )-> dict:
+    '''
+        Copy of the target parameters with the affiliation and year lists filled in. The copy
+        can be trimmed for a query without changing the module parameters.
+    '''
+    p = copy.deepcopy(parameters)
+    p['affiliations']['data'] = list(affiliationList)
+    p['years']['data'] = [str(y) for y in years]
+    return p
+
+
+def facetColumns(parameterNames:list,                  # names of the parameter columns
+                 facetList:list                         # list of facets
+                 )-> list:
+    '''
+        The fixed column schema of the facet rows created by createFacetsDictionary
+    '''
+    columns = parameterNames + ['DateTime', 'NumberOfRecords']
+    for f in facetList:
+        columns += [f + '_' + statistic for statistic in facetStatisticNames] + [f]
+    return columns
+
+
+def queryTargets(URL:str,                               # DataCite API URL
+                 p:tuple                                # query parameters for URL
+                 )-> dict:
+    '''
+        Map each parameter of a query to its target (e.g. {'resources': 'Dataset', 'years': '2020'})
+        by matching the URL parameters to the target queryStrings. The URL parameters are in the same
+        order as the query parameters.
+    '''
+    urlParameters = [x for x in URL.split('?', 1)[-1].split('&')
+                        if any(x.startswith(parameters[t]['queryString']) for t in parameters)]
+    d_ = {}
+    for x, item in zip(urlParameters, p):
+        for t in parameters:
+            if x.startswith(parameters[t]['queryString']):
+                d_[t] = item
+                break
+    return d_
+
+
+def urlParameter(parameters:dict,                       # target parameters (targetParameters)
+                 target:str,                            # target of the item
+                 item:str                               # item, e.g. Dataset
+                 )-> str:
+    '''
+        The URL parameter for an item, e.g. resource-type-id=Dataset. Affiliations are wildcard queries.
+    '''
+    if target == 'affiliations':
+        return parameters[target]['queryString'] + item.replace(' ','*') + '*'
+    return parameters[target]['queryString'] + item
+
+
+def affiliationsParameter(parameters:dict,              # target parameters (targetParameters)
+                          affiliations:list             # affiliations, e.g. ['Aalto University', 'ETH Zurich']
+                          )-> str:
+    '''
+        The URL parameter of a query for the records of any of the affiliations, e.g.
+        query=creators.affiliation.name:(*Aalto*University*%20OR%20*ETH*Zurich*). A single
+        affiliation is the URL parameter of its affiliation query (urlParameter).
+    '''
+    if len(affiliations) == 1:
+        return urlParameter(parameters, 'affiliations', affiliations[0])
+    field = parameters['affiliations']['queryString'][:-1]                  # query=creators.affiliation.name:
+    return field + '(' + '%20OR%20'.join('*' + x.replace(' ','*') + '*' for x in affiliations) + ')'
+
+
+def normalizeAffiliation(name:str)-> str:
+    '''
+        An affiliation name with only its words (letters and digits) separated by single spaces, so
+        punctuation (e.g. Texas A&M University) does not change the wildcard query
+    '''
+    return ' '.join(re.findall(r'\w+', name))
+
+
+def trimURL(URL:str,                                    # DataCite API URL of a query (page[size]=1)
+            facetList:list                              # facets included in the response
+            )-> str:                                    # URL of the smallest response for the facets
+    '''
+        The smallest response of a query: page[size]=0 replaces the page parameters (only the meta block,
+        no records), fields[dois]=doi limits the attributes of any record to the DOI and facets= selects
+        the facets in facetList. The facets are also selected when the response is decoded, so the
+        results are the same if the API returns more than requested.
+    '''
+    base, urlParameters = URL.split('?', 1)
+    urlParameters = [x for x in urlParameters.split('&') if x and not x.startswith('page[')]
+    return base + '?' + '&'.join(['page[size]=0', 'fields[dois]=doi', 'facets=' + ','.join(facetList)] + urlParameters)
+
+
+def countURL(URL:str                                   # DataCite API URL of a query (page[size]=1)
+             )-> str:                                   # URL of the number of records of the query
+    '''
+        The smallest response with the number of records of a query: page[size]=0 replaces the page
+        parameters (only the meta block, no records) and disable-facets=true skips the facet aggregations
+    '''
+    base, urlParameters = URL.split('?', 1)
+    urlParameters = [x for x in urlParameters.split('&') if x and not x.startswith('page[')]
+    return base + '?' + '&'.join(['page[size]=0'] + urlParameters + ['disable-facets=true'])
+
+
+def buildQueries(parameters:dict,                       # target parameters (targetParameters), trimmed for combined queries
+                 targets:list,                          # targets to retrieve (e.g. ['resources', 'years'])
+                 itemList:list,                         # items to retrieve (all items in the targets if empty)
+                 combineQueries:bool,                   # run all query parameter combinations
+                 apiURL:str = apiURL                    # DataCite API endpoint
+                 )-> tuple:                             # (URL_List, param_List)
+    '''
+        Create the query URLs and the query parameters for each URL
+    '''
+    url_parameter_lists = []
+    parameter_lists = []
+    url_parameters = []
+
+    if combineQueries:
+        #
+        # In some cases we need facet data from queries that combine multiple parameters, e.g. facets from
+        # resourceType = Dataset and affiliation = someUniversity. The combineQueries option can be used to
+        # generate these results. It takes items from itemList, finds the targets thay are in, and runs
+        # queries for all possible combinations.
+        #
+        # url_parameter_lists is a list of the url_parameters from each target,
+        # e.g [[relation url parameters], [resource url parameters], [years]]. All combinations of items in
+        # these lists are used to create combined queries.
+        #
+        if len(itemList) == 0:
+            raise ValueError('itemList must be defined for combinedQueries')
+
+        for target in ['relations', 'resources', 'contributors']:
+                                                                        # trim the parameter data lists for these targets so
+                                                                        # they only contain items in the itemList
+            parameters[target]['data'] = [x for x in parameters[target]['data'] if x in itemList]
+
+            if len(parameters[target]['data']) > 0:                     # if there are parameters from the itemList for this target
+                parameter_lists.append(parameters[target]['data'])      # append the list of parameters to parameter_lists (a list of lists)
+                #
+                # convert the remaining parameters into URL parameters, i.e. Dataset (a resource) becomes resource-type-id=Dataset
+                # so that it can be included in a URL. url_parameters is a list of these parameters for this target
+                #
+                url_parameters = [parameters[target]['queryString'] + x for x in parameters[target]['data']]
+                url_parameter_lists.append(url_parameters)              # append the list of url parameters to url_parameter_lists (a list of lists)
+
+        target = 'affiliations'                                         # if affiliations are specified they are all included
+        if len(parameters[target]['data']) > 0:                         # in the combined queries, i.e. no trimming required
+            parameter_lists.append(parameters[target]['data'])          # append list of affiliations to parameter_lists (list of lists)
+                                                                        # convert affiliations to URL parameters
+            url_parameters = [parameters[target]['queryString'] + x.replace(' ','*') + '*' for x in parameters[target]['data']]
+            url_parameter_lists.append(url_parameters)                                # append the list of affiliation url parameters to url_parameter_lists (a list of lists)
+
+        target = 'years'                                                # if years are specified they are all included
+        if len(parameters[target]['data']) > 0:                         # in the combined queries, i.e. no trimming required
+            parameter_lists.append(parameters[target]['data'])          # append list of years to parameter_lists (list of lists)
+                                                                        # convert years to URL parameters
+            url_parameters = [parameters[target]['queryString'] + x for x in parameters[target]['data']]
+            url_parameter_lists.append(url_parameters)                  # append the list of year url parameters to url_parameter_lists (a list of lists)
+
+    else:                                                   # simple queries, i.e. no combinations
+        for target in set(targets):                         # loop through unique targets (e.g. 'resources', 'contributors', 'relations')
+            for item in parameters[target]['data']:         # loop items in target data (all specific items) to find items
+                                                            # url_parameters are the strings used in the query URL to specify parameters for a
+                                                            # particular kind of search. For example: "queryString": 'resource-type-id=' for
+                                                            # resourceType queries.
+                if target == 'affiliations':                # add wildcards to affiliation
+                    url_parameters.append(parameters[target]['queryString'] + item.replace(' ','*') + '*')
+                else:
+                    if len(itemList) > 0:                   # if itemList is specified, just get items on list
+                        if item in itemList:
+                            url_parameters.append(parameters[target]['queryString'] + item)
+                            parameter_lists.append(item)
+                    else:
+                        url_parameters.append(parameters[target]['queryString'] + item)
+
+            if len(itemList) == 0:                                  # parameter list is the list of requested parameter names
+                parameter_lists.extend(parameters[target]['data'])
+
+        url_parameter_lists = [url_parameters]                       # convert url_parameter_lists to list of lists
+        parameter_lists = [parameter_lists]                          # convert parameter_lists to list of lists
+
+    URL_List = []
+    for u in itertools.product(*url_parameter_lists):                # create list of all combinations of items in url_parameter_lists
+        URL_List.append(apiURL + '?&page[size]=1&' + '&'.join(u))   # and create urls with &-separated parameters
+
+    param_List = list(itertools.product(*parameter_lists))          # create a list of all combinations of the paramters used in
+                                                                    # each query. These are used to create the names of the query results
+    return (URL_List, param_List)
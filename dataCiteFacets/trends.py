@@ -0,0 +1,283 @@
+import json
+import logging
+import warnings
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .sinks import createDatabaseTables, readFacetValues
+from .statistics import createFacetsDictionaries
+
+lggr = logging.getLogger('retrieveDataCiteFacets')
+
+trendStatistics = ['HI', 'coverage']                    # facet statistics in the time series (with NumberOfRecords)
+legacyTable = 'relationsAndResources'                   # facet rows stored by --dbout before the normalized tables
+legacyRunPrefix = 'relationsAndResources_'              # run_id of the snapshots imported from legacyTable (+ DateTime)
+
+changePointWindow = 30                                  # previous changes of a series a change is compared with
+changePointHistory = 3                                  # previous changes needed before a change can be a change point
+changePointThreshold = 3.5                              # modified z-score of a change point
+commitSnapshots = 100                                   # snapshots added to the trends in one transaction
+
+deltaColumns = [f'd{i}' for i in range(changePointWindow)]      # recent changes of a series, oldest first
+summaryColumns = ['parameters', 'statistic', 'first', 'last', 'firstDate', 'lastDate', 'snapshots', 'change',
+                  'growth', 'annualGrowth', 'changePoints', 'lastChangePoint']
+
+
+def updateSnapshotStatistics(con)-> int:                # number of new runs
+    '''
+        Compute the trend statistics (NumberOfRecords and the HI and coverage of every facet) for the complete
+        runs in the database that do not have them yet and store them in snapshot_statistics. Each run is computed
+        once and committed separately, so adding a snapshot only computes the statistics of the new run.
+    '''
+    cur = con.cursor()
+    createDatabaseTables(cur)
+    runs = cur.execute('SELECT run_id, DateTime, facets FROM runs '
+                       'WHERE complete = 1 AND run_id NOT IN (SELECT run_id FROM snapshot_runs) ORDER BY run_id').fetchall()
+    for runId, dateStamp, facets in runs:
+        queries = cur.execute('SELECT parameters, NumberOfRecords, COALESCE(carried_from, query_id) FROM queries '
+                              'WHERE run_id = ? ORDER BY query_id', (runId,)).fetchall()
+        facetValues = readFacetValues(cur, [q[2] for q in queries])
+        facetList = (facets or '').split()
+        d_list = createFacetsDictionaries(facetList, [json.loads(q[0]) for q in queries], dateStamp,
+                                          [q[1] for q in queries], [facetValues.get(q[2], {}) for q in queries])
+
+        rows = []
+        for (parameters, numberOfRecords, sourceId), d_dict in zip(queries, d_list):
+            rows.append((runId, parameters, 'NumberOfRecords', numberOfRecords))
+            for f in facetList:
+                rows.extend((runId, parameters, f + '_' + statistic, float(d_dict[f + '_' + statistic]))
+                                for statistic in trendStatistics if f + '_' + statistic in d_dict)
+        cur.executemany('INSERT INTO snapshot_statistics (run_id, parameters, statistic, value) VALUES (?,?,?,?)', rows)
+        cur.execute('INSERT INTO snapshot_runs (run_id, DateTime) VALUES (?,?)', (runId, dateStamp))
+        con.commit()
+        lggr.info(f'Trend statistics: run {runId} {len(queries)} queries')
+    return len(runs)
+
+
+def legacyValue(value)-> float:
+    '''
+        The number in a column of the legacy table (the column types do not match the values), None for text
+    '''
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+
+def importLegacySnapshots(con)-> int:                   # number of new snapshots
+    '''
+        Add the snapshots in the relationsAndResources table (--dbout before the normalized tables) to the
+        trend statistics: every DateTime of the table is a snapshot with the NumberOfRecords, HI and coverage
+        columns of its rows. The parameter columns (parameter, parameter 1, ...) are the parameters of the query.
+        Each DateTime is imported once.
+    '''
+    cur = con.cursor()
+    createDatabaseTables(cur)
+    if cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (legacyTable,)).fetchone() is None:
+        return 0
+    columns = [c[1] for c in cur.execute(f'PRAGMA table_info("{legacyTable}")')]
+    if 'DateTime' not in columns:
+        return 0
+    parameterColumns = sorted((c for c in columns if c.startswith('parameter')), key=lambda c: (len(c), c))
+    statisticColumns = [c for c in columns if c == 'NumberOfRecords' or c.endswith(tuple('_' + s for s in trendStatistics))]
+    selection = ', '.join(f'"{c}"' for c in parameterColumns + statisticColumns)
+
+    dateTimes = [r[0] for r in cur.execute(f'SELECT DISTINCT DateTime FROM "{legacyTable}" WHERE DateTime IS NOT NULL '
+                                           'AND ? || DateTime NOT IN (SELECT run_id FROM snapshot_runs) ORDER BY DateTime',
+                                           (legacyRunPrefix,)).fetchall()]
+    for dateTime in dateTimes:
+        runId = legacyRunPrefix + str(dateTime)
+        rows = []
+        for row in cur.execute(f'SELECT {selection} FROM "{legacyTable}" WHERE DateTime = ? ORDER BY rowid', (dateTime,)).fetchall():
+            parameters = json.dumps([str(x) for x in row[:len(parameterColumns)] if x is not None], ensure_ascii=False)
+            rows.extend((runId, parameters, c, legacyValue(v)) for c, v in zip(statisticColumns, row[len(parameterColumns):])
+                            if legacyValue(v) is not None)
+        cur.executemany('INSERT INTO snapshot_statistics (run_id, parameters, statistic, value) VALUES (?,?,?,?)', rows)
+        cur.execute('INSERT INTO snapshot_runs (run_id, DateTime) VALUES (?,?)', (runId, str(dateTime)))
+        con.commit()
+        lggr.info(f'Trend statistics: {legacyTable} snapshot {dateTime} {len(rows)} values')
+    return len(dateTimes)
+
+
+def readTrendSeries(con)-> pd.DataFrame:                # (parameters, statistic) index
+    '''
+        The state of every series of the trends: first and last values and dates, number of snapshots,
+        change points and the recent changes (deltaColumns)
+    '''
+    df = pd.read_sql_query('SELECT * FROM trend_series', con)
+    recent = [json.loads(r) for r in df.pop('recentDeltas')]
+    recent = pd.DataFrame([[np.nan] * (changePointWindow - len(r)) + r[-changePointWindow:] for r in recent],
+                          columns=deltaColumns, index=df.index, dtype=float)
+    return pd.concat([df, recent], axis=1).set_index(['parameters', 'statistic'])
+
+
+def writeTrendSeries(cur,
+                     series:pd.DataFrame):              # changed series (readTrendSeries)
+    recent = series[deltaColumns].to_numpy()
+    cur.executemany('INSERT OR REPLACE INTO trend_series (parameters, statistic, first, firstDate, last, lastDate, snapshots, '
+                    'changePoints, lastChangePoint, recentDeltas) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                    [(p, s, first, firstDate, last, lastDate, int(snapshots), int(changePoints),
+                      lastChangePoint if isinstance(lastChangePoint, str) else None, json.dumps([d for d in r if d == d]))
+                        for (p, s), first, firstDate, last, lastDate, snapshots, changePoints, lastChangePoint, r
+                        in zip(series.index, series['first'], series['firstDate'], series['last'], series['lastDate'],
+                               series['snapshots'], series['changePoints'], series['lastChangePoint'], recent)])
+
+
+def addSnapshot(series:pd.DataFrame,                    # state of the series (readTrendSeries)
+                values:pd.Series,                       # values of the snapshot with a (parameters, statistic) index
+                dateTime:str                            # DateTime of the snapshot
+                )-> tuple:                              # (series, deltas of the snapshot)
+    '''
+        Add a snapshot to the series: the change and % change of every value since the last snapshot of its
+        series and whether the change is a change point. A change is a change point if its modified z-score
+        0.6745 (delta - median) / MAD among the last changePointWindow changes of its series is larger than
+        changePointThreshold; for series whose recent changes are all the same (MAD = 0), every different
+        change is a change point. Only the values of the snapshot are computed, so adding a snapshot does
+        not depend on the length of the series.
+    '''
+    new = values.index.difference(series.index)
+    if len(new) > 0:
+        added = pd.DataFrame({'first': values[new], 'firstDate': dateTime, 'last': np.nan, 'lastDate': None,
+                              'snapshots': 0, 'changePoints': 0, 'lastChangePoint': None}, index=new)
+        series = pd.concat([series, added.assign(**{c: np.nan for c in deltaColumns})])
+
+    current = series.loc[values.index]
+    delta = values - current['last']
+    pctChange = delta / current['last'].replace(0, np.nan)
+    recent = current[deltaColumns].to_numpy()
+    with warnings.catch_warnings():                     # series without changes have no median
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(recent, axis=1)
+        mad = np.nanmedian(np.abs(recent - median[:, None]), axis=1)
+    history = np.sum(~np.isnan(recent), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = 0.6745 * (delta.to_numpy() - median) / np.where(mad > 0, mad, np.nan)
+    isChange = ((history >= changePointHistory) & delta.notna().to_numpy()
+                    & ((np.abs(z) > changePointThreshold) | ((mad == 0) & (delta.to_numpy() != median))))
+
+    hasDelta = delta.notna().to_numpy()
+    recent[hasDelta] = np.column_stack([recent[hasDelta, 1:], delta.to_numpy()[hasDelta]])
+    series.loc[values.index, deltaColumns] = recent
+    series.loc[values.index, 'last'] = values
+    series.loc[values.index, 'lastDate'] = dateTime
+    series.loc[values.index, 'snapshots'] = current['snapshots'] + 1
+    series.loc[values.index, 'changePoints'] = current['changePoints'] + isChange
+    series.loc[values.index[isChange], 'lastChangePoint'] = dateTime
+
+    deltas = pd.DataFrame({'DateTime': dateTime, 'value': values, 'delta': delta, 'pctChange': pctChange,
+                           'changePoint': isChange.astype(int)}, index=values.index)
+    return (series, deltas)
+
+
+def updateTrends(con)-> int:                            # number of added snapshots
+    '''
+        Add the snapshots (snapshot_runs) that are not in the trends yet. The state of every series is kept in
+        trend_series and the changes of every snapshot in trend_deltas, so a new snapshot only computes its own
+        changes (addSnapshot). Runs with the same DateTime are one snapshot (the last run is used for the
+        queries they have in common). A run that is older than the trends (e.g. imported legacy snapshots or
+        a run stored again) recomputes the trends from the first snapshot.
+    '''
+    cur = con.cursor()
+    createDatabaseTables(cur)
+    pending = cur.execute('SELECT run_id, DateTime FROM snapshot_runs WHERE run_id NOT IN (SELECT run_id FROM trend_runs) '
+                          'ORDER BY DateTime, run_id').fetchall()
+    if len(pending) == 0:
+        return 0
+    latest = cur.execute('SELECT MAX(DateTime) FROM trend_runs JOIN snapshot_runs USING (run_id)').fetchone()[0]
+    if latest is not None and pending[0][1] <= latest:
+        lggr.info(f'Trends: run {pending[0][0]} ({pending[0][1]}) is not newer than the trends ({latest}), recomputing all snapshots')
+        for table in ['trend_runs', 'trend_series', 'trend_deltas']:
+            cur.execute(f'DELETE FROM {table}')
+        pending = cur.execute('SELECT run_id, DateTime FROM snapshot_runs ORDER BY DateTime, run_id').fetchall()
+
+    series = readTrendSeries(con)
+    changed = pd.Series(False, index=series.index)
+    snapshots = itertools.groupby(pending, key=lambda r: r[1])
+    for n, (dateTime, runs) in enumerate(snapshots, start=1):
+        runIds = [r[0] for r in runs]
+        values = pd.read_sql_query('SELECT parameters, statistic, value FROM snapshot_statistics '
+                                   f'WHERE run_id IN ({",".join("?" * len(runIds))}) AND value IS NOT NULL '
+                                   'ORDER BY run_id, rowid', con, params=runIds)
+        values = values.drop_duplicates(['parameters', 'statistic'], keep='last').set_index(['parameters', 'statistic'])['value']
+        series, deltas = addSnapshot(series, values, dateTime)
+        changed = changed.reindex(series.index, fill_value=False)
+        changed[values.index] = True
+
+        cur.executemany('INSERT INTO trend_deltas (DateTime, parameters, statistic, value, delta, pctChange, changePoint) '
+                        'VALUES (?,?,?,?,?,?,?)',
+                        [(dateTime, p, s, value, None if delta != delta else delta, None if pct != pct else pct, changePoint)
+                            for (p, s), value, delta, pct, changePoint in zip(deltas.index, deltas['value'], deltas['delta'],
+                                                                             deltas['pctChange'], deltas['changePoint'])])
+        cur.executemany('INSERT INTO trend_runs (run_id) VALUES (?)', [(r,) for r in runIds])
+        if n % commitSnapshots == 0:                    # keep the transactions short when many snapshots are added
+            writeTrendSeries(cur, series[changed])
+            changed[:] = False
+            con.commit()
+        lggr.debug(f'Trends: snapshot {dateTime} {len(values)} values')
+
+    writeTrendSeries(cur, series[changed])
+    con.commit()
+    return len({r[1] for r in pending})
+
+
+def trendSnapshots(con)-> tuple:                        # (number of snapshots, first DateTime, last DateTime)
+    return con.execute('SELECT COUNT(DISTINCT DateTime), MIN(DateTime), MAX(DateTime) '
+                       'FROM snapshot_runs JOIN trend_runs USING (run_id)').fetchone()
+
+
+def statisticFilter(facetList:list = None)-> tuple:     # (SQL condition, parameters)
+    '''
+        The condition selecting the statistics of the facets in facetList (all statistics if it is empty)
+    '''
+    if not facetList:
+        return ('1', [])
+    keep = ['NumberOfRecords'] + [f + '_' + statistic for f in facetList for statistic in trendStatistics]
+    return (f'statistic IN ({",".join("?" * len(keep))})', keep)
+
+
+def trendSummary(con,
+                 facetList:list = None                  # facets to include (None = all)
+                 )-> pd.DataFrame:                      # summaryColumns
+    '''
+        Growth and change points of every query and statistic: the first and last values and dates, the
+        number of snapshots, the change and growth (last / first - 1), the annual growth and the number
+        and last date of the change points
+    '''
+    condition, parameters = statisticFilter(facetList)
+    df = pd.read_sql_query('SELECT parameters, statistic, first, last, firstDate, lastDate, snapshots, changePoints, lastChangePoint '
+                           f'FROM trend_series WHERE {condition} ORDER BY parameters, statistic', con, params=parameters)
+    df['parameters'] = [', '.join(json.loads(p)) for p in df['parameters']]
+    for c in ['firstDate', 'lastDate', 'lastChangePoint']:
+        df[c] = pd.to_datetime(df[c], format='%Y%m%d_%H', errors='coerce')
+    years = (df['lastDate'] - df['firstDate']).dt.days / 365.25
+    df['change'] = df['last'] - df['first']
+    df['growth'] = df['last'] / df['first'].replace(0, np.nan) - 1
+    df['annualGrowth'] = (1 + df['growth']) ** (1 / years.where(years > 0)) - 1
+    return df[summaryColumns]
+
+
+def writeTrendDeltas(con,
+                     outputFile:str,                    # csv file
+                     facetList:list = None,             # facets to include (None = all)
+                     chunkRows:int = 100000             # rows read and written together
+                     )-> int:                           # number of rows
+    '''
+        Write the value, change, % change and change point of every snapshot, query and statistic to a csv
+        file. The rows are read from trend_deltas and written in chunks.
+    '''
+    condition, parameters = statisticFilter(facetList)
+    rows = 0
+    chunks = pd.read_sql_query('SELECT DateTime, parameters, statistic, value, delta, pctChange, changePoint FROM trend_deltas '
+                               f'WHERE {condition} ORDER BY DateTime, parameters, statistic', con, params=parameters,
+                               chunksize=chunkRows)
+    with open(outputFile, 'w', encoding='utf-8', newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk['DateTime'] = pd.to_datetime(chunk['DateTime'], format='%Y%m%d_%H', errors='coerce')
+            chunk['parameters'] = [', '.join(json.loads(p)) for p in chunk['parameters']]
+            chunk['changePoint'] = chunk['changePoint'].astype(bool)
+            chunk.to_csv(f, sep=',', index=False, header=i == 0)
+            rows += len(chunk)
+    return rows
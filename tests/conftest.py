@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+benchmarkDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, benchmarkDirectory)
+
+from dataCiteStandIn import startStandIn
+
+
+@pytest.fixture(scope='session')
+def standIn():
+    '''
+        DataCite stand-in (benchmarks/dataCiteStandIn.py) serving the recorded responses of benchmarks/fixtures
+    '''
+    server = startStandIn(os.path.join(benchmarkDirectory, 'fixtures'))
+    server.apiURL = f'http://127.0.0.1:{server.server_port}/dois'
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def worldStandIn(tmp_path_factory):
+    '''
+        Stand-in serving the synthetic DataCite of dataCiteWorld from a --jout archive. missCount counts the
+        queries the archive has no response for.
+    '''
+    from dataCiteWorld import createRecords, writeWorldArchive
+
+    fixtureDirectory = tmp_path_factory.mktemp('world')
+    writeWorldArchive(str(fixtureDirectory / 'DataCite_20260101_060000.jsonl.gz'), createRecords())
+    server = startStandIn(str(fixtureDirectory))
+    server.apiURL = f'http://127.0.0.1:{server.server_port}/dois'
+    yield server
+    server.shutdown()
@@ -0,0 +1,110 @@
+'''
+    A small synthetic DataCite: records with a resource type, registration year, client, affiliation and
+    relation types. response() answers a query like the /dois API (the total and the facets of the matching
+    records), so the single target, combined and broader queries of a run agree with each other the way
+    they do in DataCite. writeWorldArchive() writes the responses of every query as a --jout archive that
+    the stand-in (benchmarks/dataCiteStandIn.py) serves.
+'''
+import re
+import random
+import datetime
+import itertools
+
+from dataCiteFacets.targets import targetParameters, urlParameter, affiliationsParameter
+from dataCiteFacets.archive import ResponseArchive
+from dataCiteFacets.planner import affiliationPattern
+
+relations = ['IsCitedBy', 'Cites', 'IsPartOf']
+resources = ['Dataset', 'Software', 'Text', 'Image']
+affiliations = ['Aalto University', 'ETH Zurich', 'University of Oslo', 'Delft University of Technology',
+                'Nowhere Institute', 'Unknown College']           # the last two have no records
+clients = [('cern.zenodo', 'Zenodo'), ('figshare.ars', 'figshare Academic Research System'), ('dryad.dryad', 'DRYAD'),
+           ('gesis.icpsr', 'ICPSR'), ('tib.pangaea', 'PANGAEA'), ('inist.humanum', 'NAKALA'), ('ubc.oc', 'Open Collections'),
+           ('subgoe.vzg', 'Verbundzentrale des GBV')]
+minYear = datetime.datetime.now().year - 2
+years = [str(y) for y in range(minYear, datetime.datetime.now().year + 1)]
+
+
+def createRecords(n:int = 400,                          # number of records
+                  seed:int = 2026                       # random seed
+                  )-> list:
+    '''
+        Records with empty combinations: Images have no relations, Software is never IsPartOf and
+        nothing registered in the current year Cites
+    '''
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        resource = rng.choices(resources, weights=[5, 3, 4, 1])[0]
+        year = rng.choice(years)
+        relationTypes = set()
+        if resource != 'Image':
+            relationTypes = {r for r in relations if rng.random() < 0.3}
+        if resource == 'Software':
+            relationTypes.discard('IsPartOf')
+        if year == years[-1]:
+            relationTypes.discard('Cites')
+        records.append({'resource': resource, 'year': year, 'relations': relationTypes, 'client': rng.choice(clients),
+                        'affiliation': rng.choice(affiliations[:4] + [None])})
+    return records
+
+
+def facetValues(values:list)-> list:
+    '''
+        Facet values [{id, title, count}] of (id, title) pairs, largest counts first
+    '''
+    counts = {}
+    for v in values:
+        counts[v] = counts.get(v, 0) + 1
+    return [{'id': i, 'title': t, 'count': c} for (i, t), c in sorted(counts.items(), key=lambda x: (-x[1], x[0]))]
+
+
+def response(records:list,
+             relation:str = None,
+             resource:str = None,
+             year:str = None,
+             affiliationList:list = ()                  # records of any of the affiliations
+             )-> dict:
+    '''
+        The /dois response of a query: the total and the facets of the matching records
+    '''
+    patterns = [affiliationPattern(a) for a in affiliationList]
+    found = [r for r in records if (relation is None or relation in r['relations']) and (resource is None or r['resource'] == resource)
+                and (year is None or r['year'] == year)
+                and (len(patterns) == 0 or (r['affiliation'] is not None and any(p.search(r['affiliation']) for p in patterns)))]
+    return {'data': [],
+            'meta': {'total': len(found),
+                     'states': facetValues([('findable', 'Findable') for r in found]),
+                     'resourceTypes': facetValues([(re.sub('(?<!^)(?=[A-Z])', '-', r['resource']).lower(),
+                                                    re.sub('(?<!^)(?=[A-Z])', ' ', r['resource'])) for r in found]),
+                     'registered': facetValues([(r['year'], r['year']) for r in found]),
+                     'clients': facetValues([r['client'] for r in found]),
+                     'affiliations': facetValues([('ror.org/' + r['affiliation'].lower().replace(' ', ''), r['affiliation'])
+                                                    for r in found if r['affiliation'] is not None])}}
+
+
+def writeWorldArchive(archiveFile:str,                  # archive file (DataCite_RUNID.jsonl.gz)
+                      records:list,
+                      apiURL:str = 'https://api.datacite.org/dois'):
+    '''
+        Archive the responses of every combination of a relation, resource type and year, of every batch of
+        affiliations (the queries of planner.resolveAffiliations) and of every resource type and affiliation.
+        The parameters of a batch are its affiliations joined with OR, so the stand-in matches them to the
+        batch queries.
+    '''
+    parameters = targetParameters(affiliations, years)
+    archive = ResponseArchive(archiveFile)
+    for relation, resource, year in itertools.product([None] + relations, [None] + resources, [None] + years):
+        items = [(t, x) for t, x in [('relations', relation), ('resources', resource), ('years', year)] if x is not None]
+        if len(items) > 0:
+            URL = apiURL + '?&page[size]=1&' + '&'.join(urlParameter(parameters, t, x) for t, x in items)
+            archive.write(URL, tuple(x for t, x in items), response(records, relation, resource, year))
+    for n in range(1, len(affiliations) + 1):
+        for batch in itertools.combinations(affiliations, n):
+            URL = apiURL + '?&page[size]=1&' + affiliationsParameter(parameters, list(batch))
+            archive.write(URL, (' OR '.join(batch),), response(records, affiliationList=batch))
+    for resource, affiliation in itertools.product(resources, affiliations):
+        URL = apiURL + '?&page[size]=1&' + '&'.join([urlParameter(parameters, 'resources', resource),
+                                                     urlParameter(parameters, 'affiliations', affiliation)])
+        archive.write(URL, (resource, affiliation), response(records, resource=resource, affiliationList=[affiliation]))
+    archive.close()
@@ -0,0 +1,131 @@
+import os
+import csv
+import json
+import zlib
+import sqlite3
+
+import pytest
+
+from dataCiteFacets import FacetQuery, cli, facets
+from dataCiteFacets.archive import ResponseArchive, ArchiveReader, archiveFacets, responseFacets, decodeFacets
+from dataCiteWorld import createRecords, writeWorldArchive
+
+fixtureDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+
+def writeArchive(archiveFile:str, scale:int):
+    '''
+        Archive a response for every resource type query, the counts of the fixture multiplied by scale
+    '''
+    with open(os.path.join(fixtureDirectory, 'PhysicalObject.json'), encoding='utf-8') as f:
+        response = json.load(f)
+    archive = ResponseArchive(archiveFile)
+    for u,p in FacetQuery(['resources'], facetList=['clients']).queries():
+        item_json = json.loads(json.dumps(response))
+        item_json['meta']['total'] *= scale
+        for d in item_json['meta']['clients']:
+            d['count'] *= scale
+        archive.write(u, p, item_json)
+    archive.close()
+
+
+def test_from_archive_same_hour(tmp_path, monkeypatch):
+    archiveDirectory = tmp_path / 'metadata'
+    archiveDirectory.mkdir()
+    writeArchive(str(archiveDirectory / 'DataCite_20260101_060000.jsonl.gz'), 1)
+    writeArchive(str(archiveDirectory / 'DataCite_20260101_063000.jsonl.gz'), 2)
+    writeArchive(str(archiveDirectory / 'DataCite_20260101_070000.jsonl.gz'), 3)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HOME', str(tmp_path))
+
+    cli.main(['--resources', '-fl', 'clients', '--csvout', '--from-archive', str(archiveDirectory)])
+
+    totals = {}
+    for name in ['DataCite__combined__20260101_060000_reprocessed.csv', 'DataCite__combined__20260101_063000_reprocessed.csv',
+                 'DataCite__combined__20260101_07_reprocessed.csv']:
+        with open(tmp_path / name, encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 32
+        totals[name] = int(rows[0]['NumberOfRecords'])
+    assert totals == {'DataCite__combined__20260101_060000_reprocessed.csv': 1390569, 'DataCite__combined__20260101_063000_reprocessed.csv': 2 * 1390569,
+                      'DataCite__combined__20260101_07_reprocessed.csv': 3 * 1390569}
+
+
+def test_from_archive_keeps_outputs(tmp_path, monkeypatch):
+    archiveFile = str(tmp_path / 'DataCite_20260101_060000.jsonl.gz')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('DATACITE_STATISTICS_DATABASE', str(tmp_path / 'statistics.db'))
+    (tmp_path / 'DataCite__combined__20260101_06.csv').write_text('output of the original run')
+
+    def storedTotal():
+        con = sqlite3.connect(str(tmp_path / 'statistics.db'))
+        total = con.execute("SELECT MAX(NumberOfRecords) FROM queries WHERE run_id = '20260101_060000'").fetchone()[0]
+        con.close()
+        return total
+
+    arguments = ['--resources', '-fl', 'clients', '--csvout', '--dbout', '--from-archive', archiveFile]
+    writeArchive(archiveFile, 1)
+    cli.main(arguments)
+    assert storedTotal() == 1390569
+    writeArchive(archiveFile, 2)
+    cli.main(arguments)
+    assert storedTotal() == 1390569                     # the stored run is not replaced
+    cli.main(arguments + ['--replace'])
+    assert storedTotal() == 2 * 1390569
+
+    assert (tmp_path / 'DataCite__combined__20260101_06.csv').read_text() == 'output of the original run'
+    with open(tmp_path / 'DataCite__combined__20260101_06_reprocessed.csv', encoding='utf-8') as f:
+        assert int(next(csv.DictReader(f))['NumberOfRecords']) == 2 * 1390569
+
+
+def metaResponse()-> dict:
+    '''
+        A response with facet values named "meta" (before the meta block in the data and inside it)
+    '''
+    return {'data': [{'id': '10.1/meta', 'attributes': {'titles': [{'title': 'meta'}], 'subjects': ['"meta"']}}],
+            'meta': {'total': 12, 'clients': [{'id': 'meta', 'title': 'meta', 'count': 7}, {'id': 'x.y', 'title': 'X', 'count': 5}],
+                     'registered': [{'id': '2020', 'title': 'meta', 'count': 12}]},
+            'links': {'self': 'https://api.datacite.org/dois?query=meta'}}
+
+
+@pytest.mark.parametrize('facetList', [['clients'], ['clients', 'registered', 'states'], facets])
+def test_decode_facets(facetList, monkeypatch):
+    import dataCiteFacets.archive
+    monkeypatch.setattr(dataCiteFacets.archive, 'json', None)          # only the meta block is decoded
+    for response in [metaResponse(), {'data': [], 'meta': {'total': 0}}, {'errors': [], 'meta': {'total': 3}}]:
+        expected = responseFacets(response, facetList)
+        for body in [json.dumps(response), json.dumps(response, indent=1, ensure_ascii=False)]:
+            assert decodeFacets(body.encode('utf-8'), facetList) == expected
+
+
+def test_archive_facets_meta_titles(tmp_path):
+    archiveFile = str(tmp_path / 'DataCite_20260101_060000.jsonl.gz')
+    archive = ResponseArchive(archiveFile)
+    archive.write('http://127.0.0.1/dois?query=meta', ('meta',), metaResponse())
+    archive.write('http://127.0.0.1/dois?resource-type-id=Dataset', ('Dataset',), {'data': [], 'meta': {'total': 0}})
+    archive.close()
+
+    reader = ArchiveReader(archiveFile)
+    locations = [reader.index[p][:2] for p in reader.parameters()]
+    assert archiveFacets(archiveFile, locations, ['clients']) == [responseFacets(metaResponse(), ['clients']), (0, None, None)]
+
+
+def test_decode_recorded_responses(tmp_path):
+    archiveFile = str(tmp_path / 'DataCite_20260101_060000.jsonl.gz')
+    writeWorldArchive(archiveFile, createRecords())
+    reader = ArchiveReader(archiveFile)
+    with open(archiveFile, 'rb') as f:
+        lines = []
+        for offset, length, URL in reader.index.values():
+            f.seek(offset)
+            lines.append(zlib.decompress(f.read(length), 31))
+    with open(os.path.join(fixtureDirectory, 'PhysicalObject.json'), 'rb') as f:
+        bodies = [f.read()]
+    bodies += [json.dumps(entry['response']).encode('utf-8') for entry in reader.entries()]
+
+    for facetList in [['clients'], ['registered', 'resourceTypes', 'affiliations'], facets]:
+        for body in bodies:
+            assert decodeFacets(body, facetList) == responseFacets(json.loads(body), facetList)
+        for line in lines:                              # archive lines decode the response they contain
+            assert decodeFacets(line, facetList) == responseFacets(json.loads(line)['response'], facetList)
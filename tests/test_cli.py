@@ -0,0 +1,39 @@
+import pytest
+
+from dataCiteFacets import cli
+from dataCiteFacets.targets import normalizeAffiliation, targetParameters
+
+
+@pytest.mark.parametrize('name, normalized', [('Texas A&M University', 'Texas A M University'),
+                                              ('  Aalto   University\n', 'Aalto University'),
+                                              ('University of Oslo (UiO)', 'University of Oslo UiO'),
+                                              ("Université d'Évry-Val-d'Essonne", 'Université d Évry Val d Essonne'),
+                                              ('*ETH* Zurich;', 'ETH Zurich')])
+def test_normalize_affiliation(name, normalized):
+    assert normalizeAffiliation(name) == normalized
+
+
+def test_affiliation_file(tmp_path):
+    affiliationFile = tmp_path / 'affiliations.txt'
+    affiliationFile.write_text('# institutions of the audit\n'
+                               'Texas A&M University\n'
+                               '\n'
+                               '   \n'
+                               'ETH Zurich\n'
+                               '  # ETH is listed twice\n'
+                               'eth  zurich\n'
+                               'Aalto University\n', encoding='utf-8')
+    assert cli.readAffiliationFile(str(affiliationFile)) == ['Texas A M University', 'ETH Zurich', 'eth zurich', 'Aalto University']
+
+    args = cli.createCommandLine().parse_args(['-al', 'Aalto University', 'Texas A & M University',
+                                               '--affiliationFile', str(affiliationFile)])
+    assert cli.commandLineAffiliations(args) == ['Aalto University', 'Texas A & M University', 'ETH Zurich']   # first spelling
+
+
+def test_html_header_is_escaped():
+    args = cli.createCommandLine().parse_args(['-al', 'Texas A&M University', '<script>alert(1)</script>',
+                                               '-il', 'Dataset', '-fl', 'clients'])
+    header = cli.htmlHeader(args, targetParameters(args.affiliationList, []))
+    assert 'Texas A&amp;M University, &lt;script&gt;alert(1)&lt;/script&gt;' in header
+    assert '<script>' not in header
+    assert '<b>Item list:</b> Dataset<br>' in header
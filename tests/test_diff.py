@@ -0,0 +1,87 @@
+import csv
+import glob
+
+import pytest
+
+from dataCiteFacets import FacetQuery, cli
+from dataCiteFacets.archive import ResponseArchive
+from dataCiteWorld import resources, clients, createRecords, response
+
+
+def snapshotRecords()-> tuple:
+    '''
+        Records of two snapshots: the later one has 30 more Zenodo Datasets and no Images
+    '''
+    before = createRecords()
+    added = [dict(before[0], resource='Dataset', client=clients[0]) for i in range(30)]
+    after = [r for r in before if r['resource'] != 'Image'] + added
+    return (before, after)
+
+
+def writeSnapshot(archiveFile:str, records:list):
+    archive = ResponseArchive(archiveFile)
+    for u,p in FacetQuery(itemList=resources, facetList=['clients']).queries():
+        archive.write(u, p, response(records, resource=p[0]))
+    archive.close()
+
+
+def expectedChanges(before:list, after:list)-> dict:
+    '''
+        {(parameters, facet, id): (countBefore, countAfter)} of the values that changed
+    '''
+    changes = {}
+    for resource in resources:
+        b, a = response(before, resource=resource)['meta'], response(after, resource=resource)['meta']
+        counts = {('NumberOfRecords', ''): [b['total'], a['total']]}
+        for d in b['clients']:
+            counts.setdefault(('clients', d['id']), [0, 0])[0] = d['count']
+        for d in a['clients']:
+            counts.setdefault(('clients', d['id']), [0, 0])[1] = d['count']
+        changes.update(((resource,) + k, tuple(v)) for k, v in counts.items() if v[0] != v[1])
+    return changes
+
+
+def readDiff(directory)-> list:
+    diffFiles = glob.glob(str(directory / 'DataCite_diff__*.csv'))
+    assert len(diffFiles) == 1 and len(glob.glob(str(directory / 'DataCite_diff__*.html'))) == 1
+    with open(diffFiles[0], encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    before, after = snapshotRecords()
+    writeSnapshot(str(tmp_path / 'DataCite_20260101_060000.jsonl.gz'), before)
+    writeSnapshot(str(tmp_path / 'DataCite_20260201_060000.jsonl.gz'), after)
+    return (before, after)
+
+
+def test_diff_archives(tmp_path, snapshots):
+    cli.main(['-fl', 'clients', '--diff', 'DataCite_20260101_060000.jsonl.gz', 'DataCite_20260201_060000.jsonl.gz'])
+    rows = readDiff(tmp_path)
+
+    changes = {(r['parameters'], r['facet'], r['id']): (int(r['before']), int(r['after'])) for r in rows}
+    assert changes == expectedChanges(*snapshots)
+    assert changes[('Dataset', 'NumberOfRecords', '')][1] - changes[('Dataset', 'NumberOfRecords', '')][0] == 30
+    deltas = [abs(int(r['delta'])) for r in rows]
+    assert deltas == sorted(deltas, reverse=True)                       # largest changes first
+    for r in rows:
+        assert int(r['delta']) == int(r['after']) - int(r['before'])
+        assert r['change'] == ('added' if r['before'] == '0' else 'removed' if r['after'] == '0' else 'changed')
+        if r['change'] == 'changed':
+            assert float(r['pctChange']) == pytest.approx(int(r['delta']) / int(r['before']))
+    assert {r['change'] for r in rows if r['parameters'] == 'Image'} == {'removed'}
+
+
+def test_diff_csv_and_archive(tmp_path, snapshots):
+    cli.main(['-il'] + resources + ['-fl', 'clients', '--csvout', '--from-archive', 'DataCite_20260101_060000.jsonl.gz'])
+    csvFile = tmp_path / 'DataCite__combined__20260101_06_reprocessed.csv'
+    assert csvFile.exists()
+    cli.main(['-fl', 'clients', '--diff', str(csvFile), 'DataCite_20260201_060000.jsonl.gz'])
+    rows = readDiff(tmp_path)
+
+    titles = dict(clients)                              # the csv has the titles of the clients
+    expected = {(p, f, titles.get(i, i)): counts for (p, f, i), counts in expectedChanges(*snapshots).items()}
+    assert {(r['parameters'], r['facet'], r['id']): (int(r['before']), int(r['after'])) for r in rows} == expected
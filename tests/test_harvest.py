@@ -0,0 +1,88 @@
+import urllib.parse
+
+import pytest
+
+from dataCiteFacets.harvest import harvestURL, harvestQuery, readHarvest, readHarvestState
+from dataCiteFacets.metrics import RunMetrics
+
+queryURL = 'https://api.datacite.org/dois?&page[size]=1&resource-type-id=software'
+records = [{'id': f'10.5281/zenodo.{i}', 'type': 'dois', 'attributes': {'titles': [{'title': f'Software {i}'}]}}
+                for i in range(7)]
+
+
+class PageResponse:
+    def __init__(self, page:dict):
+        self.page = page
+
+    def json(self):
+        return self.page
+
+
+class CursorPages:
+    '''
+        retrieveMetadata of a DataCite with cursor pages of pageSize records. links.next has the cursor but
+        not page[size] or disable-facets. failAt is the number of the page that fails (None = no failure).
+    '''
+    def __init__(self, pageSize:int, failAt:int = None):
+        self.pageSize = pageSize
+        self.failAt = failAt
+        self.URLs = []
+
+    def __call__(self, URL:str):
+        self.URLs.append(URL)
+        cursor = urllib.parse.parse_qs(urllib.parse.urlsplit(URL).query)['page[cursor]'][0]
+        start = 0 if cursor == '1' else int(cursor.split('=')[1])
+        if start // self.pageSize == self.failAt:
+            return None
+        page = {'data': records[start:start + self.pageSize], 'meta': {'total': len(records)}, 'links': {}}
+        if start + self.pageSize < len(records):
+            page['links']['next'] = ('https://api.datacite.org/dois?page%5Bcursor%5D='
+                                     + urllib.parse.quote(f'after={start + self.pageSize}') + '&resource-type-id=software')
+        return PageResponse(page)
+
+
+def test_harvest_url():
+    URL = harvestURL(queryURL, 500, 'after=10')
+    assert URL == ('https://api.datacite.org/dois?page[cursor]=after%3D10&page[size]=500&resource-type-id=software'
+                   '&disable-facets=true')
+    assert harvestURL(queryURL).startswith('https://api.datacite.org/dois?page[cursor]=1&page[size]=1000&')
+
+
+def test_harvest_pages(tmp_path):
+    pages = CursorPages(3)
+    outputFile = str(tmp_path / 'Software.jsonl.gz')
+    state = harvestQuery(pages, queryURL, ('Software',), outputFile, RunMetrics(), pageSize=3)
+
+    assert len(pages.URLs) == 3                         # ends on the last page (no links.next)
+    for URL in pages.URLs:                              # links.next does not have page[size] and disable-facets
+        assert 'page[size]=3' in URL and URL.endswith('&disable-facets=true')
+    assert list(readHarvest(outputFile)) == records
+    assert state == readHarvestState(outputFile + '.state')
+    assert (state['next'], state['records'], state['total']) == (None, 7, 7)
+
+    assert harvestQuery(pages, queryURL, ('Software',), outputFile, RunMetrics(), pageSize=3) == state
+    assert len(pages.URLs) == 3                         # a complete harvest is not retrieved again
+
+
+def test_harvest_resume(tmp_path):
+    outputFile = str(tmp_path / 'Software.jsonl.gz')
+    state = harvestQuery(CursorPages(2, failAt=2), queryURL, ('Software',), outputFile, RunMetrics(), pageSize=2)
+    assert state['records'] == 4 and 'after%3D4' in state['next']
+
+    with open(outputFile, 'ab') as f:                   # partial gzip member of an interrupted page
+        f.write(b'\x1f\x8b\x08\x00partial')
+    pages = CursorPages(2)
+    state = harvestQuery(pages, queryURL, ('Software',), outputFile, RunMetrics(), pageSize=2)
+
+    assert pages.URLs[0] == harvestURL(queryURL, 2, 'after=4')
+    assert (state['next'], state['records']) == (None, 7)
+    assert list(readHarvest(outputFile)) == records
+
+
+def test_harvest_without_cursor(tmp_path):
+    def retrieveMetadata(URL):
+        return PageResponse({'data': records[:2], 'meta': {'total': 7},
+                             'links': {'next': 'https://api.datacite.org/dois?page%5Bnumber%5D=2'}})
+
+    with pytest.raises(ValueError):
+        harvestQuery(retrieveMetadata, queryURL, ('Software',), str(tmp_path / 'Software.jsonl.gz'), RunMetrics(), 2)
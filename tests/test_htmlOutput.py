@@ -0,0 +1,18 @@
+import warnings
+
+import pandas as pd
+
+from dataCiteFacets.diff import changeColumns
+from dataCiteFacets.htmlOutput import writeHTMLOutput, dataframeToHTML
+
+
+def test_table_style():
+    assert 'table.facets { border: 1px solid black; width: 100% }' in dataframeToHTML(pd.DataFrame({'a': [1]}), True)
+
+
+def test_empty_table(tmp_path):
+    df = pd.DataFrame([], columns=changeColumns)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        writeHTMLOutput(str(tmp_path / 'diff.html'), df, False, '', '20260101_06')
+    assert '<th>pctChange</th>' in (tmp_path / 'diff.html').read_text()
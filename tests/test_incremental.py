@@ -0,0 +1,60 @@
+import requests
+
+from dataCiteFacets import FacetQuery, FacetRun
+from dataCiteFacets.metrics import RunMetrics
+from dataCiteFacets.retrieval import Retriever
+from dataCiteFacets.sinks import DatabaseRowSink, readSnapshot
+from dataCiteFacets.targets import countURL
+
+
+class RecordingRetriever(Retriever):
+    '''
+        Retriever recording the URLs it retrieves
+    '''
+    def __init__(self):
+        super().__init__(RunMetrics(), rateLimit=1000)
+        self.URLs = []
+
+    def retrieveMetadata(self, URL):
+        self.URLs.append(URL)
+        return super().retrieveMetadata(URL)
+
+
+def storedRun(apiURL:str, runId:str, facetList:list, retriever:Retriever = None)-> FacetRun:
+    query = FacetQuery(['resources'], facetList=facetList, apiURL=apiURL)
+    return FacetRun(query, runId=runId, dateStamp='20260101_06', retriever=retriever or RecordingRetriever())
+
+
+def writeRun(run:FacetRun, complete:bool = True)-> list:
+    sink = DatabaseRowSink(run.runId, run.dateStamp, run.query.targets, run.query.facetList, carriedFrom=run.carriedFrom,
+                           batchSize=10)
+    if not complete:
+        sink.close = sink.abort
+    return run.run([sink])
+
+
+def test_count_url(standIn):
+    URL = FacetQuery(['resources'], facetList=['clients'], apiURL=standIn.apiURL).URL_List[0]
+    assert countURL(URL) == standIn.apiURL + '?page[size]=0&resource-type-id=Audiovisual&disable-facets=true'
+    response = requests.get(countURL(URL), timeout=30).json()
+    assert response['data'] == [] and set(response['meta']) <= {'total', 'totalPages', 'page'}
+
+
+def test_incremental_run(standIn, tmp_path, monkeypatch):
+    monkeypatch.setenv('DATACITE_STATISTICS_DATABASE', str(tmp_path / 'statistics.db'))
+    rows = writeRun(storedRun(standIn.apiURL, 'RUN1', ['clients']))
+    writeRun(storedRun(standIn.apiURL, 'RUN2', ['registered']))             # without the clients facet
+    writeRun(storedRun(standIn.apiURL, 'RUN3', ['clients', 'registered']), complete=False)
+
+    run = storedRun(standIn.apiURL, 'RUN4', ['clients'])
+    previous = readSnapshot(run.query.param_List, run.query.facetList, run.runId)
+    assert len(previous) == len(run.query) == 32
+    assert {queryId for numberOfRecords, queryId, facetValues in previous.values()} == set(range(1, 33))      # RUN1
+    assert run.carryForward(previous) == 32
+    assert run.retriever.URLs == [countURL(u) for u in run.query.URL_List]
+    assert writeRun(run) == rows
+    assert len(run.retriever.URLs) == 32                # no query is retrieved with its facets
+
+    again = storedRun(standIn.apiURL, 'RUN5', ['clients'])
+    previous = readSnapshot(again.query.param_List, again.query.facetList, again.runId)
+    assert {queryId for numberOfRecords, queryId, facetValues in previous.values()} == set(range(1, 33))      # carried from RUN1
@@ -0,0 +1,58 @@
+import json
+
+from dataCiteFacets import cli
+from dataCiteFacets.metrics import RunMetrics
+from dataCiteFacets.retrieval import MemoryCache
+
+reports = [{'name': 'combined', 'arguments': '-il Dataset Software PhysicalObject IsCitedBy Cites --combineQueries '
+                                              '-fl clients resourceTypes registered --csvout --runReport combined.json'},
+           {'name': 'resources', 'arguments': '--resources -fl clients --csvout --runReport resources.json'}]
+
+
+def runJob(tmp_path, monkeypatch, standIn, plan:bool)-> tuple:    # (requests, report requests)
+    tmp_path.mkdir()
+    jobReports = [dict(r, arguments=r['arguments'] + (' --plan' if plan else '')) for r in reports]
+    (tmp_path / 'job.json').write_text(json.dumps({'reports': jobReports}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    requestCount = standIn.requestCount
+    cli.main(['--job', 'job.json', '--apiURL', standIn.apiURL, '--no-cache', '--workers', '4', '--rateLimit', '1000'])
+    reportRequests = [json.loads((tmp_path / (r['name'] + '.json')).read_text())['retrieval'].get('requests', 0) for r in reports]
+    return (standIn.requestCount - requestCount, reportRequests)
+
+
+def test_job_plan(tmp_path, monkeypatch, standIn):
+    requests, reportRequests = runJob(tmp_path / 'all', monkeypatch, standIn, False)
+    assert requests == 6 + 32
+    assert reportRequests == [6, 32]
+
+    planned, reportRequests = runJob(tmp_path / 'plan', monkeypatch, standIn, True)
+    assert planned < requests                       # the pruned combinations are not retrieved
+    assert sum(reportRequests) == planned           # every request is counted by the report that made it
+
+    outputs = {(job, name): next((tmp_path / job / name).glob('DataCite__combined__*.csv')).read_text().splitlines()
+                    for job in ['all', 'plan'] for name in ['combined', 'resources']}
+    assert outputs[('plan', 'resources')] == outputs[('all', 'resources')]
+    assert set(outputs[('plan', 'combined')]) < set(outputs[('all', 'combined')])     # without the pruned combinations
+
+
+def test_memory_cache_uses():
+    cache = MemoryCache(100)
+    metrics = RunMetrics()
+    retrieved = []
+
+    def retrieve(URL):
+        retrieved.append(URL)
+        return URL.upper()
+
+    cache.get('a', retrieve, metrics)               # probe before the uses are known
+    cache.get('b', retrieve, metrics)
+    cache.expectUses({'a': 2, 'c': 1})
+    assert list(cache.entries) == ['a']             # b is not used again
+
+    assert cache.get('a', retrieve, metrics) == 'A'
+    assert 'a' in cache.entries
+    assert cache.get('a', retrieve, metrics) == 'A'
+    assert cache.get('c', retrieve, metrics) == 'C'
+    assert len(cache.entries) == 0                  # dropped after their last use
+    assert retrieved == ['a', 'b', 'c']
@@ -0,0 +1,128 @@
+import json
+import zlib
+import sqlite3
+
+import pytest
+import requests
+
+import dataCiteFacets.run
+from dataCiteFacets import FacetQuery, FacetRun
+from dataCiteFacets.journal import readJournal, writeJournalEntry
+from dataCiteFacets.archive import ArchiveReader
+from dataCiteFacets.sinks import CSVRowSink, DatabaseRowSink
+from dataCiteFacets.targets import facetColumns
+
+
+class Killed(BaseException):
+    '''
+        The run was killed (not an Exception, so nothing in the run handles it)
+    '''
+
+
+class FakeRetriever:
+    '''
+        Retriever returning a small response for every URL and counting the retrievals
+    '''
+    responseCache = None
+
+    def __init__(self):
+        self.retrieved = []
+
+    def retrieveMetadata(self, URL):
+        self.retrieved.append(URL)
+        n = zlib.crc32(URL.encode('utf-8')) % 1000
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = json.dumps({'data': [], 'meta': {'total': n, 'clients': [
+            {'id': 'a.b', 'title': 'A, B', 'count': n // 2}, {'id': 'c.d', 'title': 'C', 'count': n - n // 2}]}}).encode('utf-8')
+        return response
+
+
+def tornWriter(killAt:int):
+    '''
+        writeJournalEntry that is killed while it writes its killAt-th entry, leaving half of the line in the journal
+    '''
+    calls = []
+
+    def write(journal, p, URL, result):
+        calls.append(p)
+        if len(calls) < killAt:
+            return writeJournalEntry(journal, p, URL, result)
+        line = json.dumps({'parameters': list(p), 'URL': URL, 'numberOfRecords': result[0], 'facetValues': result[2]})
+        journal.write(line[:len(line) // 2])
+        journal.flush()
+        raise Killed()
+    return write
+
+
+def facetRun(journalDirectory, retriever, completed=None):
+    query = FacetQuery(['resources'], facetList=['clients'], apiURL='http://127.0.0.1:1/dois')
+    return FacetRun(query, journalDirectory=str(journalDirectory), runId='RESUMEME', dateStamp='20260101_06',
+                    completed=completed, retriever=retriever)
+
+
+def test_resume_after_torn_writes(tmp_path, monkeypatch):
+    retriever = FakeRetriever()
+    journalFile = tmp_path / 'RESUMEME.jsonl'
+
+    monkeypatch.setattr(dataCiteFacets.run, 'writeJournalEntry', tornWriter(10))
+    with pytest.raises(Killed):
+        facetRun(tmp_path, retriever).run()
+
+    header, completed = readJournal(str(journalFile))
+    assert len(completed) == 9
+    monkeypatch.setattr(dataCiteFacets.run, 'writeJournalEntry', tornWriter(5))
+    with pytest.raises(Killed):
+        facetRun(tmp_path, retriever, completed).run()
+
+    header, completed = readJournal(str(journalFile))
+    assert len(completed) == 13
+    monkeypatch.setattr(dataCiteFacets.run, 'writeJournalEntry', writeJournalEntry)
+    rows = facetRun(tmp_path, retriever, completed).run()
+
+    lines = journalFile.read_text(encoding='utf-8').splitlines()
+    entries = [json.loads(line) for line in lines[1:]]          # every line is complete
+    queries = facetRun(tmp_path, None).query
+    assert [tuple(e['parameters']) for e in entries] == [tuple(p) for p in queries.param_List]
+    assert len(retriever.retrieved) == len(queries) + 2         # only the two torn queries are retrieved again
+
+    expected = FacetRun(queries, runId='RESUMEME', dateStamp='20260101_06', retriever=FakeRetriever()).run()
+    assert rows == expected
+
+
+class KilledRetriever(FakeRetriever):
+    '''
+        FakeRetriever that is killed at its killAt-th retrieval
+    '''
+    def __init__(self, killAt:int):
+        super().__init__()
+        self.killAt = killAt
+
+    def retrieveMetadata(self, URL):
+        if len(self.retrieved) + 1 >= self.killAt:
+            raise Killed()
+        return super().retrieveMetadata(URL)
+
+
+def test_interrupted_run_closes_outputs(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATACITE_STATISTICS_DATABASE', str(tmp_path / 'statistics.db'))
+    journals = []
+    openJournal = FacetRun.openJournal
+    monkeypatch.setattr(FacetRun, 'openJournal', lambda self: journals.append(openJournal(self)) or journals[-1])
+
+    run = facetRun(tmp_path, KilledRetriever(10))
+    run.jsonDirectory = str(tmp_path)
+    run.batchSize = 4
+    sinks = [CSVRowSink(str(tmp_path / 'rows.csv'), facetColumns(['parameter'], ['clients'])),
+             DatabaseRowSink(run.runId, run.dateStamp, run.query.targets, run.query.facetList, batchSize=2)]
+    with pytest.raises(Killed):
+        run.run(sinks)
+
+    assert journals[0].closed and sinks[0].f.closed and run.archive is None
+    with pytest.raises(sqlite3.ProgrammingError):   # the database is closed
+        sinks[1].cur.execute('SELECT 1')
+    assert len(ArchiveReader(str(tmp_path / 'DataCite_RESUMEME.jsonl.gz'))) == 9
+    assert len((tmp_path / 'rows.csv').read_text(encoding='utf-8').splitlines()) == 1 + 8
+    con = sqlite3.connect(str(tmp_path / 'statistics.db'))
+    assert con.execute('SELECT complete FROM runs').fetchall() == [(0,)]
+    assert con.execute('SELECT COUNT(*) FROM queries').fetchone()[0] == 8        # the committed batches are kept
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from dataCiteFacets import metrics
+from dataCiteFacets.metrics import RunMetrics, writePrometheusTextfile
+
+
+def test_latency_percentiles():
+    runMetrics = RunMetrics()
+    runMetrics.httpLatencies.extend(float(s) for s in range(100, 0, -1))
+    latency = runMetrics.report('RUN', '20260101_06', '', 100, 90)['httpLatencySeconds']
+    assert latency == pytest.approx({'p50': 50.5, 'p95': 95.05, 'p99': 99.01, 'mean': 50.5, 'max': 100.0})
+
+    runMetrics = RunMetrics(latencySamples=10)          # the latest 10 samples: 91 ... 100
+    runMetrics.httpLatencies.extend(float(s) for s in range(1, 101))
+    latency = runMetrics.report('RUN', '20260101_06', '', 100, 90)['httpLatencySeconds']
+    assert latency == pytest.approx({'p50': 95.5, 'p95': 99.55, 'p99': 99.91, 'mean': 95.5, 'max': 100.0})
+
+    assert RunMetrics().report('RUN', '20260101_06', '', 0, 0)['httpLatencySeconds'] == {}
+
+
+def test_stage_timer():
+    runMetrics = RunMetrics()
+    for stage in ['HTTP', 'HTTP', 'CSV']:
+        with runMetrics.stageTimer(stage):
+            pass
+    with pytest.raises(KeyError):
+        with runMetrics.stageTimer('HTTP'):             # failed requests are timed too
+            raise KeyError
+    runMetrics.countStatistic('requests', 4)
+    runMetrics.countStatistic('retries')
+
+    report = runMetrics.report('RUN', '20260101_06', '-il Dataset', 3, 2)
+    assert {k: v['count'] for k,v in report['stages'].items()} == {'HTTP': 3, 'CSV': 1}
+    assert len(runMetrics.httpLatencies) == 3
+    assert report['retrieval'] == {'requests': 4, 'retries': 1}
+    assert (report['runId'], report['URLs'], report['rows']) == ('RUN', 3, 2)
+
+
+def prometheusSamples(textfile:str)-> dict:
+    '''
+        {(metric name, label): value} of the samples in a Prometheus textfile
+    '''
+    samples = {}
+    with open(textfile) as f:
+        for line in f.read().splitlines():
+            if line.startswith('#'):
+                continue
+            name, value = line.rsplit(' ', 1)
+            metric, _, label = name.partition('{')
+            samples[(metric, label.rstrip('}'))] = float(value)
+    return samples
+
+
+def test_prometheus_textfile(tmp_path):
+    report = {'seconds': 12.5, 'URLs': 40,
+              'stages': {'HTTP': {'seconds': 10.25, 'count': 40}, 'CSV': {'seconds': 0.5, 'count': 1}},
+              'httpLatencySeconds': {'p50': 0.2, 'p95': 0.75, 'p99': 1.5, 'mean': 0.25, 'max': 2.0},
+              'retrieval': {'requests': 42, 'retries': 2, 'bytes': 123456}}
+    textfile = str(tmp_path / 'datacite_facets.prom')
+    writePrometheusTextfile(textfile, report)
+
+    with open(textfile) as f:
+        lines = f.read().splitlines()
+    metricNames = ['datacite_facets_run_seconds', 'datacite_facets_urls', 'datacite_facets_stage_seconds',
+                   'datacite_facets_http_latency_seconds', 'datacite_facets_retrieval']
+    assert [l.split()[2] for l in lines if l.startswith('# HELP')] == metricNames
+    assert [l.split()[2:] for l in lines if l.startswith('# TYPE')] == [[m, 'gauge'] for m in metricNames]
+    assert prometheusSamples(textfile) == {('datacite_facets_run_seconds', ''): 12.5,
+                                           ('datacite_facets_urls', ''): 40,
+                                           ('datacite_facets_stage_seconds', 'stage="HTTP"'): 10.25,
+                                           ('datacite_facets_stage_seconds', 'stage="CSV"'): 0.5,
+                                           ('datacite_facets_http_latency_seconds', 'quantile="0.50"'): 0.2,
+                                           ('datacite_facets_http_latency_seconds', 'quantile="0.95"'): 0.75,
+                                           ('datacite_facets_http_latency_seconds', 'quantile="0.99"'): 1.5,
+                                           ('datacite_facets_retrieval', 'statistic="requests"'): 42,
+                                           ('datacite_facets_retrieval', 'statistic="retries"'): 2,
+                                           ('datacite_facets_retrieval', 'statistic="bytes"'): 123456}
+    assert os.listdir(tmp_path) == ['datacite_facets.prom']     # no temporary file is left
+
+
+def test_prometheus_textfile_is_replaced(tmp_path, monkeypatch):
+    textfile = str(tmp_path / 'datacite_facets.prom')
+    report = {'seconds': 1.0, 'URLs': 1, 'stages': {}, 'httpLatencySeconds': {}, 'retrieval': {}}
+    writePrometheusTextfile(textfile, report)
+    with open(textfile) as f:
+        previous = f.read()
+
+    replaced = []
+    def replace(src, dst):                              # the collector sees the previous file until the rename
+        with open(dst) as f:
+            assert f.read() == previous
+        replaced.append((src, dst))
+        os.rename(src, dst)
+    monkeypatch.setattr(metrics.os, 'replace', replace)
+    writePrometheusTextfile(textfile, dict(report, URLs=2))
+
+    assert replaced == [(textfile + '.tmp', textfile)]
+    assert prometheusSamples(textfile)[('datacite_facets_urls', '')] == 2
+    with open(textfile) as f:
+        assert 'datacite_facets_http_latency_seconds{' not in f.read()     # no samples without latencies
@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+from dataCiteFacets import FacetQuery, FacetRun
+from dataCiteFacets.metrics import RunMetrics
+from dataCiteFacets.retrieval import Retriever
+from dataCiteWorld import relations, resources, affiliations, years, minYear, createRecords, response
+
+
+def worldRun(standIn, query:FacetQuery, prepare = None)-> tuple:      # (rows, requests)
+    '''
+        Run a query against the synthetic DataCite after prepare(run) (planQueries, deriveQueries, ...)
+    '''
+    metrics = RunMetrics()
+    run = FacetRun(query, runId='WORLD', dateStamp='20260101_06', metrics=metrics,
+                   retriever=Retriever(metrics, rateLimit=1000))
+    requestsBefore, missesBefore = standIn.requestCount, standIn.missCount
+    if prepare is not None:
+        prepare(run)
+    rows = run.run()
+    assert standIn.missCount == missesBefore                            # every query is in the archive
+    return (rows, standIn.requestCount - requestsBefore)
+
+
+def combinedQuery(standIn, facetList:list = ('clients',))-> FacetQuery:
+    return FacetQuery(['years'], itemList=relations + resources, minYear=minYear, combineQueries=True,
+                      facetList=list(facetList), apiURL=standIn.apiURL)
+
+
+def test_plan_queries(worldStandIn):
+    rows, requests = worldRun(worldStandIn, combinedQuery(worldStandIn))
+    query = combinedQuery(worldStandIn)
+    plannedRows, plannedRequests = worldRun(worldStandIn, query, FacetRun.planQueries)
+
+    assert plannedRows == rows                                          # only empty combinations are pruned
+    records = createRecords()
+    empty = [p for p in itertools.product(relations, resources, years) if response(records, *p)['meta']['total'] == 0]
+    assert query.pruned == len(empty) > 0                               # every empty combination has an empty pair
+    assert ('Cites', 'Image', years[0]) in empty and ('Cites', 'Image', years[0]) not in query.param_List
+    assert requests == len(relations) * len(resources) * len(years)
+    assert plannedRequests == requests - query.pruned + len(relations) + len(resources) + len(years)
+    assert plannedRequests < requests
+
+
+@pytest.mark.parametrize('facetList', [['registered'], ['resourceTypes'], ['resourceTypes', 'registered']])
+def test_derive_queries(worldStandIn, facetList):
+    def query():
+        return FacetQuery(['years'], itemList=resources, minYear=minYear, combineQueries=True, facetList=facetList,
+                          apiURL=worldStandIn.apiURL)
+
+    rows, requests = worldRun(worldStandIn, query())
+    derivedRows, derivedRequests = worldRun(worldStandIn, query(), FacetRun.deriveQueries)
+    assert derivedRows == rows
+    assert requests == len(resources) * len(years)
+    assert derivedRequests == len(years)                                # the resources are read from the year queries
+
+
+@pytest.mark.parametrize('targets, facetList', [(['years'], ['registered']), (['resources'], ['resourceTypes'])])
+def test_derive_single_target(worldStandIn, targets, facetList):
+    query = FacetQuery(targets, minYear=minYear, facetList=facetList, apiURL=worldStandIn.apiURL)
+    run = FacetRun(query, retriever=Retriever(RunMetrics(), rateLimit=1000))
+    requestsBefore = worldStandIn.requestCount
+    assert run.deriveQueries() == 0
+    assert worldStandIn.requestCount == requestsBefore                 # the all DOIs query is not retrieved
+
+
+def test_resolve_affiliations(worldStandIn):
+    def query():
+        return FacetQuery(itemList=['Dataset', 'Software'], affiliationList=affiliations, combineQueries=True,
+                          facetList=['clients', 'affiliations'], apiURL=worldStandIn.apiURL)
+
+    rows, requests = worldRun(worldStandIn, query())
+    resolved = query()
+    resolvedRows, resolvedRequests = worldRun(worldStandIn, resolved, lambda run: run.resolveAffiliations(batchSize=4))
+
+    assert resolvedRows == rows
+    assert resolved.parameters['affiliations']['data'] == affiliations[:4]
+    assert len(resolved) == 2 * 4
+    assert requests == 2 * len(affiliations)
+    assert resolvedRequests < requests                                  # including the probes
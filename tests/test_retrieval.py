@@ -0,0 +1,163 @@
+import os
+import time
+import json
+import threading
+import email.utils
+import http.server
+
+import pytest
+import requests
+
+from dataCiteFacets.metrics import RunMetrics
+from dataCiteFacets.retrieval import retryDelay, cacheTTL, closedYearTTL, ResponseCache, Retriever, MemoryCache
+
+
+def retryResponse(retryAfter:str)-> requests.models.Response:
+    response = requests.models.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = retryAfter
+    return response
+
+
+@pytest.mark.parametrize('retryAfter, delay', [('5', 5.0), ('86400', 60.0), ('-3', 0.0),
+                                               (email.utils.formatdate(4e9, usegmt=True), 60.0)])
+def test_retry_after_is_clamped(retryAfter, delay):
+    assert retryDelay(0, retryResponse(retryAfter), 1.0, 60.0) == pytest.approx(delay)
+
+
+def test_cache_ttl():
+    URL = 'https://api.datacite.org/dois?page[size]=0&facets=clients&registered='
+    assert cacheTTL(URL + '2026', 12.0, 2026) == 12 * 3600
+    assert cacheTTL(URL + '2010', 12.0, 2026) == closedYearTTL * 3600
+    assert cacheTTL(URL + '2010', 24 * 365.0, 2026) == 24 * 365 * 3600
+    assert cacheTTL(URL[:-len('&registered=')], 12.0, 2026) == 12 * 3600
+
+
+class ETagHandler(http.server.BaseHTTPRequestHandler):
+    '''
+        /dois responses with an ETag: a request with the current ETag (If-None-Match) gets 304 Not Modified
+    '''
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('If-None-Match')))
+        etag = f'"v{server.version}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = json.dumps({'data': [], 'meta': {'total': server.version, 'path': self.path}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/vnd.api+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def etagServer():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.version = 1
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.apiURL = f'http://127.0.0.1:{server.server_port}/dois'
+    yield server
+    server.shutdown()
+
+
+def cachedRetriever(cacheDirectory, ttlHours:float = 12.0)-> Retriever:
+    return Retriever(RunMetrics(), rateLimit=1000, responseCache=ResponseCache(str(cacheDirectory), 10**6), cacheTTL=ttlHours)
+
+
+def test_cache_hit(etagServer, tmp_path):
+    URL = etagServer.apiURL + '?resource-type-id=dataset'
+    retriever = cachedRetriever(tmp_path)
+    assert retriever.retrieveMetadata(URL).json()['meta']['total'] == 1
+    etagServer.version = 2
+
+    cached = cachedRetriever(tmp_path)                  # a later run with the same cache
+    assert cached.retrieveMetadata(URL).json()['meta'] == {'total': 1, 'path': '/dois?resource-type-id=dataset'}
+    assert len(etagServer.requests) == 1
+    assert cached.metrics.retrievalStatistics['cacheHits'] == 1
+
+
+def test_cache_revalidation(etagServer, tmp_path):
+    URL = etagServer.apiURL + '?resource-type-id=dataset'
+    cachedRetriever(tmp_path).retrieveMetadata(URL)
+    entryFile = ResponseCache(str(tmp_path), 10**6).path(URL)
+    with open(entryFile, encoding='utf-8') as f:
+        retrieved = json.load(f)['retrieved']
+
+    expired = cachedRetriever(tmp_path, ttlHours=0)     # every entry is stale
+    assert expired.retrieveMetadata(URL).json()['meta']['total'] == 1
+    assert etagServer.requests[-1] == ('/dois?resource-type-id=dataset', '"v1"')
+    assert expired.metrics.retrievalStatistics['revalidated'] == 1
+    with open(entryFile, encoding='utf-8') as f:
+        assert json.load(f)['retrieved'] > retrieved     # the TTL starts again
+
+    etagServer.version = 2                              # changed: the new response replaces the entry
+    assert expired.retrieveMetadata(URL).json()['meta']['total'] == 2
+    assert cachedRetriever(tmp_path).retrieveMetadata(URL).json()['meta']['total'] == 2
+    assert len(etagServer.requests) == 3
+
+
+def test_cache_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), 10**6)
+    response = requests.models.Response()
+    response._content = b'x' * 1000
+    response.encoding = 'utf-8'
+    URLs = [f'https://api.datacite.org/dois?query={i}' for i in range(6)]
+
+    def cachedBytes()-> int:                            # size of the entries in the cache directory
+        return sum(os.path.getsize(cache.path(URL)) for URL in URLs if os.path.exists(cache.path(URL)))
+
+    for i, URL in enumerate(URLs[:5]):
+        cache.put(URL, response)
+        os.utime(cache.path(URL), (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.cacheBytes == cachedBytes()
+
+    assert cache.get(URLs[0]) is not None               # used: the most recently used entry
+    cache.maxBytes = cachedBytes() + 500                # the next write goes over the limit
+    cache.put(URLs[5], response)
+    kept = [URL for URL in URLs if os.path.exists(cache.path(URL))]
+    assert kept == [URLs[0], URLs[3], URLs[4], URLs[5]]     # the least recently used entries are evicted
+    assert cache.cacheBytes == cachedBytes() <= cache.evictTo * cache.maxBytes
+
+    cache.put(URLs[0], response)                        # replacing an entry does not grow the cache
+    assert cache.cacheBytes == cachedBytes()
+
+
+@pytest.mark.parametrize('response', ['response', None])
+def test_memory_cache_coalescing(response):
+    cache = MemoryCache(100)
+    metrics = RunMetrics()
+    released = threading.Event()
+    retrieved = []
+
+    def retrieve(URL):
+        retrieved.append(URL)
+        released.wait(10)                               # until every thread is waiting for this retrieval
+        return response
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('a', retrieve, metrics))) for i in range(8)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 10
+    while metrics.retrievalStatistics['coalesced'] < 7 and time.time() < deadline:
+        time.sleep(0.01)
+    released.set()
+    for t in threads:
+        t.join()
+
+    assert retrieved == ['a']                           # one upstream retrieval for all threads
+    assert metrics.retrievalStatistics['coalesced'] == 7
+    assert results == [response] * 8
+    cache.get('a', retrieve, metrics)
+    assert len(retrieved) == (1 if response else 2)     # failed retrievals are not cached
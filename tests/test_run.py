@@ -0,0 +1,62 @@
+import time
+import random
+import threading
+
+import pytest
+
+from dataCiteFacets import FacetQuery, FacetRun
+
+
+def slowRun(workers:int)-> tuple:                       # (run, retrieved parameters)
+    '''
+        A run of 40 queries whose retrievals take a random time and record their parameters
+    '''
+    query = FacetQuery(itemList=[str(i) for i in range(40)], facetList=['clients'])
+    query.URL_List = [f'https://api.datacite.org/dois?query={i}' for i in range(40)]
+    query.param_List = [(str(i),) for i in range(40)]
+    run = FacetRun(query, workers=workers)
+    run.retriever = object()                            # retrieveFacets is replaced, nothing is requested
+    retrieved = []
+    lock = threading.Lock()
+    rng = random.Random(7)
+    delays = [rng.uniform(0, 0.02) for i in range(40)]
+
+    def retrieveFacets(URL, p):
+        time.sleep(delays[int(p[0])])
+        with lock:
+            retrieved.append(p)
+        return (int(p[0]) + 1, None, None)
+
+    run.retrieveFacets = retrieveFacets
+    return (run, retrieved)
+
+
+@pytest.mark.parametrize('planned', [False, True])
+def test_workers_keep_order(planned):
+    run, retrieved = slowRun(4)
+    expected = list(range(40)) if planned else None     # the last queries are the largest
+    results = list(run.retrieveAllFacets(run.query.URL_List, run.query.param_List, expected))
+
+    assert [p for u, p, r in results] == run.query.param_List
+    assert [r[0] for u, p, r in results] == list(range(1, 41))
+    assert sorted(retrieved) == sorted(run.query.param_List)
+
+
+def test_planned_window():
+    run, retrieved = slowRun(2)
+    results = run.retrieveAllFacets(run.query.URL_List, run.query.param_List, [1] * 20 + [1000] * 20)
+    next(results)
+    assert len(retrieved) <= 2 * 4 + 2                 # the large queries at the end are outside the window
+    assert all(int(p[0]) < 8 for p in retrieved)
+    results.close()
+
+
+def test_close_stops_retrieval():
+    run, retrieved = slowRun(4)
+    results = run.retrieveAllFacets(run.query.URL_List, run.query.param_List, list(range(40)))
+    for i in range(3):
+        next(results)
+    results.close()                                     # waits for the retrievals in progress
+    count = len(retrieved)
+    time.sleep(0.1)
+    assert len(retrieved) == count < 40
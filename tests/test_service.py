@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+import requests
+
+from dataCiteFacets.run import FacetRun
+from dataCiteFacets.metrics import RunMetrics
+from dataCiteFacets.retrieval import Retriever, MemoryCache
+from dataCiteFacets.service import createService
+
+
+@pytest.fixture
+def service(standIn):
+    server = createService(0, Retriever(RunMetrics(), rateLimit=1000, memoryCache=MemoryCache()), apiURL=standIn.apiURL)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_facets(service):
+    response = requests.get(service + '/facets?targets=resources&facetList=clients', timeout=30)
+    assert response.status_code == 200
+    content = response.json()
+    assert content['targets'] == ['resources']
+    assert len(content['rows']) == content['queries'] == 32
+
+
+@pytest.mark.parametrize('query', ['targets=foo', 'itemList=NotAType', 'targets=resources&facetList=nope', 'minYear=abc'])
+def test_invalid_requests(service, query):
+    response = requests.get(service + '/facets?' + query, timeout=30)
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+
+def test_unexpected_error(service, monkeypatch):
+    def fail(self):
+        raise RuntimeError('broken run')
+    monkeypatch.setattr(FacetRun, 'rows', fail)
+    response = requests.get(service + '/facets?targets=resources', timeout=30)
+    assert response.status_code == 500
+    assert response.json() == {'error': 'RuntimeError: broken run'}
+
+    monkeypatch.undo()                              # the service still answers
+    assert requests.get(service + '/facets?itemList=Dataset&facetList=clients', timeout=30).status_code == 200
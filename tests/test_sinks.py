@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+
+import pytest
+
+from dataCiteFacets.sinks import DatabaseRowSink, readSnapshot
+from dataCiteFacets.diff import databaseQueries
+
+URL = 'https://api.datacite.org/dois?resource-type-id=dataset'
+
+
+def facetResult(n:int)-> tuple:
+    return (n, {}, {'clients': [{'id': f'c.{i}', 'title': f'C {i}', 'count': 1} for i in range(n)]})
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATACITE_STATISTICS_DATABASE', str(tmp_path / 'statistics.db'))
+    return str(tmp_path / 'statistics.db')
+
+
+def test_batches_are_committed(database):
+    first = DatabaseRowSink('RUN1', '20260101_06', ['resources'], ['clients'], batchSize=10)
+    for i in range(5):
+        first.write(URL, ('Dataset', str(i)), facetResult(4))     # the first three queries are committed
+
+    second = DatabaseRowSink('RUN2', '20260101_07', ['resources'], ['clients'], batchSize=10)
+    for i in range(3):
+        second.write(URL, ('Dataset', str(i)), facetResult(5))
+    second.close()                                  # the first run does not hold the write lock
+
+    con = sqlite3.connect(database)
+    assert con.execute('SELECT run_id, complete FROM runs ORDER BY run_id').fetchall() == [('RUN1', 0), ('RUN2', 1)]
+    assert con.execute("SELECT COUNT(*) FROM queries WHERE run_id = 'RUN1'").fetchone()[0] == 3
+    assert set(readSnapshot([('Dataset', str(i)) for i in range(5)], ['clients'], 'RUN3')) == {('Dataset', str(i)) for i in range(3)}
+    with pytest.raises(ValueError, match='incomplete'):
+        list(databaseQueries('RUN1'))
+
+    first.close()
+    assert con.execute("SELECT complete FROM runs WHERE run_id = 'RUN1'").fetchone()[0] == 1
+    queries = con.execute('SELECT q.run_id, COUNT(f.id) FROM queries q JOIN facet_values f USING (query_id) '
+                          'GROUP BY q.query_id ORDER BY q.query_id').fetchall()
+    assert queries == [('RUN1', 4)] * 3 + [('RUN2', 5)] * 3 + [('RUN1', 4)] * 2
+    snapshot = readSnapshot([('Dataset', str(i)) for i in range(5)], ['clients'], 'RUN3')
+    assert {p: v[0] for p, v in snapshot.items()} == {('Dataset', '0'): 5, ('Dataset', '1'): 5, ('Dataset', '2'): 5,
+                                                      ('Dataset', '3'): 4, ('Dataset', '4'): 4}
+    assert [len(values) for parameters, values in databaseQueries('RUN1')] == [5] * 5
+
+
+def test_concurrent_runs(database):
+    def writeRun(runId):
+        sink = DatabaseRowSink(runId, '20260101_06', ['resources'], ['clients'], batchSize=20)
+        for i in range(50):
+            sink.write(URL, ('Dataset', str(i)), facetResult(7))
+        sink.close()
+
+    threads = [threading.Thread(target=writeRun, args=(f'RUN{n}',)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    con = sqlite3.connect(database)
+    assert con.execute('SELECT COUNT(*), SUM(complete) FROM runs').fetchone() == (4, 4)
+    assert con.execute('SELECT COUNT(*) FROM facet_values f JOIN queries q USING (query_id) '
+                       'WHERE q.parameters LIKE \'%"Dataset"%\'').fetchone()[0] == 4 * 50 * 7
+    assert con.execute('SELECT COUNT(DISTINCT query_id) FROM facet_values').fetchone()[0] == 4 * 50
+
+
+def test_parquet_round_trip(standIn, tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    from dataCiteFacets import FacetQuery, FacetRun
+    from dataCiteFacets.sinks import CSVRowSink, ParquetSink
+    from dataCiteFacets.targets import facetColumns
+    from dataCiteFacets.diff import countStringValues
+
+    directory = str(tmp_path / 'parquet')
+    for runId, dateStamp in [('20260101_060000', '20260101_06'), ('20260102_060000', '20260102_06')]:
+        query = FacetQuery(itemList=['Dataset', 'Software', 'IsCitedBy'], facetList=['clients', 'registered'],
+                           apiURL=standIn.apiURL)
+        run = FacetRun(query, runId=runId, dateStamp=dateStamp)
+        csvSink = CSVRowSink(str(tmp_path / (runId + '.csv')), facetColumns(query.parameterNames, query.facetList))
+        run.run([csvSink, ParquetSink(directory, runId, dateStamp, query.facetList)])
+
+    rows = pd.read_csv(tmp_path / '20260101_060000.csv', dtype={'parameter': str, 'clients_common': str, 'registered_common': str})
+    assert len(rows) == 3
+    filters = [('dateStamp', '=', '20260101_06'), ('target', '=', 'resources')]
+    summary = pd.read_parquet(directory + '/summary', filters=filters)
+    assert list(summary['runId']) == ['20260101_060000'] * 2              # one run and one target
+    assert list(summary['resources']) == ['Dataset', 'Software']
+    expected = rows[rows['parameter'].isin(['Dataset', 'Software'])].reset_index(drop=True)
+    statisticColumns = [c for c in expected.columns if c not in ('parameter', 'DateTime')]
+    pd.testing.assert_frame_equal(summary[statisticColumns], expected[statisticColumns], check_dtype=False)
+    assert str(summary['NumberOfRecords'].dtype) == 'int64'
+
+    relations = pd.read_parquet(directory + '/summary', filters=[('target', '=', 'relations')])
+    assert sorted(relations['dateStamp'].astype(str)) == ['20260101_06', '20260102_06']     # appended by every run
+    assert list(relations['relations'].unique()) == ['IsCitedBy']
+
+    values = pd.read_parquet(directory + '/facet_values', filters=filters + [('facet', '=', 'clients')])
+    for resource, countString in zip(expected['parameter'], expected['clients']):
+        stored = values[values['resources'] == resource]
+        assert list(zip(stored['title'], stored['count'])) == [(t.replace(';', ','), c) for t, c in countStringValues(countString)]
+
+
+def test_csv_streaming(worldStandIn, tmp_path):
+    pd = pytest.importorskip('pandas')
+    from dataCiteFacets import FacetQuery, FacetRun
+    from dataCiteFacets.sinks import CSVRowSink
+    from dataCiteFacets.targets import facetColumns
+
+    class LineCounter:
+        '''
+            Sink after the csv sink: the lines of the csv file when each row is written
+        '''
+        name = 'lines'
+
+        def __init__(self, csvFile:str):
+            self.csvFile = csvFile
+            self.lines = []
+
+        def write(self, URL, p, result):
+            with open(self.csvFile, encoding='utf-8') as f:
+                self.lines.append(len(f.read().splitlines()))
+
+        def close(self):
+            pass
+
+    csvFile = str(tmp_path / 'streamed.csv')
+    from dataCiteWorld import resources, relations
+
+    query = FacetQuery(itemList=resources + relations, facetList=['clients', 'registered', 'affiliations'],
+                       apiURL=worldStandIn.apiURL)
+    run = FacetRun(query, batchSize=2, runId='STREAM', dateStamp='20260101_06')
+    counter = LineCounter(csvFile)
+    misses = worldStandIn.missCount
+    rows = run.run([CSVRowSink(csvFile, facetColumns(query.parameterNames, query.facetList)), counter])
+    assert worldStandIn.missCount == misses
+
+    assert len(rows) > 4
+    assert counter.lines == list(range(2, len(rows) + 2))      # every row is in the file when the next sink gets it
+
+    pd.DataFrame(rows).to_csv(tmp_path / 'inMemory.csv', encoding='utf-8', sep=',', index=False)   # the csv before streaming
+    with open(csvFile, encoding='utf-8') as streamed, open(tmp_path / 'inMemory.csv', encoding='utf-8') as inMemory:
+        assert streamed.read() == inMemory.read()
+
+
+def test_facet_values(worldStandIn):
+    pytest.importorskip('pandas')
+    from dataCiteFacets import FacetQuery, FacetRun
+    from dataCiteFacets.sinks import FacetValueSink
+    from dataCiteWorld import resources, years, minYear, createRecords, response
+
+    facetList = ['clients', 'affiliations', 'registered']
+    query = FacetQuery(['years'], itemList=resources, minYear=minYear, combineQueries=True, facetList=facetList,
+                       apiURL=worldStandIn.apiURL)
+    sink = FacetValueSink(query.parameterNames)
+    FacetRun(query, batchSize=5, runId='VALUES', dateStamp='20260101_06').run([sink])
+
+    df = sink.frame()
+    assert {c: str(df[c].dtype) for c in df.columns} == {'parameter 1': 'category', 'parameter 2': 'category',
+                                                         'facet': 'category', 'id': 'category', 'title': 'object',
+                                                         'count': 'int64'}
+    stored = {}
+    for resource, year, facet, id_, title, count in df.itertuples(index=False):
+        stored.setdefault((resource, year, facet), []).append((id_, title, count))
+    records = createRecords()
+    expected = {}
+    for resource in resources:
+        for year in years:
+            meta = response(records, resource=resource, year=year)['meta']
+            if meta['total'] == 0:                      # queries without records are not written
+                continue
+            for facet in facetList:
+                if len(meta[facet]) > 0:
+                    expected[(resource, year, facet)] = [(d['id'], d['title'], d['count']) for d in meta[facet]]
+    assert stored == expected
+    assert len(sink.queries()) == len({(r, y) for r, y, f in expected})
+
+
+def test_facet_pivot():
+    pytest.importorskip('pandas')
+    from dataCiteFacets.sinks import FacetValueSink, facetPivot
+
+    URL = 'https://api.datacite.org/dois?resource-type-id=dataset'
+    sink = FacetValueSink(['parameter'])
+    inrae = 'Institut national de recherche pour l’agriculture, l’alimentation et l’environnement (INRAE)'
+    sink.write(URL, ('Dataset',), (30, {}, {'clients': [{'id': 'inist.inra', 'title': inrae, 'count': 20},
+                                                        {'id': 'cern.zenodo', 'title': 'Zenodo', 'count': 10}]}))
+    sink.write(URL, ('Software',), (5, {}, {'clients': [{'id': 'cern.zenodo', 'title': 'Zenodo', 'count': 5}]}))
+    sink.write(URL, ('Text',), (3, {}, {}))             # a query without facet values
+
+    pivot = facetPivot(sink.frame(), 'clients', ['parameter'], sink.queries(), False)
+    assert list(pivot.columns) == ['parameter', inrae, 'Zenodo']       # titles are not changed
+    assert pivot.astype(object).where(pivot.notna(), None).values.tolist() == [['Dataset', 20, 10],
+                                                                               ['Software', None, 5],
+                                                                               ['Text', None, None]]
+    pivot = facetPivot(sink.frame(), 'clients', ['parameter'], sink.queries(), True)
+    assert list(pivot.columns) == ['parameter', 'inist.inra', 'cern.zenodo']
@@ -0,0 +1,80 @@
+import math
+import random
+
+import pytest
+
+from dataCiteFacets import facetStatisticNames
+from dataCiteFacets.statistics import createFacetsDictionaries, createFacetsDictionary
+
+
+def scalarStatistics(values:list,                       # [{id, title, count}] of a facet
+                     numberOfRecords:int,
+                     useID:bool = False)-> dict:
+    '''
+        The statistics of one facet computed value by value: the loops createFacetsDictionary used before
+        the statistics were vectorized, and the concentration measures from their definitions
+    '''
+    counts = [d['count'] for d in values]
+    n, total = len(counts), sum(counts)
+    shares = [c / total for c in counts] if total > 0 else [0.0] * n
+    ascending = sorted(counts)
+    label = 'id' if useID else 'title'
+    return {'number': n,
+            'max': max(counts),
+            'common': ', '.join([d['id'] for d in values if d['count'] == max(counts)]),
+            'total': total,
+            'HI': max(counts) / numberOfRecords,
+            'coverage': total / numberOfRecords,
+            'gini': sum((2 * (i + 1) - n - 1) * c for i, c in enumerate(ascending)) / (n * total) if total > 0 else 0.0,
+            'entropy': -sum(s * math.log(s) for s in shares if s > 0) / math.log(n) if n > 1 else 0.0,
+            'top3': sum(sorted(counts, reverse=True)[:3]) / total if total > 0 else 0.0,
+            'herfindahl': sum(s ** 2 for s in shares),
+            'countString': ', '.join(f"{str(d[label]).replace(',', ';')} ({d['count']})" for d in values)}
+
+
+def randomValues(rng:random.Random)-> list:
+    n = rng.randint(1, 12)
+    counts = sorted((rng.choice([0, 1, 5, 5, 40, 1000]) for i in range(n)), reverse=True)
+    return [{'id': f'client.{i}', 'title': f'Client {i}, Inc.' if i % 3 == 0 else f'Client {i}', 'count': c}
+                for i, c in enumerate(counts)]
+
+
+@pytest.mark.parametrize('useID', [False, True])
+def test_vectorized_statistics(useID):
+    rng = random.Random(42)
+    facetList = ['clients', 'registered', 'states']
+    facetValues, numberOfRecords = [], []
+    for q in range(60):
+        values = {f: randomValues(rng) for f in facetList if rng.random() < 0.8}
+        facetValues.append(values)
+        numberOfRecords.append(max([sum(d['count'] for d in l) for l in values.values()] + [1]) + rng.randint(0, 50))
+    items = [('Dataset', str(q)) for q in range(60)]
+
+    rows = createFacetsDictionaries(facetList, items, '20260101_06', numberOfRecords, facetValues, useID)
+
+    assert len(rows) == len(items)
+    for row, item, values, records in zip(rows, items, facetValues, numberOfRecords):
+        assert (row['parameter 1'], row['parameter 2'], row['NumberOfRecords']) == item + (records,)
+        for f in facetList:
+            if f not in values:
+                assert not any(k.startswith(f) for k in row)
+                continue
+            expected = scalarStatistics(values[f], records, useID)
+            for statistic in facetStatisticNames:
+                assert row[f + '_' + statistic] == pytest.approx(expected[statistic], abs=1e-12), (f, statistic)
+            assert row[f] == expected['countString']
+
+
+@pytest.mark.parametrize('counts, gini, entropy, top3, herfindahl', [
+    ([5, 3, 2], 0.2, -(0.5 * math.log(0.5) + 0.3 * math.log(0.3) + 0.2 * math.log(0.2)) / math.log(3), 1.0, 0.38),
+    ([4, 4, 4, 4], 0.0, 1.0, 0.75, 0.25),
+    ([7], 0.0, 0.0, 1.0, 1.0),
+    ([9, 1, 0, 0], 0.7, -(0.9 * math.log(0.9) + 0.1 * math.log(0.1)) / math.log(4), 1.0, 0.82)])
+def test_concentration(counts, gini, entropy, top3, herfindahl):
+    item_json = {'meta': {'clients': [{'id': f'c.{i}', 'title': f'C {i}', 'count': c} for i, c in enumerate(counts)]}}
+    row = createFacetsDictionary(['clients'], ('Dataset',), '20260101_06', 20, item_json)
+    assert row['clients_gini'] == pytest.approx(gini)
+    assert row['clients_entropy'] == pytest.approx(entropy)
+    assert row['clients_top3'] == pytest.approx(top3)
+    assert row['clients_herfindahl'] == pytest.approx(herfindahl)
+    assert row['clients_HI'] == pytest.approx(max(counts) / 20)
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from dataCiteFacets.sinks import createDatabaseTables
+from dataCiteFacets.trends import importLegacySnapshots, updateTrends, trendSummary, writeTrendDeltas
+
+dateTimes = [f'202601{d:02d}_06' for d in range(1, 21)]
+
+
+def snapshotValues(i:int)-> dict:
+    '''
+        Statistics of the i-th snapshot: a series growing by 10 that jumps at snapshot 15, a series that
+        starts at snapshot 5 and a series that is missing in every third snapshot
+    '''
+    values = {(json.dumps(['Dataset']), 'NumberOfRecords'): 1000 + 10 * i + (500 if i >= 15 else 0),
+              (json.dumps(['Dataset']), 'clients_HI'): 0.5 + 0.01 * (i % 4)}
+    if i >= 5:
+        values[(json.dumps(['Software']), 'NumberOfRecords')] = 200 + 3 * i
+    if i % 3 != 0:
+        values[(json.dumps(['Software', 'IsCitedBy']), 'clients_coverage')] = 100 - i
+    return values
+
+
+def addRun(con, runId:str, dateTime:str, values:dict):
+    cur = con.cursor()
+    createDatabaseTables(cur)
+    cur.executemany('INSERT INTO snapshot_statistics (run_id, parameters, statistic, value) VALUES (?,?,?,?)',
+                    [(runId, p, s, v) for (p, s), v in values.items()])
+    cur.execute('INSERT INTO snapshot_runs (run_id, DateTime) VALUES (?,?)', (runId, dateTime))
+    con.commit()
+
+
+def trendTables(con)-> tuple:
+    series = pd.read_sql_query('SELECT * FROM trend_series ORDER BY parameters, statistic', con)
+    deltas = pd.read_sql_query('SELECT * FROM trend_deltas ORDER BY DateTime, parameters, statistic', con)
+    return (series, deltas)
+
+
+def test_incremental_trends(tmp_path):
+    incremental = sqlite3.connect(str(tmp_path / 'incremental.db'))
+    for i, dateTime in enumerate(dateTimes):
+        addRun(incremental, f'RUN{i:02d}', dateTime, snapshotValues(i))
+        assert updateTrends(incremental) == 1
+    assert updateTrends(incremental) == 0
+
+    rebuilt = sqlite3.connect(str(tmp_path / 'rebuilt.db'))
+    for i in [3, 0, 1, 2] + list(range(4, len(dateTimes))):
+        addRun(rebuilt, f'RUN{i:02d}', dateTimes[i], snapshotValues(i))
+        updateTrends(rebuilt)                           # RUN00 is older than the trends and recomputes them
+
+    for a, b in zip(trendTables(incremental), trendTables(rebuilt)):
+        pd.testing.assert_frame_equal(a, b)
+
+    summary = trendSummary(incremental).set_index(['parameters', 'statistic'])
+    records = summary.loc[('Dataset', 'NumberOfRecords')]
+    assert (records['first'], records['last'], records['snapshots']) == (1000, 1690, 20)
+    assert records['changePoints'] == 1
+    assert records['lastChangePoint'] == pd.Timestamp('2026-01-16 06:00')
+    assert summary.loc[('Software', 'NumberOfRecords'), 'snapshots'] == 15
+    assert summary.loc[('Software, IsCitedBy', 'clients_coverage'), 'snapshots'] == 13
+
+    outputFile = tmp_path / 'deltas.csv'
+    assert writeTrendDeltas(incremental, str(outputFile), chunkRows=7) == 20 + 20 + 15 + 13
+    deltas = pd.read_csv(outputFile)
+    assert list(deltas.columns) == ['DateTime', 'parameters', 'statistic', 'value', 'delta', 'pctChange', 'changePoint']
+    coverage = deltas[deltas['statistic'] == 'clients_coverage']['delta']
+    assert coverage.isna().sum() == 1 and (coverage.dropna().isin([-1, -2])).all()     # missing snapshots are skipped
+
+    facets = writeTrendDeltas(incremental, str(outputFile), facetList=['registered'])
+    assert facets == 20 + 15                            # only NumberOfRecords
+
+
+def test_legacy_snapshots(tmp_path):
+    con = sqlite3.connect(str(tmp_path / 'legacy.db'))
+    legacy = pd.DataFrame({'parameter 0': ['Dataset', 'Software', 'Dataset'],
+                           'parameter 1': [None, 'IsCitedBy', None],
+                           'DateTime': ['20250101_06', '20250101_06', '20250201_06'],
+                           'NumberOfRecords': ['1000', '200', '1100'],
+                           'clients_HI': [0.5, 'n/a', 0.6],
+                           'clients_Count': [10, 3, 11]})
+    legacy.to_sql('relationsAndResources', con, index=False)
+    addRun(con, 'RUN00', dateTimes[0], snapshotValues(0))
+    updateTrends(con)
+
+    assert importLegacySnapshots(con) == 2
+    assert importLegacySnapshots(con) == 0
+    assert updateTrends(con) == 3                       # the legacy snapshots are older and recompute the trends
+
+    summary = trendSummary(con).set_index(['parameters', 'statistic'])
+    records = summary.loc[('Dataset', 'NumberOfRecords')]
+    assert (records['first'], records['last'], records['snapshots']) == (1000, 1000, 3)
+    assert records['firstDate'] == pd.Timestamp('2025-01-01 06:00')
+    assert summary.loc[('Software, IsCitedBy', 'NumberOfRecords'), 'last'] == 200
+    assert ('Software, IsCitedBy', 'clients_HI') not in summary.index
+    assert not any(s.endswith('_Count') for s in summary.index.get_level_values('statistic'))
+    assert summary.loc[('Dataset', 'clients_HI'), 'first'] == pytest.approx(0.5)
+    assert con.execute('SELECT COUNT(*) FROM trend_runs').fetchone()[0] == 3